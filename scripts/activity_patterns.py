@@ -0,0 +1,144 @@
+"""
+Activity patterns for synthetic popular times.
+
+One table of weekday/weekend busyness curves per POI type, shared by
+generate_all_heatmaps and scrape_popular_times. It is compiled once into
+a dense (types, weekday/weekend, shift, 24) float32 array holding every
+hour-shift rotation, so generators gather a POI's curves by index.
+
+Extra or overriding types can be added in data/activity_patterns.json:
+    {"nightlife": {"weekday": [24 values], "weekend": [24 values]}, ...}
+Unknown types fall back to 'default' (or to a type the caller names).
+"""
+
+import json
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
+EXTRA_PATTERNS_FILE = Path(__file__).parent / 'data' / 'activity_patterns.json'
+
+# Peak-hour shifts applied per POI (hours, pattern rotated left by the shift)
+SHIFTS = (-2, -1, 0, 1, 2)
+
+FALLBACK_TYPE = 'default'
+
+# Base patterns by day of week (Mon=0, Sun=6)
+# Values are relative popularity (0-100)
+BUILTIN_PATTERNS = {
+    'restaurant': {
+        'weekday': [0, 0, 0, 0, 0, 0, 10, 15, 20, 15, 10, 20, 60, 70, 40, 20, 30, 50, 80, 100, 90, 70, 40, 10],
+        'weekend': [0, 0, 0, 0, 0, 0, 5, 10, 20, 30, 50, 70, 90, 100, 80, 60, 50, 60, 80, 100, 90, 70, 40, 10]
+    },
+    'cafe': {
+        'weekday': [0, 0, 0, 0, 0, 5, 20, 50, 80, 100, 90, 70, 80, 70, 60, 50, 60, 70, 60, 40, 20, 10, 5, 0],
+        'weekend': [0, 0, 0, 0, 0, 0, 5, 10, 30, 60, 80, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0, 0]
+    },
+    'gym': {
+        'weekday': [0, 0, 0, 0, 0, 5, 30, 70, 90, 60, 40, 50, 70, 50, 40, 50, 70, 100, 90, 80, 60, 30, 10, 0],
+        'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 50, 80, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0, 0, 0]
+    },
+    'shopping_mall': {
+        'weekday': [0, 0, 0, 0, 0, 0, 0, 5, 10, 30, 50, 60, 70, 60, 50, 60, 80, 100, 90, 80, 70, 50, 20, 5],
+        'weekend': [0, 0, 0, 0, 0, 0, 0, 5, 10, 40, 70, 90, 100, 100, 90, 80, 90, 100, 90, 70, 50, 30, 10, 0]
+    },
+    'supermarket': {
+        'weekday': [0, 0, 0, 0, 0, 0, 5, 20, 50, 70, 60, 50, 60, 50, 40, 50, 70, 100, 80, 60, 40, 20, 10, 5],
+        'weekend': [0, 0, 0, 0, 0, 0, 5, 10, 30, 60, 80, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0, 0]
+    },
+    'transit_station': {
+        'weekday': [5, 0, 0, 0, 0, 10, 40, 90, 100, 70, 40, 30, 40, 40, 30, 40, 60, 100, 90, 60, 30, 20, 10, 5],
+        'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 40, 60, 70, 80, 80, 70, 60, 50, 50, 60, 50, 40, 30, 20, 10, 5]
+    },
+    'office': {
+        'weekday': [0, 0, 0, 0, 0, 0, 10, 50, 90, 100, 100, 90, 70, 80, 100, 100, 90, 70, 30, 10, 5, 0, 0, 0],
+        'weekend': [0, 0, 0, 0, 0, 0, 0, 0, 5, 10, 15, 15, 10, 10, 10, 5, 0, 0, 0, 0, 0, 0, 0, 0]
+    },
+    'bar': {
+        'weekday': [5, 0, 0, 0, 0, 0, 0, 0, 0, 0, 5, 10, 20, 20, 15, 20, 30, 50, 70, 90, 100, 100, 80, 30],
+        'weekend': [10, 5, 0, 0, 0, 0, 0, 0, 0, 5, 10, 20, 30, 30, 25, 30, 40, 60, 80, 100, 100, 100, 90, 50]
+    },
+    'nightclub': {
+        'weekday': [20, 10, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 10, 30, 50, 70, 90, 100, 80],
+        'weekend': [50, 30, 10, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 10, 30, 50, 80, 100, 100, 100, 90]
+    },
+    'pharmacy': {
+        'weekday': [0, 0, 0, 0, 0, 0, 5, 30, 70, 100, 90, 70, 80, 70, 60, 70, 80, 90, 60, 30, 10, 5, 0, 0],
+        'weekend': [0, 0, 0, 0, 0, 0, 0, 10, 30, 60, 80, 100, 90, 70, 50, 40, 30, 20, 10, 5, 0, 0, 0, 0]
+    },
+    'bank': {
+        'weekday': [0, 0, 0, 0, 0, 0, 0, 20, 60, 100, 90, 80, 90, 100, 80, 70, 60, 50, 20, 5, 0, 0, 0, 0],
+        'weekend': [0, 0, 0, 0, 0, 0, 0, 0, 10, 30, 50, 60, 50, 30, 20, 10, 5, 0, 0, 0, 0, 0, 0, 0]
+    },
+    'park': {
+        'weekday': [0, 0, 0, 0, 0, 5, 20, 40, 50, 40, 30, 40, 50, 40, 30, 40, 60, 80, 100, 80, 50, 30, 10, 0],
+        'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 40, 60, 80, 100, 100, 100, 90, 80, 70, 60, 50, 40, 20, 10, 5, 0]
+    },
+    'museum': {
+        'weekday': [0, 0, 0, 0, 0, 0, 0, 0, 10, 40, 70, 90, 100, 90, 80, 70, 60, 40, 20, 5, 0, 0, 0, 0],
+        'weekend': [0, 0, 0, 0, 0, 0, 0, 5, 20, 50, 80, 100, 100, 100, 90, 80, 60, 40, 20, 10, 5, 0, 0, 0]
+    },
+    'default': {
+        'weekday': [0, 0, 0, 0, 0, 0, 10, 30, 50, 60, 70, 70, 80, 70, 60, 70, 80, 90, 100, 80, 50, 30, 10, 0],
+        'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 40, 60, 80, 90, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0]
+    }
+}
+
+
+def validate_pattern(poi_type: str, pattern: dict):
+    for key in ('weekday', 'weekend'):
+        values = pattern.get(key)
+        if not isinstance(values, list) or len(values) != 24:
+            raise ValueError(f"Activity pattern {poi_type!r}: {key!r} must have 24 values")
+        if not all(isinstance(v, (int, float)) and 0 <= v <= 100 for v in values):
+            raise ValueError(f"Activity pattern {poi_type!r}: {key!r} values must be within 0..100")
+
+
+class ActivityPatterns:
+    """Compiled pattern table: type codes and all shift rotations."""
+
+    def __init__(self, patterns: dict):
+        if FALLBACK_TYPE not in patterns:
+            raise ValueError(f"Activity patterns need a {FALLBACK_TYPE!r} type")
+        for poi_type, pattern in patterns.items():
+            validate_pattern(poi_type, pattern)
+
+        self.types = list(patterns)
+        self._codes = {poi_type: i for i, poi_type in enumerate(self.types)}
+        self.fallback = self._codes[FALLBACK_TYPE]
+
+        base = np.array([[patterns[t]['weekday'], patterns[t]['weekend']] for t in self.types],
+                        dtype=np.float32)
+        # table[type, weekend, shift_index, hour] == pattern[(hour + shift) % 24]
+        hours = np.arange(24)
+        columns = (hours[None, :] + np.array(SHIFTS)[:, None]) % 24
+        self.table = np.ascontiguousarray(base[:, :, columns])
+
+    def code(self, poi_type: str) -> int:
+        return self._codes.get(poi_type, self.fallback)
+
+    def codes(self, poi_types, fallback: str = FALLBACK_TYPE) -> np.ndarray:
+        """Type codes for a sequence of POI types (unknown types -> the `fallback` type)."""
+        fallback = self._codes[fallback]
+        return np.fromiter((self._codes.get(t, fallback) for t in poi_types), dtype=np.intp)
+
+    def curves(self, codes: np.ndarray, shift_index: np.ndarray) -> np.ndarray:
+        """(N, 2, 24) weekday/weekend curves for type codes and indexes into SHIFTS."""
+        return self.table[codes, :, shift_index, :]
+
+
+def load_patterns(path: Path = EXTRA_PATTERNS_FILE) -> ActivityPatterns:
+    """Built-in patterns plus (overriding) extra types from `path`, if it exists."""
+    patterns = dict(BUILTIN_PATTERNS)
+    if Path(path).exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            patterns.update(json.load(f))
+    return ActivityPatterns(patterns)
+
+
+# Compiled once per process
+PATTERNS = load_patterns()
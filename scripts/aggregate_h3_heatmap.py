@@ -2,24 +2,44 @@
 """
 Aggregate POI popular times data by H3 hexagons.
 
-Creates a JSON file suitable for the heatmap visualization in map-circle-viewer.
+Creates a JSON file suitable for the heatmap visualization in map-circle-viewer,
+plus the flat per-(hexagon, day, hour) points as newline-delimited JSON.
+Both are streamed hexagon by hexagon from the dense aggregate, so memory
+does not grow with the number of points.
+
+Usage:
+    python aggregate_h3_heatmap.py [--workers 8] [--quantiles]
 """
 
+import argparse
 import json
+import os
 from datetime import datetime
 from pathlib import Path
-from collections import defaultdict
 import h3
 
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
+from hex_aggregate import DenseAggregate, aggregate_pois_parallel
+from popular_times import CHUNK_SIZE, generate_synthetic_batch
+
 # Paths
 SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / 'data'
 INPUT_FILE = DATA_DIR / 'kyiv_popular_times.json'
 OUTPUT_FILE = DATA_DIR / 'kyiv_heatmap_h3.json'
+POINTS_FILE = DATA_DIR / 'kyiv_heatmap_points.ndjson'
 
 # H3 resolution (8 = ~460m diameter hexagon)
 H3_RESOLUTION = 8
 
+# Hexagons whose per-type averages are computed at once while streaming
+HEX_BLOCK = 1024
+
 # Day names for reference
 DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
@@ -43,11 +63,62 @@ def h3_to_geo(h3_index: str) -> tuple:
     return h3.cell_to_latlng(h3_index)
 
 
-def aggregate_by_h3(pois: list) -> dict:
+def iter_popular_times(pois: list):
+    """
+    Yield the POIs' popular times chunk by chunk as (grids, present) arrays.
+
+    Scraped values are used as is; missing (day, hour) values are masked
+    out by `present`. POIs written without values (scraper run with
+    --defer-synthetic) get synthetic ones generated here, one chunk at a
+    time, so they are never all held in memory.
+    """
+    for start in range(0, len(pois), CHUNK_SIZE):
+        chunk = pois[start:start + CHUNK_SIZE]
+        grids = np.full((len(chunk), 7, 24), np.nan, dtype=np.float32)
+
+        missing = [i for i, poi in enumerate(chunk) if not poi.get('populartimes')]
+        if missing:
+            grids[missing] = generate_synthetic([chunk[i] for i in missing])
+
+        for i, poi in enumerate(chunk):
+            for day_idx, day_data in enumerate((poi.get('populartimes') or [])[:7]):
+                hourly = day_data.get('data', [])[:24]
+                grids[i, day_idx, :len(hourly)] = hourly
+
+        present = ~np.isnan(grids)
+        yield np.where(present, grids, 0), present
+
+
+def generate_synthetic(pois: list) -> np.ndarray:
+    """Synthetic popular times of POIs the scraper left without values."""
+    return generate_synthetic_batch(pois)
+
+
+def aggregate_dense(pois: list, workers: int = 1, quantiles: bool = False) -> DenseAggregate:
+    """Aggregate POI popular times into dense per-(hex, type) sums (on `workers` processes)."""
+    return aggregate_pois_parallel(pois, iter_popular_times, H3_RESOLUTION, workers, quantiles)
+
+
+def aggregate_by_h3(pois: list, workers: int = 1, quantiles: bool = False) -> dict:
     """
     Aggregate POI data by H3 hexagon.
 
-    Returns a structure:
+    With workers > 1 the POIs are split into shards aggregated in
+    parallel processes; the result is identical. With quantiles each
+    hexagon also gets 'median' and 'p90' hours (same layout as 'hours'),
+    interpolated from fixed-bin histograms.
+
+    Returns {h3_index: hexagon} as yielded by iter_hexagons().
+    """
+    return dict(iter_hexagons(aggregate_dense(pois, workers, quantiles)))
+
+
+def iter_hexagons(aggregate: DenseAggregate):
+    """
+    Yield (h3_index, hexagon) for every hexagon of the aggregate.
+
+    Averages are computed HEX_BLOCK hexagons at a time, so only one
+    block's worth of nested dicts exists at once. Hexagon structure:
     {
         h3_index: {
             'lat': center_lat,
@@ -72,87 +143,49 @@ def aggregate_by_h3(pois: list) -> dict:
         }
     }
     """
-    hexagons = defaultdict(lambda: {
-        'poi_count': 0,
-        'poi_types': set(),
-        'by_type': defaultdict(lambda: {
-            'count': 0,
-            'hours': defaultdict(lambda: defaultdict(list))
-        }),
-        'hours': defaultdict(lambda: defaultdict(list))
-    })
-
-    for poi in pois:
-        try:
-            h3_index = get_h3_index(poi['lat'], poi['lng'])
-        except Exception as e:
-            print(f"Error converting {poi['name']}: {e}")
-            continue
-
-        poi_type = poi['poi_type']
-        pop_times = poi.get('populartimes', [])
-
-        hex_data = hexagons[h3_index]
-        hex_data['poi_count'] += 1
-        hex_data['poi_types'].add(poi_type)
-
-        # Aggregate by type
-        type_data = hex_data['by_type'][poi_type]
-        type_data['count'] += 1
-
-        # Process popular times
-        for day_idx, day_data in enumerate(pop_times):
-            hourly = day_data.get('data', [])
-            for hour, value in enumerate(hourly[:24]):
-                # By type
-                type_data['hours'][day_idx][hour].append(value)
-                # All types combined
-                hex_data['hours'][day_idx][hour].append(value)
-
-    # Convert to final format
-    result = {}
-    for h3_index, hex_data in hexagons.items():
-        center = h3_to_geo(h3_index)
-
-        # Calculate averages
-        hours_avg = {}
-        for day_idx in range(7):
-            hours_avg[day_idx] = {}
-            for hour in range(24):
-                values = hex_data['hours'][day_idx][hour]
-                hours_avg[day_idx][hour] = sum(values) / len(values) if values else 0
-
-        by_type_avg = {}
-        for poi_type, type_data in hex_data['by_type'].items():
-            type_hours = {}
-            for day_idx in range(7):
-                type_hours[day_idx] = {}
-                for hour in range(24):
-                    values = type_data['hours'][day_idx][hour]
-                    type_hours[day_idx][hour] = sum(values) / len(values) if values else 0
-
-            by_type_avg[poi_type] = {
-                'count': type_data['count'],
-                'hours': type_hours
+    for start in range(0, len(aggregate), HEX_BLOCK):
+        block = aggregate.block(start, start + HEX_BLOCK)
+        quantiles = block.hist is not None
+        centers = block.centers().tolist()
+        hours = block.hour_means().tolist()
+        if quantiles:
+            medians = block.quantile(0.5).tolist()
+            p90s = block.quantile(0.9).tolist()
+        type_hours = block.type_means().tolist()
+
+        for row, h3_index in enumerate(block.cell_ids()):
+            by_type = {}
+            for col in np.flatnonzero(block.type_count[row]).tolist():
+                by_type[block.types[col]] = {
+                    'count': int(block.type_count[row, col]),
+                    'hours': hours_dict(type_hours[row][col])
+                }
+
+            hexagon = {
+                'lat': centers[row][0],
+                'lng': centers[row][1],
+                'poi_count': sum(entry['count'] for entry in by_type.values()),
+                'poi_types': list(by_type),
+                'by_type': by_type,
+                'hours': hours_dict(hours[row])
             }
+            if quantiles:
+                hexagon['median'] = hours_dict(medians[row])
+                hexagon['p90'] = hours_dict(p90s[row])
+            yield h3_index, hexagon
 
-        result[h3_index] = {
-            'lat': center[0],
-            'lng': center[1],
-            'poi_count': hex_data['poi_count'],
-            'poi_types': list(hex_data['poi_types']),
-            'by_type': by_type_avg,
-            'hours': hours_avg
-        }
 
-    return result
+def hours_dict(grid: list) -> dict:
+    """(7, 24) nested list as {day: {hour: value}}."""
+    return {day_idx: dict(enumerate(day_hours)) for day_idx, day_hours in enumerate(grid)}
 
 
-def create_heatmap_points(hexagons: dict) -> list:
+def create_heatmap_points(hexagons: dict):
     """
     Create simple heatmap points for each hour/day combination.
 
-    Returns a flat structure that's easy to filter in frontend:
+    A generator (points are produced one hexagon at a time) of a flat
+    structure that's easy to filter in frontend:
     [
         {
             'h3': 'hex_id',
@@ -167,35 +200,63 @@ def create_heatmap_points(hexagons: dict) -> list:
         ...
     ]
     """
-    points = []
-
     for h3_index, hex_data in hexagons.items():
-        for day in range(7):
-            for hour in range(24):
-                # Get intensity for all types
-                intensity = hex_data['hours'][day][hour]
-
-                # Get intensity by type
-                by_type = {}
-                for poi_type, type_data in hex_data['by_type'].items():
-                    by_type[poi_type] = type_data['hours'][day][hour]
-
-                points.append({
-                    'h3': h3_index,
-                    'lat': hex_data['lat'],
-                    'lng': hex_data['lng'],
-                    'day': day,
-                    'hour': hour,
-                    'intensity': round(intensity, 1),
-                    'poi_count': hex_data['poi_count'],
-                    'poi_types': hex_data['poi_types'],
-                    'by_type': {k: round(v, 1) for k, v in by_type.items()}
-                })
-
-    return points
+        yield from hexagon_points(h3_index, hex_data)
+
+
+def hexagon_points(h3_index: str, hex_data: dict):
+    """Yield the 7 x 24 heatmap points of one hexagon (see create_heatmap_points)."""
+    for day in range(7):
+        for hour in range(24):
+            # Get intensity for all types
+            intensity = hex_data['hours'][day][hour]
+
+            # Get intensity by type
+            by_type = {}
+            for poi_type, type_data in hex_data['by_type'].items():
+                by_type[poi_type] = type_data['hours'][day][hour]
+
+            yield {
+                'h3': h3_index,
+                'lat': hex_data['lat'],
+                'lng': hex_data['lng'],
+                'day': day,
+                'hour': hour,
+                'intensity': round(intensity, 1),
+                'poi_count': hex_data['poi_count'],
+                'poi_types': hex_data['poi_types'],
+                'by_type': {k: round(v, 1) for k, v in by_type.items()}
+            }
+
+
+def write_streaming(aggregate: DenseAggregate, metadata: dict) -> dict:
+    """
+    Stream the hexagons to OUTPUT_FILE and their points to POINTS_FILE (NDJSON).
+
+    OUTPUT_FILE keeps the {'metadata', 'hexagons'} layout; each hexagon is
+    serialized and written as soon as it is built. Returns the first hexagon.
+    """
+    sample = None
+    with open(OUTPUT_FILE, 'w', encoding='utf-8') as out, open(POINTS_FILE, 'w', encoding='utf-8') as points:
+        out.write('{"metadata": ' + json.dumps(metadata, ensure_ascii=False) + ', "hexagons": {')
+        for idx, (h3_index, hexagon) in enumerate(iter_hexagons(aggregate)):
+            if sample is None:
+                sample = (h3_index, hexagon)
+            out.write((', ' if idx else '') + json.dumps(h3_index) + ': ' + json.dumps(hexagon, ensure_ascii=False))
+            for point in hexagon_points(h3_index, hexagon):
+                points.write(json.dumps(point, ensure_ascii=False) + '\n')
+        out.write('}}')
+    return sample
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Aggregate POI popular times by H3 hexagons')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processes for the aggregation (1 = single process)')
+    parser.add_argument('--quantiles', action='store_true',
+                        help='Also compute median and p90 intensities per hexagon')
+    args = parser.parse_args()
+
     print("=" * 60)
     print("H3 Heatmap Aggregator")
     print("=" * 60)
@@ -214,49 +275,46 @@ def main():
 
     # Aggregate by H3
     print("Aggregating by H3 hexagons...")
-    hexagons = aggregate_by_h3(pois)
-    print(f"  Created {len(hexagons)} hexagons")
-
-    # Create heatmap points
-    print("Creating heatmap points...")
-    points = create_heatmap_points(hexagons)
-    print(f"  Created {len(points)} points (7 days × 24 hours × {len(hexagons)} hexagons)")
-
-    # Save output
-    output = {
-        'metadata': {
-            'created_at': datetime.now().isoformat(),
-            'h3_resolution': H3_RESOLUTION,
-            'hexagon_count': len(hexagons),
-            'point_count': len(points),
-            'poi_count': len(pois),
-            'days': DAY_NAMES
-        },
-        'hexagons': hexagons,
-        'points': points
+    aggregate = aggregate_dense(pois, args.workers, args.quantiles)
+    hex_count = len(aggregate)
+    point_count = hex_count * 7 * 24
+    print(f"  Created {hex_count} hexagons")
+
+    # Save output: hexagons and points are built and written one hexagon at a time
+    metadata = {
+        'created_at': datetime.now().isoformat(),
+        'h3_resolution': H3_RESOLUTION,
+        'hexagon_count': hex_count,
+        'point_count': point_count,
+        'points_file': POINTS_FILE.name,
+        'poi_count': len(pois),
+        'days': DAY_NAMES
     }
 
-    print(f"Saving to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False)
+    print(f"Saving to {OUTPUT_FILE} and {POINTS_FILE}...")
+    sample = write_streaming(aggregate, metadata)
+    print(f"  Created {point_count} points (7 days × 24 hours × {hex_count} hexagons)")
 
     # Size info
     file_size = OUTPUT_FILE.stat().st_size / 1024 / 1024
-    print(f"  File size: {file_size:.2f} MB")
+    points_size = POINTS_FILE.stat().st_size / 1024 / 1024
+    print(f"  File size: {file_size:.2f} MB (+ {points_size:.2f} MB of points)")
 
     print()
     print("=" * 60)
     print("Summary:")
     print("=" * 60)
-    print(f"  Hexagons: {len(hexagons)}")
-    print(f"  Points: {len(points):,}")
-    print(f"  Output: {OUTPUT_FILE}")
+    print(f"  Hexagons: {hex_count}")
+    print(f"  Points: {point_count:,}")
+    print(f"  Output: {OUTPUT_FILE}, {POINTS_FILE}")
+
+    if sample is None:
+        return
 
     # Print sample hexagon
     print()
     print("Sample hexagon:")
-    sample_hex = list(hexagons.keys())[0]
-    sample = hexagons[sample_hex]
+    sample_hex, sample = sample
     print(f"  H3: {sample_hex}")
     print(f"  Location: ({sample['lat']:.4f}, {sample['lng']:.4f})")
     print(f"  POI count: {sample['poi_count']}")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark Overpass response parsing: full json.loads vs streaming.
+
+Compares the old path (read the whole body, json.loads, walk the dicts)
+with overpass_stream.iter_elements on the same recorded response. Each
+mode runs in a fresh subprocess so peak RSS is measured independently.
+
+Usage:
+    python bench_overpass_parse.py data/cache/overpass/<key>.gz
+    python bench_overpass_parse.py --generate 2000000   # synthetic response
+    python bench_overpass_parse.py <response> --keep-pois
+"""
+
+import argparse
+import gzip
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from collect_kyiv_pois import POI_TAG_INDEX, element_to_poi
+from overpass import classify_tags
+from overpass_stream import iter_elements, iter_file_chunks
+
+SCRIPT_DIR = Path(__file__).parent
+DEFAULT_SAMPLE = SCRIPT_DIR / 'data' / 'cache' / 'bench_overpass_sample.json.gz'
+
+
+def open_response(path: Path):
+    """Open a recorded response (plain JSON or gzip, e.g. a cache entry)."""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    return gzip.open(path, 'rb') if magic == b'\x1f\x8b' else open(path, 'rb')
+
+
+def generate_sample(path: Path, count: int):
+    """Write a synthetic Overpass response with `count` office nodes and ways."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(42)
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write('{"version":0.6,"generator":"Overpass API","osm3s":{},"elements":[\n')
+        for i in range(count):
+            lat = 50.21 + rng.random() * 0.38
+            lng = 30.23 + rng.random() * 0.60
+            tags = {
+                'office': rng.choice(['company', 'it', 'government', 'lawyer']),
+                'name': f"Офіс {i}",
+                'addr:street': 'вулиця Хрещатик',
+                'addr:housenumber': str(rng.randint(1, 200)),
+            }
+            if i % 3:
+                el = {'type': 'node', 'id': i, 'lat': lat, 'lon': lng, 'tags': tags}
+            else:
+                el = {'type': 'way', 'id': i, 'center': {'lat': lat, 'lon': lng},
+                      'nodes': list(range(i, i + 8)), 'tags': tags}
+            f.write(('' if i == 0 else ',\n') + json.dumps(el, ensure_ascii=False))
+        f.write('\n]}\n')
+
+
+def normalize(elements, keep_pois: bool = False) -> int:
+    """
+    Run elements through the POI normalizer; returns the POI count.
+
+    POIs are dropped after normalizing unless keep_pois is set, so the RSS
+    numbers show the cost of parsing rather than of the POI list itself.
+    """
+    pois = []
+    count = 0
+    for element in elements:
+        poi_type = classify_tags(element.get('tags', {}), POI_TAG_INDEX)
+        if poi_type is None:
+            continue
+        poi = element_to_poi(element, poi_type)
+        if poi:
+            count += 1
+            if keep_pois:
+                pois.append(poi)
+    return count
+
+
+def run_mode(mode: str, path: Path, keep_pois: bool):
+    """Parse `path` with one mode and print a JSON result line."""
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+
+    with open_response(path) as f:
+        if mode == 'full':
+            data = json.loads(f.read())
+            count = normalize(data.get('elements', []), keep_pois)
+        else:
+            count = normalize(iter_elements(iter_file_chunks(f)), keep_pois)
+
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    print(json.dumps({
+        'mode': mode,
+        'pois': count,
+        'seconds': elapsed,
+        'peak_rss_mb': peak_rss * scale / 1024 / 1024,
+        'parse_rss_mb': (peak_rss - base_rss) * scale / 1024 / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Overpass response parsing')
+    parser.add_argument('response', nargs='?', type=Path, help='Recorded Overpass response (.json or .gz)')
+    parser.add_argument('--generate', type=int, default=0,
+                        help='Generate a synthetic response with this many elements')
+    parser.add_argument('--keep-pois', action='store_true',
+                        help='Keep normalized POIs in memory (as the collectors do)')
+    parser.add_argument('--mode', choices=['full', 'stream'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.response, args.keep_pois)
+        return
+
+    path = args.response
+    if args.generate:
+        path = path or DEFAULT_SAMPLE
+        print(f"Generating {args.generate:,} elements -> {path}")
+        generate_sample(path, args.generate)
+    if path is None:
+        parser.error('a response file or --generate is required')
+
+    with open_response(path) as f:
+        raw_size = sum(len(chunk) for chunk in iter_file_chunks(f))
+
+    print("=" * 60)
+    print("Overpass Parse Benchmark")
+    print("=" * 60)
+    print(f"Response: {path} ({raw_size / 1024 / 1024:.1f} MB uncompressed)")
+    print()
+
+    results = {}
+    for mode in ('full', 'stream'):
+        cmd = [sys.executable, __file__, str(path.resolve()), '--mode', mode]
+        if args.keep_pois:
+            cmd.append('--keep-pois')
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=SCRIPT_DIR)
+        results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"  {'mode':<8} {'POIs':>10} {'time':>8} {'MB/s':>8} {'peak RSS':>10} {'parse RSS':>10}")
+    for mode, r in results.items():
+        throughput = raw_size / 1024 / 1024 / r['seconds']
+        print(f"  {mode:<8} {r['pois']:>10,} {r['seconds']:>7.2f}s {throughput:>8.1f} "
+              f"{r['peak_rss_mb']:>8.1f}MB {r['parse_rss_mb']:>8.1f}MB")
+
+    full, stream = results['full'], results['stream']
+    if full['pois'] != stream['pois']:
+        print("\nWARNING: POI counts differ between modes!")
+    if stream['parse_rss_mb'] > 0:
+        print(f"\n  Parse memory: {full['parse_rss_mb'] / stream['parse_rss_mb']:.1f}x less with streaming")
+
+
+if __name__ == '__main__':
+    main()
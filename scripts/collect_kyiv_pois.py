@@ -2,16 +2,24 @@
 """
 Collect POIs from Kyiv using Overpass API (OpenStreetMap)
 This script fetches all relevant POIs for popular times heatmap analysis.
+
+Usage:
+    python collect_kyiv_pois.py [--union] [--offline] [--from-store]
 """
 
 import json
-import requests
-import time
+import argparse
 from datetime import datetime
 from pathlib import Path
 
-# Overpass API endpoint
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+from http_client import HttpError, get_client, print_latency_report
+from overpass import (OVERPASS_URL, OverpassError, configure_cache, iter_query, compile_tag_index,
+                      classify_tags, build_union_query, element_coords)
+from poi_store import get_store
+from poi_dedup import DEFAULT_DISTANCE_M, dedup_pois
+
+# Minimum spacing between Overpass requests (seconds) - be nice to Overpass API
+REQUEST_INTERVAL = 2
 
 # Kyiv bounding box (approximate)
 KYIV_BBOX = {
@@ -90,6 +98,9 @@ POI_TYPES = {
     ],
 }
 
+# Tag -> POI type lookup for union queries (compiled once)
+POI_TAG_INDEX = compile_tag_index(POI_TYPES)
+
 
 def build_overpass_query(poi_type: str, tags: list) -> str:
     """Build Overpass QL query for given POI type."""
@@ -117,6 +128,27 @@ def build_overpass_query(poi_type: str, tags: list) -> str:
     return query
 
 
+def element_to_poi(element: dict, poi_type: str):
+    """Convert an Overpass element to a POI record (None if it has no coordinates)."""
+    # Get coordinates (center for ways, direct for nodes)
+    coords = element_coords(element)
+    if coords is None:
+        return None
+
+    tags = element.get('tags', {})
+    name = tags.get('name', tags.get('name:uk', tags.get('name:en', 'Unknown')))
+
+    return {
+        'osm_id': f"{element['type']}/{element['id']}",
+        'name': name,
+        'lat': coords[0],
+        'lng': coords[1],
+        'poi_type': poi_type,
+        'address': tags.get('addr:street', '') + ' ' + tags.get('addr:housenumber', ''),
+        'tags': {k: v for k, v in tags.items() if k.startswith('addr:') or k in ['name', 'website', 'phone', 'opening_hours']}
+    }
+
+
 def fetch_pois(poi_type: str, tags: list) -> list:
     """Fetch POIs from Overpass API."""
     query = build_overpass_query(poi_type, tags)
@@ -124,46 +156,88 @@ def fetch_pois(poi_type: str, tags: list) -> list:
     print(f"  Fetching {poi_type}...")
 
     try:
-        response = requests.post(
-            OVERPASS_URL,
-            data={"data": query},
-            timeout=180
-        )
-        response.raise_for_status()
-        data = response.json()
-
         pois = []
-        for element in data.get('elements', []):
-            # Get coordinates (center for ways, direct for nodes)
-            if element['type'] == 'node':
-                lat, lng = element['lat'], element['lon']
-            elif 'center' in element:
-                lat, lng = element['center']['lat'], element['center']['lon']
-            else:
-                continue
-
-            tags = element.get('tags', {})
-            name = tags.get('name', tags.get('name:uk', tags.get('name:en', 'Unknown')))
-
-            pois.append({
-                'osm_id': f"{element['type']}/{element['id']}",
-                'name': name,
-                'lat': lat,
-                'lng': lng,
-                'poi_type': poi_type,
-                'address': tags.get('addr:street', '') + ' ' + tags.get('addr:housenumber', ''),
-                'tags': {k: v for k, v in tags.items() if k.startswith('addr:') or k in ['name', 'website', 'phone', 'opening_hours']}
-            })
+        for element in get_store().upsert_iter(iter_query(query, timeout=180)):
+            poi = element_to_poi(element, poi_type)
+            if poi:
+                pois.append(poi)
 
         return pois
 
-    except requests.exceptions.RequestException as e:
+    except (OverpassError, HttpError) as e:
         print(f"    Error fetching {poi_type}: {e}")
         return []
 
 
+def fetch_pois_union() -> list:
+    """
+    Fetch all POI types with a single union query.
+
+    Each element is assigned the first POI type (in POI_TYPES order) whose
+    tags it matches, the same type the per-type loop keeps after dedup.
+    """
+    bbox = (KYIV_BBOX['south'], KYIV_BBOX['west'], KYIV_BBOX['north'], KYIV_BBOX['east'])
+    query = build_union_query(POI_TYPES, bbox, timeout=300)
+
+    print("  Fetching all POI types (union query)...")
+
+    pois = []
+    seen_ids = set()
+    try:
+        for element in get_store().upsert_iter(iter_query(query, timeout=420)):
+            osm_id = f"{element['type']}/{element['id']}"
+            if osm_id in seen_ids:
+                continue
+            seen_ids.add(osm_id)
+
+            poi_type = classify_tags(element.get('tags', {}), POI_TAG_INDEX)
+            if poi_type is None:
+                continue
+
+            poi = element_to_poi(element, poi_type)
+            if poi:
+                pois.append(poi)
+    except (OverpassError, HttpError) as e:
+        print(f"    Error fetching POIs: {e}")
+        return []
+
+    return pois
+
+
+def fetch_pois_from_store() -> list:
+    """Read all POI types from the local POI store instead of Overpass."""
+    bbox = (KYIV_BBOX['south'], KYIV_BBOX['west'], KYIV_BBOX['north'], KYIV_BBOX['east'])
+    tags = [tag for type_tags in POI_TYPES.values() for tag in type_tags]
+
+    print("  Reading all POI types from the POI store...")
+
+    pois = []
+    for element in get_store().query_elements(bbox=bbox, tags=tags):
+        poi_type = classify_tags(element.get('tags', {}), POI_TAG_INDEX)
+        if poi_type is None:
+            continue
+        poi = element_to_poi(element, poi_type)
+        if poi:
+            pois.append(poi)
+    return pois
+
+
 def main():
     """Main function to collect all POIs."""
+    parser = argparse.ArgumentParser(description='Collect Kyiv POIs from Overpass API')
+    parser.add_argument('--union', action='store_true',
+                        help='Fetch all POI types with one union query instead of one per type')
+    parser.add_argument('--offline', action='store_true',
+                        help='Serve Overpass responses only from the local cache')
+    parser.add_argument('--dedup-distance', type=float, default=DEFAULT_DISTANCE_M,
+                        help='Merge similarly named POIs closer than this many meters (0 = off)')
+    parser.add_argument('--from-store', action='store_true',
+                        help='Read POIs from the local POI store instead of querying Overpass')
+    args = parser.parse_args()
+
+    configure_cache(offline=args.offline)
+    get_client().set_min_interval(OVERPASS_URL, REQUEST_INTERVAL)
+
     print("=" * 60)
     print("Kyiv POI Collector - Overpass API")
     print("=" * 60)
@@ -174,14 +248,17 @@ def main():
     all_pois = []
     stats = {}
 
-    for poi_type, tags in POI_TYPES.items():
-        pois = fetch_pois(poi_type, tags)
-        all_pois.extend(pois)
-        stats[poi_type] = len(pois)
-        print(f"    Found {len(pois)} {poi_type} POIs")
-
-        # Rate limiting - be nice to Overpass API
-        time.sleep(2)
+    if args.union or args.from_store:
+        all_pois = fetch_pois_from_store() if args.from_store else fetch_pois_union()
+        for poi_type in POI_TYPES:
+            stats[poi_type] = sum(1 for poi in all_pois if poi['poi_type'] == poi_type)
+            print(f"    Found {stats[poi_type]} {poi_type} POIs")
+    else:
+        for poi_type, tags in POI_TYPES.items():
+            pois = fetch_pois(poi_type, tags)
+            all_pois.extend(pois)
+            stats[poi_type] = len(pois)
+            print(f"    Found {len(pois)} {poi_type} POIs")
 
     # Remove duplicates by osm_id
     seen = set()
@@ -191,6 +268,9 @@ def main():
             seen.add(poi['osm_id'])
             unique_pois.append(poi)
 
+    # Merge the same place seen as node and way
+    if args.dedup_distance > 0:
+        unique_pois = dedup_pois(unique_pois, args.dedup_distance)
     print()
     print("=" * 60)
     print("Summary:")
@@ -220,6 +300,8 @@ def main():
     print()
     print(f"Saved to: {output_file}")
     print(f"Finished at: {datetime.now().isoformat()}")
+    print()
+    print_latency_report()
 
 
 if __name__ == '__main__':
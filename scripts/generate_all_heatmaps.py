@@ -3,24 +3,34 @@
 Generate heatmap data for all configured cities.
 
 This script runs the full pipeline for each city:
-1. Collect POIs from OpenStreetMap via Overpass API
+1. Collect POIs from OpenStreetMap via Overpass API (or a local .osm.pbf extract)
 2. Generate synthetic popular times
-3. Aggregate by H3 hexagons
-4. Create optimized JSON for frontend
+3. Aggregate by H3 hexagons (resolution 9, rolled up to 8, 7 and 6)
+4. Create optimized JSON for frontend: heatmap_<city>.json (resolution 8),
+   one heatmap_<city>_r<N>.json per pyramid level and a
+   heatmap_<city>_pyramid.json manifest mapping zoom ranges to levels
+   (with --binary also a columnar .bin next to every .json, with --slices a
+   content-hashed <name>_slices.<hash>/ directory of geometry plus 168 per-hour
+   files; see heatmap_binary.py)
+5. Publish every file atomically with .gz/.br siblings; heatmaps and manifests
+   also under content-hashed names, which heatmap_cities.json and the
+   manifests point at (see static_artifacts.py)
 
 Usage:
     python generate_all_heatmaps.py [--cities kyiv,odesa,lviv] [--skip-existing]
+                                    [--workers 4] [--union] [--tiles 3] [--offline]
+                                    [--pbf data/ukraine-latest.osm.pbf] [--delta] [--from-store]
+                                    [--quantiles] [--binary] [--packed] [--slices]
 """
 
 import json
 import time
 import argparse
-import random
-import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 from collections import defaultdict
-import requests
 
 try:
     import h3
@@ -28,7 +38,28 @@ except ImportError:
     print("ERROR: h3 not installed. Run: pip install h3")
     exit(1)
 
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
 from cities_config import CITIES, ALL_CITIES
+from http_client import LatencyStats, take_latency_stats
+from overpass import (OverpassError, configure_cache, bbox_to_str, compile_tag_index, classify_tags,
+                      build_union_query, element_coords)
+from overpass_tiles import TileFetchError, fetch_tiled
+from osm_pbf import extract_pois
+from poi_store import get_store
+from poi_dedup import DEFAULT_DISTANCE_M, DEFAULT_SIMILARITY, dedup_pois
+from activity_patterns import PATTERNS
+from activity_hubs import HubIndex, hub_index, effective_distance_km
+from hex_aggregate import DenseAggregate, aggregate_pois, intensity_lists
+from popular_times import CHUNK_SIZE, stable_keys, distance_km, generate_batch, to_populartimes
+from heatmap_binary import encode_heatmap, write_heatmap_slices
+from static_artifacts import publish, hashed_name
+from heatmap_delta import (MAX_CHANGED_FRACTION, load_snapshot, save_snapshot, diff_pois,
+                           affected_cells, pois_in_cells, patch_hexagons)
 
 # Paths
 SCRIPT_DIR = Path(__file__).parent
@@ -41,6 +72,18 @@ PUBLIC_DIR.mkdir(exist_ok=True)
 # H3 resolution (8 = ~460m diameter hexagon)
 H3_RESOLUTION = 8
 
+# Pyramid levels: H3 resolution -> (min, max) map zoom it is shown at.
+# POIs are aggregated at the finest level and rolled up to the others.
+PYRAMID_ZOOMS = {
+    6: (0, 9),
+    7: (10, 11),
+    8: (12, 13),
+    9: (14, 22),
+}
+
+# Minimum spacing between Overpass requests (seconds), shared by all workers
+OVERPASS_INTERVAL = 1.0
+
 # POI categories to collect
 POI_CATEGORIES = {
     'restaurant': ['amenity=restaurant'],
@@ -57,12 +100,116 @@ POI_CATEGORIES = {
     'park': ['leisure=park'],
 }
 
+# Tag -> category lookup for union queries (compiled once)
+POI_TAG_INDEX = compile_tag_index(POI_CATEGORIES)
+
+
+class RateBudget:
+    """
+    Minimum spacing between outbound Overpass requests.
+
+    The lock and the next free slot live in shared memory, so one budget
+    handed to every worker process throttles all of them together.
+    """
+
+    def __init__(self, interval: float = OVERPASS_INTERVAL):
+        self.interval = interval
+        self._lock = multiprocessing.Lock()
+        self._next_slot = multiprocessing.Value('d', 0.0, lock=False)
+
+    def wait(self):
+        """Block until this process may send the next request."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.value)
+            self._next_slot.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Rate budget, spatial dedup and output settings of the current process (set by init_worker)
+_rate_budget = None
+_dedup_settings = (DEFAULT_DISTANCE_M, DEFAULT_SIMILARITY)
+_quantiles = False
+_binary = False
+_packed = False
+_slices = False
+
+
+def init_worker(rate_budget: RateBudget, offline: bool = False, use_cache: bool = True,
+                dedup_distance: float = DEFAULT_DISTANCE_M, dedup_similarity: float = DEFAULT_SIMILARITY,
+                quantiles: bool = False, binary: bool = False, slices: bool = False,
+                packed: bool = False):
+    """Install the shared rate budget, cache, dedup and output settings in a worker process."""
+    global _rate_budget, _dedup_settings, _quantiles, _binary, _slices, _packed
+    _rate_budget = rate_budget
+    _dedup_settings = (dedup_distance, dedup_similarity)
+    _quantiles = quantiles
+    _binary = binary
+    _slices = slices
+    _packed = packed
+    configure_cache(offline=offline, enabled=use_cache)
+
+
+def throttle():
+    """Wait for the next Overpass request slot."""
+    if _rate_budget is not None:
+        _rate_budget.wait()
+    else:
+        time.sleep(OVERPASS_INTERVAL)
+
+
+def element_to_poi(el: dict, category: str):
+    """Convert an Overpass element to a POI record (None if it has no coordinates)."""
+    coords = element_coords(el)
+    if coords is None:
+        return None
+
+    return {
+        'osm_id': f"{el['type']}/{el['id']}",
+        'name': el.get('tags', {}).get('name', f"POI {el['id']}"),
+        'lat': coords[0],
+        'lng': coords[1],
+        'poi_type': category,
+    }
+
 
-def collect_pois_for_city(city_key: str) -> list:
-    """Collect POIs for a city using Overpass API."""
+def build_tag_query(tag: str, bbox) -> str:
+    """Overpass query for one 'key=value' tag (value '*' = any) in a bbox."""
+    key, value = tag.split('=')
+    bbox_str = bbox_to_str(bbox)
+
+    query = f"""
+    [out:json][timeout:60];
+    (
+      node["{key}"="{value}"]({bbox_str});
+      way["{key}"="{value}"]({bbox_str});
+    );
+    out center;
+    """
+
+    if value == '*':
+        query = f"""
+        [out:json][timeout:60];
+        (
+          node["{key}"]({bbox_str});
+          way["{key}"]({bbox_str});
+        );
+        out center;
+        """
+
+    return query
+
+
+def collect_pois_for_city(city_key: str, tiles: int = 1) -> list:
+    """
+    Collect POIs for a city using Overpass API.
+
+    Each tag is fetched over a tiles x tiles grid; tiles that time out or
+    are rate limited are split further (see overpass_tiles). A tag whose
+    tiles still fail raises TileFetchError instead of being dropped.
+    """
     city = CITIES[city_key]
-    bbox = city['bbox']
-    bbox_str = f"{bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}"
 
     print(f"  Collecting POIs for {city['name']}...")
 
@@ -71,230 +218,186 @@ def collect_pois_for_city(city_key: str) -> list:
 
     for category, tags in POI_CATEGORIES.items():
         for tag in tags:
-            key, value = tag.split('=')
-
-            query = f"""
-            [out:json][timeout:60];
-            (
-              node["{key}"="{value}"]({bbox_str});
-              way["{key}"="{value}"]({bbox_str});
-            );
-            out center;
-            """
-
-            if value == '*':
-                query = f"""
-                [out:json][timeout:60];
-                (
-                  node["{key}"]({bbox_str});
-                  way["{key}"]({bbox_str});
-                );
-                out center;
-                """
-
             try:
-                response = requests.post(
-                    'https://overpass-api.de/api/interpreter',
-                    data={'data': query},
-                    timeout=120
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    elements = data.get('elements', [])
-
-                    for el in elements:
-                        osm_id = f"{el['type']}/{el['id']}"
-                        if osm_id in seen_ids:
-                            continue
-                        seen_ids.add(osm_id)
-
-                        # Get coordinates
-                        if el['type'] == 'node':
-                            lat, lng = el['lat'], el['lon']
-                        elif 'center' in el:
-                            lat, lng = el['center']['lat'], el['center']['lon']
-                        else:
-                            continue
-
-                        name = el.get('tags', {}).get('name', f"POI {el['id']}")
-
-                        all_pois.append({
-                            'osm_id': osm_id,
-                            'name': name,
-                            'lat': lat,
-                            'lng': lng,
-                            'poi_type': category,
-                        })
-
-                    print(f"    {category}/{tag}: {len(elements)} found")
-                else:
-                    print(f"    {category}/{tag}: HTTP {response.status_code}")
-
+                found = 0
+                elements = fetch_tiled(lambda bbox: build_tag_query(tag, bbox), city['bbox'],
+                                       grid=tiles, timeout=120, throttle=throttle)
+                for el in get_store().upsert_iter(elements):
+                    found += 1
+                    osm_id = f"{el['type']}/{el['id']}"
+                    if osm_id in seen_ids:
+                        continue
+                    seen_ids.add(osm_id)
+
+                    poi = element_to_poi(el, category)
+                    if poi:
+                        all_pois.append(poi)
+
+                print(f"    {category}/{tag}: {found} found")
+
+            except TileFetchError:
+                raise
+            except OverpassError as e:
+                print(f"    {category}/{tag}: {e}")
             except Exception as e:
                 print(f"    {category}/{tag}: Error - {e}")
 
-            time.sleep(1)  # Rate limiting
+    get_store().mark_fetched('heatmap', city_key)
+    print(f"  Total unique POIs: {len(all_pois)}")
+    return all_pois
+
+
+def collect_pois_for_city_union(city_key: str, tiles: int = 1) -> list:
+    """
+    Collect POIs for a city with a single union Overpass query.
+
+    Every element is classified locally via POI_TAG_INDEX, so the result
+    matches collect_pois_for_city without one round trip per tag. The
+    query is tiled the same way as in collect_pois_for_city.
+    """
+    city = CITIES[city_key]
+
+    print(f"  Collecting POIs for {city['name']} (union query)...")
+
+    all_pois = []
+    seen_ids = set()
+    stats = defaultdict(int)
+
+    try:
+        elements = fetch_tiled(lambda bbox: build_union_query(POI_CATEGORIES, bbox), city['bbox'],
+                               grid=tiles, timeout=300, throttle=throttle)
+        for el in get_store().upsert_iter(elements):
+            osm_id = f"{el['type']}/{el['id']}"
+            if osm_id in seen_ids:
+                continue
+            seen_ids.add(osm_id)
+
+            category = classify_tags(el.get('tags', {}), POI_TAG_INDEX)
+            if category is None:
+                continue
+
+            poi = element_to_poi(el, category)
+            if poi:
+                all_pois.append(poi)
+                stats[category] += 1
+    except TileFetchError:
+        raise
+    except OverpassError as e:
+        print(f"    {e}")
+        return []
+    except Exception as e:
+        print(f"    Error - {e}")
+        return []
+
+    get_store().mark_fetched('heatmap', city_key)
+
+    for category in POI_CATEGORIES:
+        print(f"    {category}: {stats[category]} found")
 
     print(f"  Total unique POIs: {len(all_pois)}")
     return all_pois
 
 
-def generate_popular_times(poi: dict, city_center: tuple) -> list:
-    """Generate synthetic popular times for a POI."""
-    poi_type = poi['poi_type']
+def collect_pois_from_store(city_key: str) -> list:
+    """Read a city's POIs from the local POI store (filled by earlier runs and other collectors)."""
+    city = CITIES[city_key]
+    tags = [tag for category_tags in POI_CATEGORIES.values() for tag in category_tags]
 
-    # Seed for reproducibility
-    random.seed(hash(poi['osm_id']) % (2**32))
+    print(f"  Reading POIs for {city['name']} from the POI store...")
 
-    # Base patterns
-    patterns = {
-        'restaurant': {
-            'weekday': [0, 0, 0, 0, 0, 0, 10, 15, 20, 15, 10, 20, 60, 70, 40, 20, 30, 50, 80, 100, 90, 70, 40, 10],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 10, 20, 30, 50, 70, 90, 100, 80, 60, 50, 60, 80, 100, 90, 70, 40, 10]
-        },
-        'cafe': {
-            'weekday': [0, 0, 0, 0, 0, 5, 20, 50, 80, 100, 90, 70, 80, 70, 60, 50, 60, 70, 60, 40, 20, 10, 5, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 10, 30, 60, 80, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0, 0]
-        },
-        'gym': {
-            'weekday': [0, 0, 0, 0, 0, 5, 30, 70, 90, 60, 40, 50, 70, 50, 40, 50, 70, 100, 90, 80, 60, 30, 10, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 50, 80, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0, 0, 0]
-        },
-        'shopping_mall': {
-            'weekday': [0, 0, 0, 0, 0, 0, 0, 5, 10, 30, 50, 60, 70, 60, 50, 60, 80, 100, 90, 80, 70, 50, 20, 5],
-            'weekend': [0, 0, 0, 0, 0, 0, 0, 5, 10, 40, 70, 90, 100, 100, 90, 80, 90, 100, 90, 70, 50, 30, 10, 0]
-        },
-        'supermarket': {
-            'weekday': [0, 0, 0, 0, 0, 0, 5, 20, 50, 70, 60, 50, 60, 50, 40, 50, 70, 100, 80, 60, 40, 20, 10, 5],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 10, 30, 60, 80, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0, 0]
-        },
-        'transit_station': {
-            'weekday': [5, 0, 0, 0, 0, 10, 40, 90, 100, 70, 40, 30, 40, 40, 30, 40, 60, 100, 90, 60, 30, 20, 10, 5],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 40, 60, 70, 80, 80, 70, 60, 50, 50, 60, 50, 40, 30, 20, 10, 5]
-        },
-        'office': {
-            'weekday': [0, 0, 0, 0, 0, 0, 10, 50, 90, 100, 100, 90, 70, 80, 100, 100, 90, 70, 30, 10, 5, 0, 0, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 0, 0, 5, 10, 15, 15, 10, 10, 10, 5, 0, 0, 0, 0, 0, 0, 0, 0]
-        },
-        'bar': {
-            'weekday': [5, 0, 0, 0, 0, 0, 0, 0, 0, 0, 5, 10, 20, 20, 15, 20, 30, 50, 70, 90, 100, 100, 80, 30],
-            'weekend': [10, 5, 0, 0, 0, 0, 0, 0, 0, 5, 10, 20, 30, 30, 25, 30, 40, 60, 80, 100, 100, 100, 90, 50]
-        },
-        'park': {
-            'weekday': [0, 0, 0, 0, 0, 5, 20, 40, 50, 40, 30, 40, 50, 40, 30, 40, 60, 80, 100, 80, 50, 30, 10, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 40, 60, 80, 100, 100, 100, 90, 80, 70, 60, 50, 40, 20, 10, 5, 0]
-        },
-    }
+    all_pois = []
+    for el in get_store().query_elements(bbox=city['bbox'], tags=tags):
+        category = classify_tags(el.get('tags', {}), POI_TAG_INDEX)
+        if category is None:
+            continue
+        poi = element_to_poi(el, category)
+        if poi:
+            all_pois.append(poi)
 
-    pattern = patterns.get(poi_type, patterns.get('restaurant'))
+    print(f"  Total unique POIs: {len(all_pois)}")
+    return all_pois
 
-    # Random modifiers
-    intensity_mod = random.uniform(0.5, 1.5)
-    time_shift = random.randint(-2, 2)
-    day_variation = [random.uniform(0.7, 1.3) for _ in range(7)]
 
-    # Location-based modulation
-    lat_diff = abs(poi['lat'] - city_center[0]) * 111
-    lng_diff = abs(poi['lng'] - city_center[1]) * 111 * math.cos(math.radians(poi['lat']))
-    dist_km = math.sqrt(lat_diff**2 + lng_diff**2)
+# Pattern of POI types without one of their own (hotel, hospital, university, ...)
+FALLBACK_PATTERN = 'restaurant'
 
-    if dist_km < 2:
-        location_mod = 1.2 - (dist_km / 2) * 0.2
-    elif dist_km < 5:
-        location_mod = 1.0 - (dist_km - 2) / 3 * 0.2
-    else:
-        location_mod = max(0.5, 0.8 - (dist_km - 5) / 10 * 0.3)
-
-    # Generate 7 days
-    result = []
-    for day_idx in range(7):
-        is_weekend = day_idx >= 5
-        base_pattern = pattern['weekend'] if is_weekend else pattern['weekday']
-
-        # Apply time shift
-        shifted_pattern = base_pattern[time_shift:] + base_pattern[:time_shift]
-
-        # Apply modulations
-        modified_pattern = []
-        for hour, value in enumerate(shifted_pattern):
-            hour_noise = random.uniform(0.85, 1.15)
-            new_value = value * intensity_mod * day_variation[day_idx] * location_mod * hour_noise
-            modified_pattern.append(int(max(0, min(100, new_value))))
-
-        result.append({
-            'name': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'][day_idx],
-            'data': modified_pattern
-        })
 
-    random.seed()
-    return result
+def location_modulation(dist_km: np.ndarray) -> np.ndarray:
+    """Busyness factor by distance from the city center (center 1.2x, suburbs down to 0.5x)."""
+    return np.where(dist_km < 2, 1.2 - (dist_km / 2) * 0.2,
+                    np.where(dist_km < 5, 1.0 - (dist_km - 2) / 3 * 0.2,
+                             np.maximum(0.5, 0.8 - (dist_km - 5) / 10 * 0.3)))
 
 
-def aggregate_to_h3(pois_with_times: list) -> dict:
-    """Aggregate POIs by H3 hexagons."""
-    hexagons = defaultdict(lambda: {
-        'poi_count': 0,
-        'poi_types': set(),
-        'hours': defaultdict(lambda: defaultdict(list))
-    })
+def generate_popular_times_batch(pois: list, city_center: tuple, hubs: HubIndex = None) -> np.ndarray:
+    """Synthetic popular times of all POIs as an (N, 7, 24) uint8 array."""
+    codes = PATTERNS.codes((poi['poi_type'] for poi in pois), FALLBACK_PATTERN)
+    keys = stable_keys(poi['osm_id'] for poi in pois)
+    lats = [poi['lat'] for poi in pois]
+    lngs = [poi['lng'] for poi in pois]
+    dist = effective_distance_km(lats, lngs, distance_km(lats, lngs, city_center), hubs)
+    return generate_batch(codes, keys, location_modulation(dist))
 
-    for poi in pois_with_times:
-        try:
-            h3_index = h3.latlng_to_cell(poi['lat'], poi['lng'], H3_RESOLUTION)
-        except:
-            continue
 
-        hex_data = hexagons[h3_index]
-        hex_data['poi_count'] += 1
-        hex_data['poi_types'].add(poi['poi_type'])
-
-        for day_idx, day_data in enumerate(poi.get('populartimes', [])):
-            for hour, value in enumerate(day_data.get('data', [])[:24]):
-                hex_data['hours'][day_idx][hour].append(value)
-
-    # Calculate averages
-    result = {}
-    for h3_index, hex_data in hexagons.items():
-        center = h3.cell_to_latlng(h3_index)
-
-        hours_avg = {}
-        for day_idx in range(7):
-            hours_avg[day_idx] = {}
-            for hour in range(24):
-                values = hex_data['hours'][day_idx][hour]
-                hours_avg[day_idx][hour] = sum(values) / len(values) if values else 0
-
-        result[h3_index] = {
-            'lat': center[0],
-            'lng': center[1],
-            'poi_count': hex_data['poi_count'],
-            'poi_types': list(hex_data['poi_types']),
-            'hours': hours_avg
-        }
+def generate_popular_times(poi: dict, city_center: tuple, hubs: HubIndex = None) -> list:
+    """Generate synthetic popular times for a POI."""
+    return to_populartimes(generate_popular_times_batch([poi], city_center, hubs)[0])
 
-    return result
 
+def iter_popular_times(pois: list, city_key: str):
+    """
+    Yield the POIs' (n, 7, 24) popular times chunk by chunk, in input order.
 
-def create_optimized_json(hexagons: dict, city_key: str) -> dict:
+    Values are generated on demand and never attached to the POIs, so
+    only one chunk's grids are alive at once.
+    """
+    city = CITIES[city_key]
+    hubs = hub_index(city['bbox'])
+    for start in range(0, len(pois), CHUNK_SIZE):
+        yield generate_popular_times_batch(pois[start:start + CHUNK_SIZE], city['center'], hubs)
+
+
+def aggregate_to_h3(pois: list, city_key: str, resolution: int = H3_RESOLUTION) -> DenseAggregate:
+    """Aggregate POIs by H3 hexagons into dense per-(hex, type) sums (and histograms with --quantiles)."""
+    return aggregate_pois(pois, ((times, None) for times in iter_popular_times(pois, city_key)),
+                          resolution, _quantiles)
+
+
+def build_pyramid(pois: list, city_key: str) -> dict:
+    """{resolution: DenseAggregate} for every pyramid level, rolled up from the finest."""
+    resolutions = sorted(PYRAMID_ZOOMS, reverse=True)
+    levels = {resolutions[0]: aggregate_to_h3(pois, city_key, resolutions[0])}
+    for finer, resolution in zip(resolutions, resolutions[1:]):
+        levels[resolution] = levels[finer].to_parent(resolution)
+    return levels
+
+
+def optimize_hexagons(aggregate: DenseAggregate) -> list:
+    """
+    Compact frontend form of every aggregated hexagon (in cell order).
+
+    Aggregates with histograms also get median ('m') and p90 ('p')
+    intensities next to the mean ('i').
+    """
+    centers = np.round(aggregate.centers(), 5).tolist()
+    hexagons = [
+        {'lat': lat, 'lng': lng, 'n': count, 't': types, 'i': intensity}
+        for (lat, lng), count, types, intensity in zip(
+            centers, aggregate.poi_count.tolist(), aggregate.poi_types(),
+            intensity_lists(aggregate.hour_means()))
+    ]
+    if aggregate.hist is not None:
+        for hexagon, median, p90 in zip(hexagons, intensity_lists(aggregate.quantile(0.5)),
+                                        intensity_lists(aggregate.quantile(0.9))):
+            hexagon['m'] = median
+            hexagon['p'] = p90
+    return hexagons
+
+
+def create_optimized_json(aggregate: DenseAggregate, city_key: str,
+                          resolution: int = H3_RESOLUTION) -> dict:
     """Create optimized JSON for frontend."""
-    optimized_hexagons = []
-
-    for h3_index, hex_data in hexagons.items():
-        intensity = []
-        for day in range(7):
-            day_hours = []
-            for hour in range(24):
-                day_hours.append(round(hex_data['hours'][day][hour], 1))
-            intensity.append(day_hours)
-
-        optimized_hexagons.append({
-            'lat': round(hex_data['lat'], 5),
-            'lng': round(hex_data['lng'], 5),
-            'n': hex_data['poi_count'],
-            't': hex_data['poi_types'],
-            'i': intensity
-        })
+    optimized_hexagons = optimize_hexagons(aggregate)
 
     city = CITIES[city_key]
     return {
@@ -303,14 +406,93 @@ def create_optimized_json(hexagons: dict, city_key: str) -> dict:
             'city_name': city['name'],
             'center': city['center'],
             'created': datetime.now().isoformat(),
+            'resolution': resolution,
             'hex_count': len(optimized_hexagons),
         },
         'hexagons': optimized_hexagons
     }
 
 
-def process_city(city_key: str, skip_existing: bool = False) -> dict:
-    """Process a single city through the full pipeline."""
+def pyramid_file(city_key: str, resolution: int) -> Path:
+    return PUBLIC_DIR / f'heatmap_{city_key}_r{resolution}.json'
+
+
+def manifest_file(city_key: str) -> Path:
+    return PUBLIC_DIR / f'heatmap_{city_key}_pyramid.json'
+
+
+def write_pyramid(outputs: dict, city_key: str):
+    """Write every level of {resolution: output} and the manifest mapping zoom ranges to files."""
+    levels = []
+    for resolution in sorted(outputs):
+        files = write_city_output(outputs[resolution], pyramid_file(city_key, resolution))
+        min_zoom, max_zoom = PYRAMID_ZOOMS[resolution]
+        levels.append({
+            'resolution': resolution,
+            'min_zoom': min_zoom,
+            'max_zoom': max_zoom,
+            **files,
+            'hex_count': outputs[resolution]['meta']['hex_count'],
+        })
+
+    # Written after the levels, so it never points at files that do not exist yet
+    manifest = {'city': city_key, 'created': datetime.now().isoformat(), 'levels': levels}
+    publish(manifest_file(city_key), json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
+
+
+def refresh_city_delta(city_key: str, pois: list) -> dict:
+    """
+    Patch the existing pyramid levels with the POI changes since the last snapshot.
+
+    Returns the patched {resolution: output}, or None when a full rebuild
+    is needed (no snapshot or level files yet, or too many POIs changed).
+    """
+    old_pois = load_snapshot(city_key)
+    if old_pois is None or not all(pyramid_file(city_key, res).exists() for res in PYRAMID_ZOOMS):
+        print(f"  No previous snapshot, running a full rebuild")
+        return None
+
+    added, removed, changed = diff_pois(old_pois, pois)
+    changed_count = len(added) + len(removed) + len(changed)
+    print(f"  Delta: {len(added)} added, {len(removed)} removed, {len(changed)} changed")
+    if changed_count > MAX_CHANGED_FRACTION * max(len(pois), 1):
+        print(f"  Too many changes for a delta, running a full rebuild")
+        return None
+
+    outputs = {}
+    for resolution in PYRAMID_ZOOMS:
+        with open(pyramid_file(city_key, resolution), 'r', encoding='utf-8') as f:
+            outputs[resolution] = json.load(f)
+
+    if changed_count:
+        # The affected cells of a level are the parents of the affected finest cells;
+        # each is recomputed from just the POIs under it. The POIs under the affected
+        # coarsest ancestors are selected once as the candidates of every level.
+        finest, coarsest = max(PYRAMID_ZOOMS), min(PYRAMID_ZOOMS)
+        fine_cells = affected_cells(old_pois, pois, added + removed + changed, finest)
+        candidates = pois_in_cells(pois, {h3.cell_to_parent(cell, coarsest) for cell in fine_cells},
+                                   finest, coarsest)
+
+        for resolution, output in outputs.items():
+            cells = {h3.cell_to_parent(cell, resolution) for cell in fine_cells}
+            level_pois = pois_in_cells(candidates, cells, finest, resolution)
+            fresh = {}
+            if level_pois:
+                aggregate = aggregate_to_h3(level_pois, city_key, finest)
+                if resolution != finest:
+                    aggregate = aggregate.to_parent(resolution)
+                fresh = dict(zip(aggregate.cell_ids(), optimize_hexagons(aggregate)))
+            patch_hexagons(output, cells, fresh, resolution)
+            print(f"    Resolution {resolution}: recomputed {len(cells)} of {output['meta']['hex_count']} hexagons")
+
+    for output in outputs.values():
+        output['meta']['created'] = datetime.now().isoformat()
+    return outputs
+
+
+def process_city(city_key: str, skip_existing: bool = False, union: bool = False, tiles: int = 1,
+                 pois: list = None, delta: bool = False, from_store: bool = False) -> dict:
+    """Process a single city through the full pipeline (pois: already extracted, e.g. from a PBF)."""
     city = CITIES[city_key]
     output_file = PUBLIC_DIR / f'heatmap_{city_key}.json'
 
@@ -323,33 +505,109 @@ def process_city(city_key: str, skip_existing: bool = False) -> dict:
     print(f"{'='*60}")
 
     # Step 1: Collect POIs
-    pois = collect_pois_for_city(city_key)
+    if pois is not None:
+        print(f"  Using {len(pois)} pre-collected POIs")
+    elif from_store:
+        pois = collect_pois_from_store(city_key)
+    elif union:
+        pois = collect_pois_for_city_union(city_key, tiles)
+    else:
+        pois = collect_pois_for_city(city_key, tiles)
     if not pois:
         print(f"  No POIs found for {city['name']}")
         return None
 
-    # Step 2: Generate popular times
-    print(f"  Generating popular times...")
-    for poi in pois:
-        poi['populartimes'] = generate_popular_times(poi, city['center'])
+    # Merge the same place seen as node and way (or from several sources)
+    if _dedup_settings[0] > 0:
+        count = len(pois)
+        pois = dedup_pois(pois, *_dedup_settings)
+        print(f"  Spatial dedup: {count} -> {len(pois)} POIs")
+
+    outputs = refresh_city_delta(city_key, pois) if delta else None
+    if outputs is None:
+        # Step 2: Generate popular times and aggregate by H3 (streamed, chunk by chunk)
+        print(f"  Generating popular times and aggregating by H3 hexagons...")
+        levels = build_pyramid(pois, city_key)
+        for resolution, aggregate in sorted(levels.items()):
+            print(f"    Resolution {resolution}: {len(aggregate)} hexagons")
+
+        # Step 3: Create optimized JSON
+        print(f"  Creating optimized JSON...")
+        outputs = {resolution: create_optimized_json(aggregate, city_key, resolution)
+                   for resolution, aggregate in levels.items()}
 
-    # Step 3: Aggregate by H3
-    print(f"  Aggregating by H3 hexagons...")
-    hexagons = aggregate_to_h3(pois)
-    print(f"    Created {len(hexagons)} hexagons")
+    # Save to public folder
+    output = outputs[H3_RESOLUTION]
+    write_city_output(output, output_file)
+    write_pyramid(outputs, city_key)
+    save_snapshot(city_key, pois)
 
-    # Step 4: Create optimized JSON
-    print(f"  Creating optimized JSON...")
-    output = create_optimized_json(hexagons, city_key)
+    return output
 
-    # Save to public folder
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, separators=(',', ':'))
 
-    file_size = output_file.stat().st_size / 1024
-    print(f"  Saved: {output_file.name} ({file_size:.1f} KB)")
+def slices_dir(output_file: Path) -> Path:
+    return output_file.with_name(f'{output_file.stem}_slices')
 
-    return output
+
+def write_city_output(output: dict, output_file: Path) -> dict:
+    """
+    Publish a city heatmap to the public folder.
+
+    Returns the names clients should fetch, keyed like pyramid manifest
+    levels: 'file' (content-hashed JSON), 'binary' and 'slices' if written.
+    """
+    data = json.dumps(output, separators=(',', ':')).encode('utf-8')
+    files = {'file': publish(output_file, data).name}
+    print(f"  Saved: {output_file.name} -> {files['file']} ({len(data) / 1024:.1f} KB)")
+
+    if _binary:
+        binary_file = output_file.with_suffix('.bin')
+        data = encode_heatmap(output, packed=_packed)
+        files['binary'] = publish(binary_file, data).name
+        print(f"  Saved: {binary_file.name} -> {files['binary']} ({len(data) / 1024:.1f} KB)")
+
+    if _slices:
+        directory, slices_size = write_heatmap_slices(output, slices_dir(output_file))
+        files['slices'] = directory.name
+        print(f"  Saved: {directory.name}/ ({slices_size / 1024:.1f} KB in 169 files)")
+
+    return files
+
+
+def run_city(city_key: str, skip_existing: bool = False, union: bool = False, tiles: int = 1,
+             pois: list = None, delta: bool = False, from_store: bool = False):
+    """Worker entry point: process a city and return (metadata, HTTP latency stats)."""
+    result = process_city(city_key, skip_existing, union, tiles, pois, delta, from_store)
+    return (result['meta'] if result else None), take_latency_stats()
+
+
+def run_parallel(cities: list, skip_existing: bool, union: bool, tiles: int, workers: int,
+                 worker_args: tuple, latency: LatencyStats, city_pois: dict = None,
+                 delta: bool = False, from_store: bool = False) -> tuple:
+    """Run the city pipelines in a process pool. Returns (results, errors)."""
+    results = {}
+    errors = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=worker_args) as pool:
+        futures = {
+            pool.submit(run_city, city_key, skip_existing, union, tiles,
+                        city_pois[city_key] if city_pois else None, delta, from_store): city_key
+            for city_key in cities
+        }
+
+        for future in as_completed(futures):
+            city_key = futures[future]
+            try:
+                meta, city_latency = future.result()
+                latency.merge(city_latency)
+                if meta:
+                    results[city_key] = meta
+            except Exception as e:
+                errors[city_key] = str(e)
+                print(f"Error processing {city_key}: {e}")
+
+    return results, errors
 
 
 def main():
@@ -358,6 +616,36 @@ def main():
                         help='Comma-separated list of city keys')
     parser.add_argument('--skip-existing', action='store_true',
                         help='Skip cities that already have data files')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of cities to process in parallel (1 = sequential)')
+    parser.add_argument('--overpass-interval', type=float, default=OVERPASS_INTERVAL,
+                        help='Minimum seconds between Overpass requests across all workers')
+    parser.add_argument('--union', action='store_true',
+                        help='Collect each city with one union Overpass query instead of one per tag')
+    parser.add_argument('--tiles', type=int, default=1,
+                        help='Split each city bbox into an N x N grid of Overpass queries')
+    parser.add_argument('--offline', action='store_true',
+                        help='Serve Overpass responses only from the local cache')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always query Overpass and do not store responses')
+    parser.add_argument('--pbf', type=Path,
+                        help='Read POIs for all cities from a local .osm.pbf extract instead of Overpass')
+    parser.add_argument('--delta', action='store_true',
+                        help='Only recompute hexagons whose POIs changed since the last run')
+    parser.add_argument('--dedup-distance', type=float, default=DEFAULT_DISTANCE_M,
+                        help='Merge similarly named POIs closer than this many meters (0 = off)')
+    parser.add_argument('--dedup-similarity', type=float, default=DEFAULT_SIMILARITY,
+                        help='Minimum name similarity (0-1) for the spatial dedup')
+    parser.add_argument('--from-store', action='store_true',
+                        help='Read POIs from the local POI store instead of querying Overpass')
+    parser.add_argument('--quantiles', action='store_true',
+                        help='Also output median and p90 intensities (per-hex value histograms)')
+    parser.add_argument('--binary', action='store_true',
+                        help='Also write the columnar binary format (.bin) next to every heatmap JSON')
+    parser.add_argument('--packed', action='store_true',
+                        help='Write --binary files H3-ordered and delta-coded (smaller after gzip/brotli)')
+    parser.add_argument('--slices', action='store_true',
+                        help='Also write per-(day, hour) slice files and a shared geometry file per heatmap')
     args = parser.parse_args()
 
     cities_to_process = [c.strip() for c in args.cities.split(',')]
@@ -367,45 +655,82 @@ def main():
     print("="*60)
     print(f"Cities: {', '.join(cities_to_process)}")
 
-    results = {}
     for city_key in cities_to_process:
         if city_key not in CITIES:
             print(f"Unknown city: {city_key}")
-            continue
+    cities_to_process = [c for c in cities_to_process if c in CITIES]
+
+    worker_args = (RateBudget(args.overpass_interval), args.offline, not args.no_cache,
+                   args.dedup_distance, args.dedup_similarity, args.quantiles,
+                   args.binary, args.slices, args.packed)
+
+    city_pois = None
+    if args.pbf:
+        if args.skip_existing:
+            cities_to_process = [c for c in cities_to_process
+                                 if not (PUBLIC_DIR / f'heatmap_{c}.json').exists()]
+        print(f"Extracting POIs from {args.pbf}...")
+        city_pois = extract_pois(args.pbf, POI_TAG_INDEX,
+                                 {key: CITIES[key]['bbox'] for key in cities_to_process})
+        for city_key in cities_to_process:
+            print(f"  {CITIES[city_key]['name']}: {len(city_pois[city_key])} POIs from the PBF extract")
 
-        try:
-            result = process_city(city_key, args.skip_existing)
-            if result:
-                results[city_key] = result['meta']
-        except Exception as e:
-            print(f"Error processing {city_key}: {e}")
-
-    # Create cities index file
+    results = {}
+    errors = {}
+    latency = LatencyStats()
+    if args.workers > 1:
+        print(f"Workers: {args.workers}")
+        results, errors = run_parallel(cities_to_process, args.skip_existing, args.union, args.tiles,
+                                       args.workers, worker_args, latency, city_pois, args.delta,
+                                       args.from_store)
+    else:
+        init_worker(*worker_args)
+        for city_key in cities_to_process:
+            try:
+                meta, city_latency = run_city(city_key, args.skip_existing, args.union, args.tiles,
+                                              city_pois[city_key] if city_pois else None, args.delta,
+                                              args.from_store)
+                latency.merge(city_latency)
+                if meta:
+                    results[city_key] = meta
+            except Exception as e:
+                errors[city_key] = str(e)
+                print(f"Error processing {city_key}: {e}")
+
+    # Create cities index file, pointing at the content-hashed names of the city files
+    cities = {}
+    for key in ALL_CITIES:
+        city_file = PUBLIC_DIR / f'heatmap_{key}.json'
+        available = key in results or city_file.exists()
+        cities[key] = {
+            'name': CITIES[key]['name'],
+            'name_en': CITIES[key]['name_en'],
+            'center': CITIES[key]['center'],
+            'file': hashed_name(city_file) if city_file.exists() else city_file.name,
+            'pyramid': hashed_name(manifest_file(key)) if manifest_file(key).exists() else manifest_file(key).name,
+            'available': available
+        }
     cities_index = {
-        'cities': {
-            key: {
-                'name': CITIES[key]['name'],
-                'name_en': CITIES[key]['name_en'],
-                'center': CITIES[key]['center'],
-                'file': f'heatmap_{key}.json',
-                'available': key in results or (PUBLIC_DIR / f'heatmap_{key}.json').exists()
-            }
-            for key in ALL_CITIES
-        },
+        'cities': cities,
         'default': 'kyiv',
         'generated': datetime.now().isoformat()
     }
 
+    # The index itself keeps its fixed name (it is the entry point) and is written last
     index_file = PUBLIC_DIR / 'heatmap_cities.json'
-    with open(index_file, 'w', encoding='utf-8') as f:
-        json.dump(cities_index, f, ensure_ascii=False, indent=2)
+    publish(index_file, json.dumps(cities_index, ensure_ascii=False, indent=2).encode('utf-8'), hashed=False)
 
     print(f"\n{'='*60}")
     print("Summary:")
     print(f"{'='*60}")
-    for city_key, meta in results.items():
-        print(f"  {CITIES[city_key]['name']}: {meta['hex_count']} hexagons")
+    for city_key in cities_to_process:
+        if city_key in results:
+            print(f"  {CITIES[city_key]['name']}: {results[city_key]['hex_count']} hexagons")
+        elif city_key in errors:
+            print(f"  {CITIES[city_key]['name']}: FAILED ({errors[city_key]})")
     print(f"\nCities index saved: {index_file.name}")
+    print()
+    latency.report()
 
 
 if __name__ == '__main__':
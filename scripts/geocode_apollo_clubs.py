@@ -6,11 +6,15 @@ Output: data/apollo_clubs.json
 """
 
 import json
-import time
-import urllib.request
-import urllib.parse
 import os
 
+from http_client import HttpError, get_client, print_latency_report
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+
+# Nominatim usage policy: at most 1 request per second
+NOMINATIM_INTERVAL = 1.1
+
 # Apollo clubs data
 CLUBS = [
     {"club_id": "019", "city": "Київ", "mall": "ТРЦ Дрімтаун-1", "address": "Оболонський проспект, 1Б"},
@@ -60,17 +64,19 @@ KNOWN_COORDINATES = {
 def geocode(address: str, city: str) -> tuple:
     """Geocode address using Nominatim API."""
     query = f"{address}, {city}, Україна"
-    url = f"https://nominatim.openstreetmap.org/search?q={urllib.parse.quote(query)}&format=json&limit=1"
 
     headers = {'User-Agent': 'ApolloNextMapViewer/1.0'}
-    req = urllib.request.Request(url, headers=headers)
+    params = {'q': query, 'format': 'json', 'limit': 1}
 
     try:
-        with urllib.request.urlopen(req, timeout=10) as response:
-            data = json.loads(response.read().decode('utf-8'))
+        response = get_client().get(NOMINATIM_URL, params=params, headers=headers, timeout=10)
+        if response.status == 200:
+            data = response.json()
             if data:
                 return float(data[0]['lat']), float(data[0]['lon'])
-    except Exception as e:
+        else:
+            print(f"  Error geocoding: HTTP {response.status}")
+    except (HttpError, ValueError) as e:
         print(f"  Error geocoding: {e}")
 
     return None, None
@@ -79,6 +85,8 @@ def main():
     print("Geocoding Apollo Next clubs...")
     print("=" * 50)
 
+    get_client().set_min_interval(NOMINATIM_URL, NOMINATIM_INTERVAL)
+
     results = []
 
     for club in CLUBS:
@@ -98,7 +106,6 @@ def main():
             else:
                 print(f"  ✗ Failed to geocode")
                 continue
-            time.sleep(1.1)  # Nominatim rate limit
 
         results.append({
             "club_id": club['club_id'],
@@ -120,6 +127,7 @@ def main():
 
     print("\n" + "=" * 50)
     print(f"Done! {len(results)} clubs saved to {output_file}")
+    print_latency_report()
 
 if __name__ == "__main__":
     main()
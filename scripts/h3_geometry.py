@@ -0,0 +1,141 @@
+"""
+Persistent cache of H3 cell geometry.
+
+Centers and boundary polygons of H3 cells never change, so they are
+computed once and kept in data/h3_geometry/, one .npy table per
+resolution sorted by cell. Boundaries are stored as 6 vertices plus the
+vertex count (5 for pentagons); the few cells with more vertices (edges
+crossing an icosahedron face) are recomputed on lookup. Tables are
+memory-mapped and looked up with a binary search; cells missing from a
+table are computed, merged in and the table is rewritten atomically.
+The cache is shared by all cities, runs and worker processes (a concurrent writer can at worst drop the
+other's new cells, which are then recomputed on a later run).
+"""
+
+import os
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
+try:
+    import h3.api.basic_int as h3_int
+except ImportError:
+    print("ERROR: h3 not installed. Run: pip install h3")
+    exit(1)
+
+GEOMETRY_DIR = Path(__file__).parent / 'data' / 'h3_geometry'
+
+# Vertices stored per cell: hexagons have 6, pentagons 5
+BOUNDARY_VERTICES = 6
+
+GEOMETRY_DTYPE = np.dtype([
+    ('cell', np.uint64),
+    ('center', np.float64, 2),
+    ('vertices', np.uint8),
+    ('boundary', np.float64, (BOUNDARY_VERTICES, 2)),
+])
+
+
+def cell_resolutions(cells: np.ndarray) -> np.ndarray:
+    """Resolution of each H3 cell (bits 52-55 of the index)."""
+    return ((cells >> np.uint64(52)) & np.uint64(0xF)).astype(np.intp)
+
+
+def compute_geometry(cells: np.ndarray) -> np.ndarray:
+    """Geometry rows of the given cells, computed with h3."""
+    rows = np.zeros(len(cells), dtype=GEOMETRY_DTYPE)
+    rows['cell'] = cells
+    for i, cell in enumerate(cells.tolist()):
+        rows['center'][i] = h3_int.cell_to_latlng(cell)
+        boundary = h3_int.cell_to_boundary(cell)
+        rows['vertices'][i] = len(boundary)
+        if len(boundary) <= BOUNDARY_VERTICES:
+            rows['boundary'][i, :len(boundary)] = boundary
+    return rows
+
+
+class GeometryCache:
+    """Lazily filled, memory-mapped centers and boundaries of H3 cells."""
+
+    def __init__(self, directory: Path = GEOMETRY_DIR):
+        self.directory = Path(directory)
+        self._tables = {}
+
+    def _path(self, resolution: int) -> Path:
+        return self.directory / f'cells_r{resolution}.npy'
+
+    def _table(self, resolution: int) -> np.ndarray:
+        table = self._tables.get(resolution)
+        if table is None:
+            try:
+                table = np.load(self._path(resolution), mmap_mode='r')
+            except (OSError, ValueError):
+                table = None
+            if table is None or table.dtype != GEOMETRY_DTYPE:
+                table = np.zeros(0, dtype=GEOMETRY_DTYPE)  # missing, or written with another layout
+            self._tables[resolution] = table
+        return table
+
+    def _add(self, resolution: int, cells: np.ndarray) -> np.ndarray:
+        """Compute `cells`, merge them into the table and persist it."""
+        merged = np.concatenate([np.asarray(self._table(resolution)), compute_geometry(cells)])
+        _, first = np.unique(merged['cell'], return_index=True)
+        merged = merged[first]
+
+        path = self._path(resolution)
+        tmp_path = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npy')
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            np.save(tmp_path, merged)
+            os.replace(tmp_path, path)
+            merged = np.load(path, mmap_mode='r')
+        except OSError as e:
+            print(f"  Warning: could not save H3 geometry cache: {e}")
+        self._tables[resolution] = merged
+        return merged
+
+    def lookup(self, cells) -> np.ndarray:
+        """Geometry rows aligned with `cells` (uint64 H3 indexes of any resolutions)."""
+        cells = np.asarray(cells, dtype=np.uint64)
+        result = np.empty(len(cells), dtype=GEOMETRY_DTYPE)
+        resolutions = cell_resolutions(cells)
+
+        for resolution in np.unique(resolutions).tolist():
+            mask = resolutions == resolution
+            wanted = cells[mask]
+            table = self._table(resolution)
+            pos = np.searchsorted(table['cell'], wanted)
+            found = pos < len(table)
+            found[found] = table['cell'][pos[found]] == wanted[found]
+            if not found.all():
+                table = self._add(resolution, np.unique(wanted[~found]))
+                pos = np.searchsorted(table['cell'], wanted)
+            result[mask] = table[pos]
+
+        return result
+
+    def centers(self, cells) -> np.ndarray:
+        """(N, 2) lat/lng of the cell centers."""
+        return self.lookup(cells)['center']
+
+    def boundaries(self, cells) -> list:
+        """Per cell, its boundary as a list of [lat, lng] vertices."""
+        rows = self.lookup(cells)
+        return [boundary[:count].tolist() if count <= BOUNDARY_VERTICES
+                else [list(vertex) for vertex in h3_int.cell_to_boundary(cell)]
+                for cell, count, boundary in zip(rows['cell'].tolist(), rows['vertices'].tolist(), rows['boundary'])]
+
+
+_cache = None
+
+
+def get_geometry_cache() -> GeometryCache:
+    """Return the process-wide geometry cache (tables are opened lazily)."""
+    global _cache
+    if _cache is None:
+        _cache = GeometryCache()
+    return _cache
@@ -0,0 +1,254 @@
+"""
+Binary columnar heatmap format.
+
+The JSON heatmaps spend most of their bytes (and the browser most of its
+parse time) on the 7 x 24 nested intensity lists. The binary form stores
+the same hexagons as fixed-width columns the frontend wraps in typed
+arrays without a parsing step:
+
+    offset 0   magic b'HXMB', uint16 version, uint16 reserved,
+               uint32 hex count, uint32 header length (all little-endian)
+    offset 16  header: UTF-8 JSON {meta, types, columns}, space-padded to 8 bytes
+    then       columns, each starting at an 8-byte aligned offset
+
+Every column entry of the header gives its name, dtype, shape and byte
+offset. Columns:
+
+    center     int32 (H, 2)      lat/lng in 1e-5 degrees
+    count      uint32 (H,)       POI count
+    types      uint8..64 (H,)    bit t set if the hexagon has a POI of types[t]
+    intensity  uint8 (H, 7, 24)  mean intensity (0-100, rounded to integers)
+    median     uint8 (H, 7, 24)  only for heatmaps built with --quantiles
+    p90        uint8 (H, 7, 24)  only for heatmaps built with --quantiles
+
+The packed encoding (header 'encoding': 'packed') keeps the same
+columns but makes them compress far better: rows are sorted by H3 index
+(neighbouring hexagons end up next to each other), center holds the
+row-to-row coordinate deltas (int16 when they fit; the first row is
+relative to the header's 'center_origin', the absolute center of that
+row) and every hour column holds each hexagon's hour-to-hour deltas over
+its 168 values, modulo 256. decode_heatmap() undoes both.
+
+Time-sliced output splits a heatmap into a directory holding
+geometry.bin (the format above without the hour columns) and one file
+per (day, hour), d<day>h<hour>.bin: the H uint8 mean intensities of that
+hour in geometry row order, with no header. A client then fetches the
+geometry once and a single 1/168 slice per slider position. The
+directory is published content-hashed (static_artifacts.publish_directory).
+"""
+
+import json
+import struct
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
+try:
+    import h3
+except ImportError:
+    print("ERROR: h3 not installed. Run: pip install h3")
+    exit(1)
+
+from static_artifacts import atomic_write, publish_directory
+
+MAGIC = b'HXMB'
+VERSION = 1
+PREFIX = struct.Struct('<4sHHII')
+
+# Coordinates are stored as integers in units of 1e-5 degrees (~1 m, like the JSON rounding)
+COORD_SCALE = 100_000
+
+ALIGNMENT = 8
+
+# Hexagon keys of the JSON form holding 7 x 24 intensities, by column name
+HOUR_COLUMNS = {'intensity': 'i', 'median': 'm', 'p90': 'p'}
+
+# Row order of packed heatmaps whose meta has no resolution (the single-resolution files)
+DEFAULT_RESOLUTION = 8
+
+
+def mask_dtype(type_count: int) -> np.dtype:
+    """Smallest unsigned integer dtype with a bit per type."""
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if type_count <= np.dtype(dtype).itemsize * 8:
+            return np.dtype(dtype)
+    raise ValueError(f"Too many POI types for a type bitmask: {type_count}")
+
+
+def hour_column(hexagons: list, key: str) -> np.ndarray:
+    """(H, 7, 24) uint8 column from the nested 'i'-style lists of the hexagons."""
+    values = np.array([hexagon[key] for hexagon in hexagons], dtype=np.float64).reshape(-1, 7, 24)
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+
+def h3_order(hexagons: list, resolution: int) -> list:
+    """The hexagons sorted by the H3 index of their centers."""
+    cells = [h3.str_to_int(h3.latlng_to_cell(hexagon['lat'], hexagon['lng'], resolution))
+             for hexagon in hexagons]
+    return [hexagons[row] for row in np.argsort(np.array(cells, dtype=np.uint64), kind='stable')]
+
+
+def pack_columns(columns: dict, origin) -> dict:
+    """Delta-code the center (relative to `origin` in row 0) and hour columns (see the module docstring)."""
+    packed = dict(columns)
+    center = np.diff(columns['center'].astype(np.int64), axis=0, prepend=np.array([origin], dtype=np.int64))
+    fits_int16 = not len(center) or np.abs(center).max() <= np.iinfo(np.int16).max
+    packed['center'] = center.astype('<i2' if fits_int16 else '<i4')
+    for name in HOUR_COLUMNS:
+        if name in columns:
+            hours = columns[name].reshape(len(columns[name]), -1)
+            packed[name] = np.diff(hours, axis=1, prepend=np.uint8(0)).reshape(columns[name].shape)
+    return packed
+
+
+def unpack_columns(columns: dict, origin) -> dict:
+    """Inverse of pack_columns()."""
+    unpacked = dict(columns)
+    center = np.cumsum(columns['center'], axis=0, dtype=np.int64) + np.array(origin, dtype=np.int64)
+    unpacked['center'] = center.astype('<i4')
+    for name in HOUR_COLUMNS:
+        if name in columns:
+            deltas = columns[name].reshape(len(columns[name]), -1)
+            unpacked[name] = np.cumsum(deltas, axis=1, dtype=np.uint8).reshape(columns[name].shape)
+    return unpacked
+
+
+def encode_heatmap(output: dict, hours: bool = True, packed: bool = False) -> bytes:
+    """
+    Binary form of a heatmap output ({'meta', 'hexagons'} as written to JSON).
+
+    With hours=False only the geometry columns (center, count, types) are
+    written; with packed=True the rows are H3-ordered and delta-coded.
+    """
+    hexagons = output['hexagons']
+    if packed:
+        hexagons = h3_order(hexagons, output['meta'].get('resolution', DEFAULT_RESOLUTION))
+    types = sorted({name for hexagon in hexagons for name in hexagon.get('t', ())})
+    type_bits = {name: 1 << bit for bit, name in enumerate(types)}
+
+    columns = {
+        'center': np.rint(np.array([(hexagon['lat'], hexagon['lng']) for hexagon in hexagons],
+                                   dtype=np.float64).reshape(-1, 2) * COORD_SCALE).astype('<i4'),
+        'count': np.array([hexagon['n'] for hexagon in hexagons], dtype='<u4'),
+        'types': np.array([sum(type_bits[name] for name in hexagon.get('t', ())) for hexagon in hexagons],
+                          dtype=mask_dtype(len(types)).newbyteorder('<')),
+    }
+    for name, key in (HOUR_COLUMNS.items() if hours else ()):
+        if hexagons and key in hexagons[0]:
+            columns[name] = hour_column(hexagons, key)
+        elif name == 'intensity':
+            columns[name] = np.zeros((len(hexagons), 7, 24), dtype=np.uint8)
+    extra = {}
+    if packed:
+        extra['center_origin'] = columns['center'][0].tolist() if len(hexagons) else [0, 0]
+        columns = pack_columns(columns, extra['center_origin'])
+
+    # Offsets are relative to the file start, so the header size has to be known first:
+    # lay the columns out after a header estimate and grow it until the header fits
+    header_size = ALIGNMENT
+    while True:
+        offset = PREFIX.size + header_size
+        layout = []
+        for name, array in columns.items():
+            layout.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+            offset = -(-(offset + array.nbytes) // ALIGNMENT) * ALIGNMENT
+        header = json.dumps({'meta': output['meta'], 'types': types, 'coord_scale': COORD_SCALE,
+                             'encoding': 'packed' if packed else 'plain', **extra, 'columns': layout},
+                            separators=(',', ':')).encode('utf-8')
+        if len(header) <= header_size:
+            break
+        header_size = -(-len(header) // ALIGNMENT) * ALIGNMENT
+
+    buffer = bytearray(offset)
+    PREFIX.pack_into(buffer, 0, MAGIC, VERSION, 0, len(hexagons), header_size)
+    buffer[PREFIX.size:PREFIX.size + header_size] = header.ljust(header_size)
+    for column, array in zip(layout, columns.values()):
+        buffer[column['offset']:column['offset'] + array.nbytes] = array.tobytes()
+    return bytes(buffer)
+
+
+def write_heatmap_binary(output: dict, path: Path, hours: bool = True, packed: bool = False) -> int:
+    """Write the binary form of a heatmap output; returns its size in bytes."""
+    data = encode_heatmap(output, hours, packed)
+    atomic_write(path, data)
+    return len(data)
+
+
+def slice_name(day: int, hour: int) -> str:
+    return f'd{day}h{hour}.bin'
+
+
+def heatmap_slices(output: dict) -> dict:
+    """{file name: bytes} of geometry.bin and the 168 per-(day, hour) slices of a heatmap output."""
+    files = {'geometry.bin': encode_heatmap(output, hours=False)}
+
+    # (7, 24, H): every slice is one contiguous row
+    intensity = np.ascontiguousarray(hour_column(output['hexagons'], 'i').transpose(1, 2, 0))
+    for day in range(7):
+        for hour in range(24):
+            files[slice_name(day, hour)] = intensity[day, hour].tobytes()
+    return files
+
+
+def write_heatmap_slices(output: dict, directory: Path) -> tuple:
+    """
+    Publish the time slices of a heatmap output as the content-hashed version of `directory`.
+
+    Returns (hashed directory, total size of the uncompressed files).
+    """
+    files = heatmap_slices(output)
+    return publish_directory(directory, files), sum(len(data) for data in files.values())
+
+
+def decode_heatmap(data) -> tuple:
+    """
+    (header, {column name: array}) of a binary heatmap.
+
+    The arrays are read-only views into `data` (no copies), except the
+    delta-decoded columns of packed heatmaps.
+    """
+    data = memoryview(data)
+    magic, version, _, hex_count, header_size = PREFIX.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a binary heatmap")
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary heatmap version: {version}")
+
+    header = json.loads(bytes(data[PREFIX.size:PREFIX.size + header_size]))
+    columns = {}
+    for column in header['columns']:
+        dtype = np.dtype(column['dtype'])
+        shape = tuple(column['shape'])
+        count = int(np.prod(shape)) if shape else 1
+        columns[column['name']] = np.frombuffer(data, dtype=dtype, count=count,
+                                                offset=column['offset']).reshape(shape)
+    if len(columns['count']) != hex_count:
+        raise ValueError("Binary heatmap hex count does not match its columns")
+    if header.get('encoding') == 'packed':
+        columns = unpack_columns(columns, header.get('center_origin', [0, 0]))
+    return header, columns
+
+
+def read_heatmap_binary(path: Path) -> tuple:
+    """Memory-mapped (header, columns) of a binary heatmap file."""
+    return decode_heatmap(np.memmap(path, dtype=np.uint8, mode='r'))
+
+
+def to_output(header: dict, columns: dict) -> dict:
+    """JSON form ({'meta', 'hexagons'}) of a decoded binary heatmap (intensities are integers)."""
+    types = header['types']
+    centers = (columns['center'] / header['coord_scale']).tolist()
+    masks = columns['types'].tolist()
+    hexagons = []
+    for row, ((lat, lng), count, mask) in enumerate(zip(centers, columns['count'].tolist(), masks)):
+        hexagon = {'lat': lat, 'lng': lng, 'n': count,
+                   't': [name for bit, name in enumerate(types) if mask >> bit & 1]}
+        for name, key in HOUR_COLUMNS.items():
+            if name in columns:
+                hexagon[key] = columns[name][row].tolist()
+        hexagons.append(hexagon)
+    return {'meta': header['meta'], 'hexagons': hexagons}
@@ -0,0 +1,120 @@
+"""
+Incremental heatmap refresh.
+
+Each full or delta run stores the city's POI set as a snapshot. The next
+run diffs the fresh POIs against it by osm_id and coordinates, and only
+the H3 cells that gained, lost or moved a POI are re-aggregated and
+patched into public/heatmap_<city>.json; every other hexagon is kept
+as is.
+"""
+
+import json
+import os
+from pathlib import Path
+
+try:
+    import h3
+except ImportError:
+    print("ERROR: h3 not installed. Run: pip install h3")
+    exit(1)
+
+SNAPSHOT_DIR = Path(__file__).parent / 'data' / 'snapshots'
+
+# Above this share of changed POIs a full rebuild is cheaper than patching
+MAX_CHANGED_FRACTION = 0.3
+
+# Fields that define a POI for diffing (popular times are derived from them)
+SNAPSHOT_FIELDS = ('osm_id', 'name', 'lat', 'lng', 'poi_type')
+
+
+def snapshot_path(city_key: str) -> Path:
+    return SNAPSHOT_DIR / f'pois_{city_key}.json'
+
+
+def load_snapshot(city_key: str):
+    """Return the POIs of the previous run, or None if there is no snapshot."""
+    try:
+        with open(snapshot_path(city_key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(city_key: str, pois: list):
+    """Store the POI set of this run (without popular times)."""
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    path = snapshot_path(city_key)
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump([{k: poi[k] for k in SNAPSHOT_FIELDS} for poi in pois], f,
+                  ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def diff_pois(old_pois: list, new_pois: list) -> tuple:
+    """
+    Compare two POI sets by osm_id.
+
+    Returns (added, removed, changed) as lists of osm_ids; changed covers
+    moved POIs and POIs whose category or name changed.
+    """
+    old = {poi['osm_id']: poi for poi in old_pois}
+    new = {poi['osm_id']: poi for poi in new_pois}
+
+    added = [osm_id for osm_id in new if osm_id not in old]
+    removed = [osm_id for osm_id in old if osm_id not in new]
+    changed = [
+        osm_id for osm_id, poi in new.items()
+        if osm_id in old and any(poi[k] != old[osm_id][k] for k in SNAPSHOT_FIELDS)
+    ]
+    return added, removed, changed
+
+
+def affected_cells(old_pois: list, new_pois: list, osm_ids, resolution: int) -> set:
+    """H3 cells holding the old or new position of any of the given POIs."""
+    osm_ids = set(osm_ids)
+    cells = set()
+    for poi in old_pois + new_pois:
+        if poi['osm_id'] in osm_ids:
+            try:
+                cells.add(h3.latlng_to_cell(poi['lat'], poi['lng'], resolution))
+            except Exception:
+                continue
+    return cells
+
+
+def pois_in_cells(pois: list, cells: set, resolution: int, parent_resolution: int = None) -> list:
+    """
+    POIs that fall into one of the given cells.
+
+    With parent_resolution, `cells` are at that (coarser) resolution and
+    a POI matches when the parent of its cell at `resolution` is one of them.
+    """
+    result = []
+    for poi in pois:
+        try:
+            cell = h3.latlng_to_cell(poi['lat'], poi['lng'], resolution)
+            if parent_resolution is not None:
+                cell = h3.cell_to_parent(cell, parent_resolution)
+            if cell in cells:
+                result.append(poi)
+        except Exception:
+            continue
+    return result
+
+
+def patch_hexagons(output: dict, cells: set, fresh: dict, resolution: int) -> dict:
+    """
+    Replace the hexagons of `cells` in an optimized heatmap.
+
+    `fresh` maps cell -> optimized hexagon for cells that still have POIs;
+    affected cells missing from it are dropped. Hexagons are matched by
+    their (rounded) center, which maps back to the same cell.
+    """
+    kept = [
+        hexagon for hexagon in output['hexagons']
+        if h3.latlng_to_cell(hexagon['lat'], hexagon['lng'], resolution) not in cells
+    ]
+    output['hexagons'] = kept + [fresh[cell] for cell in sorted(fresh)]
+    output['meta']['hex_count'] = len(output['hexagons'])
+    return output
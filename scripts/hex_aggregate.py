@@ -0,0 +1,417 @@
+"""
+Dense-array H3 aggregation engine.
+
+All POI coordinates are converted to H3 cells in one batch and the cell
+ids are factorized to dense row indices. Popular times are then reduced
+chunk by chunk with a sorted segment sum (np.add.reduceat) into fixed
+(hexes, types, 7, 24) arrays of sums and value counts, so overall and
+per-type averages both fall out of the same pass. Memory is
+O(hexes x types x 168) numbers whatever the number of POIs, and
+aggregates built from separate shards of the POIs merge into the same
+result as one pass over all of them.
+
+Optionally each hex also keeps a fixed-bin histogram of its values per
+(day, hour) (values are 0-100, QUANTILE_BINS bins), from which median and
+p90 intensities are interpolated. That adds a constant
+hexes x 168 x QUANTILE_BINS counts, however many POIs a cell holds.
+
+aggregate_pois_parallel() spreads the work over processes: POIs are
+sharded by H3 cell, so each shard owns a disjoint set of rows, and every
+worker scatter-adds its shard straight into one set of shared-memory
+arrays.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import h3
+except ImportError:
+    print("ERROR: h3 not installed. Run: pip install h3")
+    exit(1)
+
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
+# Integer-cell flavour of the h3 API (no str <-> int round trips per POI)
+import h3.api.basic_int as h3_int
+
+from h3_geometry import get_geometry_cache
+
+# Sums of uint8 values stay exact in float32 up to 2**24 (>160k POIs per cell)
+SUM_DTYPE = np.float32
+
+# Histogram bins over the 0-100 value range: exact zeros (closed venues, night
+# hours) get a bin of their own, then (0, 10], (10, 20], ... (90, 100]
+BIN_WIDTH = 10
+QUANTILE_BINS = 1 + 100 // BIN_WIDTH
+
+# POIs per histogram bincount (bounds its (cells, 168, bins) scratch array)
+HISTOGRAM_BATCH = 4096
+
+
+def latlng_to_cells(lats, lngs, resolution: int) -> np.ndarray:
+    """(N,) uint64 H3 cells of all points; 0 where the coordinates are invalid."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    valid = np.isfinite(lats) & np.isfinite(lngs) & (np.abs(lats) <= 90)
+
+    to_cell = h3_int.latlng_to_cell
+    cells = np.zeros(len(lats), dtype=np.uint64)
+    cells[valid] = np.fromiter(
+        (to_cell(lat, lng, resolution) for lat, lng in zip(lats[valid].tolist(), lngs[valid].tolist())),
+        dtype=np.uint64, count=int(valid.sum()))
+    return cells
+
+
+def factorize_cells(cells: np.ndarray) -> tuple:
+    """(unique cells, row of each point); invalid (0) cells get row -1."""
+    unique, rows = np.unique(cells, return_inverse=True)
+    if len(unique) and unique[0] == 0:
+        unique = unique[1:]
+        rows = rows - 1
+    return unique, rows.astype(np.intp)
+
+
+def factorize_types(poi_types) -> tuple:
+    """(sorted type names, column of each POI)."""
+    types, codes = np.unique(np.array(list(poi_types), dtype=object), return_inverse=True)
+    return tuple(types.tolist()), codes.astype(np.intp)
+
+
+class DenseAggregate:
+    """
+    Per-(hex, type, day, hour) sums and value counts.
+
+    Row r is the H3 cell cells[r] (sorted), column t the POI type types[t]
+    (sorted), as produced by factorize_cells() and factorize_types().
+    With quantiles, hist holds per-(hex, day, hour) value histograms.
+    """
+
+    __slots__ = ('cells', 'types', 'type_count', 'sums', 'counts', 'hist')
+
+    def __init__(self, cells: np.ndarray, types, quantiles: bool = False):
+        self.cells = cells
+        self.types = tuple(types)
+        shape = (len(cells), len(self.types))
+        self.type_count = np.zeros(shape, dtype=np.int64)
+        self.sums = np.zeros(shape + (7, 24), dtype=SUM_DTYPE)
+        self.counts = np.zeros(shape + (7, 24), dtype=np.int32)
+        self.hist = np.zeros((len(cells), 7, 24, QUANTILE_BINS), dtype=np.uint32) if quantiles else None
+
+    def __len__(self):
+        return len(self.cells)
+
+    @classmethod
+    def view(cls, cells: np.ndarray, types, type_count: np.ndarray, sums: np.ndarray,
+             counts: np.ndarray, hist: np.ndarray = None) -> 'DenseAggregate':
+        """Aggregate over existing arrays (e.g. in shared memory) instead of new zeroed ones."""
+        aggregate = cls.__new__(cls)
+        aggregate.cells = cells
+        aggregate.types = tuple(types)
+        aggregate.type_count = type_count
+        aggregate.sums = sums
+        aggregate.counts = counts
+        aggregate.hist = hist
+        return aggregate
+
+    def block(self, start: int, stop: int) -> 'DenseAggregate':
+        """Rows start:stop as an aggregate sharing this one's arrays."""
+        return DenseAggregate.view(self.cells[start:stop], self.types, self.type_count[start:stop],
+                                   self.sums[start:stop], self.counts[start:stop],
+                                   self.hist[start:stop] if self.hist is not None else None)
+
+    def add(self, rows: np.ndarray, codes: np.ndarray, grids: np.ndarray, present: np.ndarray = None):
+        """
+        Scatter-add a chunk of (n, 7, 24) grids into rows x codes.
+
+        present masks missing (day, hour) values (scraped data); rows of -1
+        are skipped.
+        """
+        keep = rows >= 0
+        if not keep.all():
+            rows, codes, grids = rows[keep], codes[keep], grids[keep]
+            present = present[keep] if present is not None else None
+        if not len(rows):
+            return
+        if self.hist is not None:
+            self._add_histogram(rows, grids, present)
+
+        # Segment-sum the chunk sorted by (row, type) instead of np.add.at
+        keys = rows * len(self.types) + codes
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        segment_keys = keys[starts]
+
+        flat_count = self.type_count.reshape(-1)
+        flat_sums = self.sums.reshape(-1, 7, 24)
+        flat_counts = self.counts.reshape(-1, 7, 24)
+
+        flat_count[segment_keys] += np.diff(np.r_[starts, len(keys)])
+        grids = grids[order]
+        if present is None:
+            flat_sums[segment_keys] += np.add.reduceat(grids, starts, axis=0, dtype=SUM_DTYPE)
+            flat_counts[segment_keys] += np.diff(np.r_[starts, len(keys)]).astype(np.int32)[:, None, None]
+        else:
+            present = present[order]
+            flat_sums[segment_keys] += np.add.reduceat(np.where(present, grids, 0), starts, axis=0,
+                                                       dtype=SUM_DTYPE)
+            flat_counts[segment_keys] += np.add.reduceat(present, starts, axis=0, dtype=np.int32)
+
+    def _add_histogram(self, rows: np.ndarray, grids: np.ndarray, present: np.ndarray = None):
+        """Count each value into its bin, one bincount per batch of POIs."""
+        bins = np.clip(np.ceil(grids / BIN_WIDTH), 0, QUANTILE_BINS - 1).astype(np.intp)
+        slots = np.arange(7 * 24)
+        for start in range(0, len(rows), HISTOGRAM_BATCH):
+            stop = start + HISTOGRAM_BATCH
+            cells, local = np.unique(rows[start:stop], return_inverse=True)
+            keys = (local[:, None] * (7 * 24) + slots) * QUANTILE_BINS + bins[start:stop].reshape(-1, 7 * 24)
+            if present is not None:
+                keys = keys[present[start:stop].reshape(-1, 7 * 24)]
+            counts = np.bincount(keys.ravel(), minlength=len(cells) * 7 * 24 * QUANTILE_BINS)
+            self.hist[cells] += counts.reshape(len(cells), 7, 24, QUANTILE_BINS).astype(np.uint32)
+
+    def merge(self, other: 'DenseAggregate') -> 'DenseAggregate':
+        """Aggregate of both shards (self, updated in place, if it covers the other's cells and types)."""
+        if (self.hist is None) != (other.hist is None):
+            raise ValueError("Cannot merge aggregates with and without quantile histograms")
+        if np.isin(other.cells, self.cells).all() and set(other.types) <= set(self.types):
+            merged = self
+        else:
+            types = tuple(sorted(set(self.types) | set(other.types)))
+            merged = DenseAggregate(np.union1d(self.cells, other.cells), types, self.hist is not None)
+            merged._add_block(self)
+        merged._add_block(other)
+        return merged
+
+    def _add_block(self, other: 'DenseAggregate'):
+        rows = np.searchsorted(self.cells, other.cells)
+        cols = np.array([self.types.index(t) for t in other.types], dtype=np.intp)
+        block = np.ix_(rows, cols)
+        self.type_count[block] += other.type_count
+        self.sums[block] += other.sums
+        self.counts[block] += other.counts
+        if self.hist is not None:
+            self.hist[rows] += other.hist
+
+    def to_parent(self, resolution: int) -> 'DenseAggregate':
+        """
+        The same data rolled up to a coarser H3 resolution.
+
+        Sums and value counts add up, so parent averages are weighted by
+        the number of values in each child.
+        """
+        to_parent = h3_int.cell_to_parent
+        parents = np.fromiter((to_parent(cell, resolution) for cell in self.cells.tolist()),
+                              dtype=np.uint64, count=len(self.cells))
+        unique, rows = np.unique(parents, return_inverse=True)
+        order = np.argsort(rows, kind='stable')
+        starts = np.flatnonzero(np.r_[True, np.diff(rows[order]) != 0])
+
+        parent = DenseAggregate(unique, self.types, self.hist is not None)
+        parent.type_count[:] = np.add.reduceat(self.type_count[order], starts, axis=0)
+        parent.sums[:] = np.add.reduceat(self.sums[order], starts, axis=0)
+        parent.counts[:] = np.add.reduceat(self.counts[order], starts, axis=0)
+        if self.hist is not None:
+            parent.hist[:] = np.add.reduceat(self.hist[order], starts, axis=0)
+        return parent
+
+    @property
+    def poi_count(self) -> np.ndarray:
+        """(H,) POIs per hexagon."""
+        return self.type_count.sum(axis=1)
+
+    def hour_means(self) -> np.ndarray:
+        """(H, 7, 24) averages over all types, 0 where no values were added."""
+        return _means(self.sums.sum(axis=1, dtype=np.float64), self.counts.sum(axis=1))
+
+    def quantile(self, q: float) -> np.ndarray:
+        """
+        (H, 7, 24) q-quantile of the values over all types, 0 where there are none.
+
+        Interpolated linearly inside the histogram bin holding the rank, so
+        it is exact to within one bin (BIN_WIDTH); a rank among the zeros is 0.
+        """
+        if self.hist is None:
+            raise ValueError("Aggregate was built without quantiles")
+        total = self.hist.sum(axis=-1)
+        cumulative = np.cumsum(self.hist, axis=-1)
+        rank = q * total
+        bin_index = np.minimum((cumulative < rank[..., None]).sum(axis=-1), QUANTILE_BINS - 1)[..., None]
+        in_bin = np.take_along_axis(self.hist, bin_index, axis=-1)[..., 0]
+        below = np.take_along_axis(cumulative, bin_index, axis=-1)[..., 0] - in_bin
+        fraction = np.divide(rank - below, in_bin, out=np.zeros(rank.shape), where=in_bin > 0)
+        bin_index = bin_index[..., 0]
+        return np.where((total > 0) & (bin_index > 0), (bin_index - 1 + fraction) * BIN_WIDTH, 0.0)
+
+    def type_means(self) -> np.ndarray:
+        """(H, T, 7, 24) per-type averages, 0 where a type has no values."""
+        return _means(self.sums.astype(np.float64), self.counts)
+
+    def cell_ids(self) -> list:
+        """H3 index strings of the rows."""
+        return [h3.int_to_str(cell) for cell in self.cells.tolist()]
+
+    def centers(self) -> np.ndarray:
+        """(H, 2) lat/lng of the hexagon centers (from the persistent geometry cache)."""
+        return get_geometry_cache().centers(self.cells)
+
+    def boundaries(self) -> list:
+        """Per hexagon, its boundary as a list of [lat, lng] vertices (from the persistent geometry cache)."""
+        return get_geometry_cache().boundaries(self.cells)
+
+    def poi_types(self) -> list:
+        """Per hexagon, the names of the types it contains."""
+        return [[self.types[t] for t in np.flatnonzero(row)] for row in self.type_count]
+
+
+def _means(sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    return np.divide(sums, counts, out=np.zeros(sums.shape), where=counts > 0)
+
+
+def intensity_lists(means: np.ndarray) -> list:
+    """(..., 7, 24) averages as nested lists rounded to 0.1, the frontend's 'i' form."""
+    return np.round(means, 1).tolist()
+
+
+def aggregate_pois(pois: list, grid_chunks, resolution: int, quantiles: bool = False) -> DenseAggregate:
+    """
+    Aggregate POIs (dicts with 'lat', 'lng', 'poi_type') by H3 cell and type.
+
+    grid_chunks yields the POIs' popular times in input order, one
+    (grids, present) pair per chunk: (n, 7, 24) values and a mask of the
+    values that exist (None when all do). With quantiles, per-hex value
+    histograms are kept as well.
+    """
+    cells = latlng_to_cells([poi['lat'] for poi in pois], [poi['lng'] for poi in pois], resolution)
+    unique, rows = factorize_cells(cells)
+    types, codes = factorize_types(poi['poi_type'] for poi in pois)
+
+    aggregate = DenseAggregate(unique, types, quantiles)
+    start = 0
+    for grids, present in grid_chunks:
+        stop = start + len(grids)
+        aggregate.add(rows[start:stop], codes[start:stop], grids, present)
+        start = stop
+    return aggregate
+
+
+# Shards per worker (smaller shards balance uneven areas better)
+SHARDS_PER_WORKER = 4
+
+# Below this many POIs the process pool costs more than it saves
+PARALLEL_MIN_POIS = 50_000
+
+
+def _shared_arrays(shapes: dict, names: dict = None) -> tuple:
+    """({field: SharedMemory}, {field: ndarray}) for {field: (shape, dtype)}; attach if names given."""
+    blocks, arrays = {}, {}
+    for field, (shape, dtype) in shapes.items():
+        size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        if names is None:
+            block = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # Attaching registers the block with this process's resource tracker, which
+            # unlinks whatever is still registered when its processes exit. The parent
+            # starts its tracker before creating the pool, so workers share it: the
+            # registration is a no-op (the tracker keeps a set of names) and the parent's
+            # unlink() removes it. Unregistering here would drop the parent's entry.
+            block = shared_memory.SharedMemory(name=names[field])
+        blocks[field] = block
+        arrays[field] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def _aggregate_shard(pois: list, rows: np.ndarray, codes: np.ndarray, grid_chunks,
+                     cells: np.ndarray, types: tuple, shapes: dict, names: dict):
+    """Worker: add one shard's popular times into the shared arrays (its rows only)."""
+    blocks, arrays = _shared_arrays(shapes, names)
+    aggregate = DenseAggregate.view(cells, types, arrays['type_count'], arrays['sums'], arrays['counts'],
+                                    arrays.get('hist'))
+    start = 0
+    for grids, present in grid_chunks(pois):
+        stop = start + len(grids)
+        aggregate.add(rows[start:stop], codes[start:stop], grids, present)
+        start = stop
+
+    # Drop the views before closing the mappings they point into
+    del aggregate, arrays
+    for block in blocks.values():
+        block.close()
+
+
+def shard_bounds(sorted_rows: np.ndarray, shards: int) -> list:
+    """Split points of row-sorted POIs into about `shards` parts, never inside one row."""
+    targets = np.linspace(0, len(sorted_rows), shards + 1).astype(np.intp)[1:-1]
+    cuts = np.searchsorted(sorted_rows, sorted_rows[targets], side='left') if len(sorted_rows) else []
+    return sorted({0, len(sorted_rows), *np.asarray(cuts).tolist()})
+
+
+def aggregate_pois_parallel(pois: list, grid_chunks, resolution: int, workers: int,
+                            quantiles: bool = False) -> DenseAggregate:
+    """
+    aggregate_pois() on `workers` processes, with identical results.
+
+    grid_chunks is a picklable function: grid_chunks(pois) yields the
+    (grids, present) chunks for a list of POIs. POIs are ordered by H3
+    cell and cut into shards at cell boundaries, and every worker adds
+    its shard straight into one set of shared-memory arrays. This takes
+    the place of per-shard partial arrays merged by a tree reduction: no
+    two workers ever touch the same row, so there is nothing to merge
+    and memory stays at one result instead of one per shard. Sums are
+    exact (integer values in float32), so the order of additions does
+    not change the output.
+    """
+    if workers <= 1 or len(pois) < PARALLEL_MIN_POIS:
+        return aggregate_pois(pois, grid_chunks(pois), resolution, quantiles)
+
+    lats = np.array([poi['lat'] for poi in pois], dtype=np.float64)
+    lngs = np.array([poi['lng'] for poi in pois], dtype=np.float64)
+    bounds = np.linspace(0, len(pois), workers + 1).astype(np.intp)
+
+    # Started before the pool forks, so the workers inherit it (see _shared_arrays)
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Cell conversion is the serial part of aggregate_pois; spread it too
+        cells = np.concatenate(list(pool.map(
+            latlng_to_cells, [lats[a:b] for a, b in zip(bounds, bounds[1:])],
+            [lngs[a:b] for a, b in zip(bounds, bounds[1:])], repeat(resolution))))
+        unique, rows = factorize_cells(cells)
+        types, codes = factorize_types(poi['poi_type'] for poi in pois)
+
+        shape = (len(unique), len(types))
+        shapes = {
+            'type_count': (shape, np.int64),
+            'sums': (shape + (7, 24), SUM_DTYPE),
+            'counts': (shape + (7, 24), np.int32),
+        }
+        if quantiles:
+            shapes['hist'] = ((len(unique), 7, 24, QUANTILE_BINS), np.uint32)
+        blocks, arrays = _shared_arrays(shapes)
+        try:
+            for field in arrays:
+                arrays[field].fill(0)
+            names = {field: block.name for field, block in blocks.items()}
+
+            order = np.argsort(rows, kind='stable')
+            sorted_rows = rows[order]
+            cuts = shard_bounds(sorted_rows, workers * SHARDS_PER_WORKER)
+            futures = [
+                pool.submit(_aggregate_shard, [pois[i] for i in order[a:b].tolist()], sorted_rows[a:b],
+                            codes[order[a:b]], grid_chunks, unique, types, shapes, names)
+                for a, b in zip(cuts, cuts[1:])
+            ]
+            for future in futures:
+                future.result()
+
+            return DenseAggregate.view(unique, types, *(arrays[field].copy() for field in shapes))
+        finally:
+            del arrays
+            for block in blocks.values():
+                block.close()
+                block.unlink()
@@ -0,0 +1,318 @@
+"""
+Shared asyncio HTTP client for Overpass and Nominatim.
+
+One event loop runs in a background thread and owns a pooled aiohttp
+session, so the synchronous scripts (and their worker threads) share
+kept-alive connections. Requests are limited to `concurrency` in flight,
+retried with exponential backoff on 429/5xx and transport errors, can be
+paced per host, and their latencies are recorded in per-endpoint
+histograms.
+
+Usage:
+    from http_client import get_client
+    response = get_client().get(url, params={...})
+    with get_client().stream('POST', url, data={...}) as response:
+        for chunk in response.iter_chunks():
+            ...
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+try:
+    import aiohttp
+except ImportError:
+    print("ERROR: aiohttp not installed. Run: pip install aiohttp")
+    exit(1)
+
+# Requests in flight at the same time (per process)
+CONCURRENCY = 4
+
+# Retries after the first attempt, with delays of 2, 4, 8, 16... seconds
+MAX_RETRIES = 4
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+
+# Statuses retried with backoff
+RETRY_STATUS = (429, 502, 503, 504)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+USER_AGENT = 'MapCircleViewer/1.0 (heatmap data scripts)'
+
+CHUNK_SIZE = 1 << 16
+
+
+class HttpError(Exception):
+    """Request failed at the transport level (connection, timeout) after all retries."""
+
+
+class Response:
+    """Fully read HTTP response."""
+
+    def __init__(self, status: int, headers: dict, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self) -> str:
+        return self.body.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class LatencyStats:
+    """Per-endpoint latency histograms (time until response headers)."""
+
+    def __init__(self):
+        self.endpoints = {}
+
+    def _entry(self, endpoint: str) -> dict:
+        return self.endpoints.setdefault(endpoint, {
+            'count': 0, 'total': 0.0, 'max': 0.0,
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        })
+
+    def record(self, endpoint: str, seconds: float):
+        entry = self._entry(endpoint)
+        entry['count'] += 1
+        entry['total'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                entry['buckets'][i] += 1
+                break
+        else:
+            entry['buckets'][-1] += 1
+
+    def merge(self, snapshot: dict):
+        """Add a snapshot() taken in another process."""
+        for endpoint, other in snapshot.items():
+            entry = self._entry(endpoint)
+            entry['count'] += other['count']
+            entry['total'] += other['total']
+            entry['max'] = max(entry['max'], other['max'])
+            entry['buckets'] = [a + b for a, b in zip(entry['buckets'], other['buckets'])]
+
+    def snapshot(self) -> dict:
+        return json.loads(json.dumps(self.endpoints))
+
+    def report(self):
+        """Print one histogram per endpoint."""
+        if not self.endpoints:
+            return
+        labels = [f"<={b}s" for b in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+        print("HTTP latency by endpoint:")
+        for endpoint, entry in sorted(self.endpoints.items()):
+            mean = entry['total'] / entry['count'] if entry['count'] else 0
+            print(f"  {endpoint}: {entry['count']} requests, "
+                  f"mean {mean:.2f}s, max {entry['max']:.2f}s")
+            for label, count in zip(labels, entry['buckets']):
+                if count:
+                    print(f"    {label:>8} {count:>6} {'#' * min(40, count)}")
+
+
+class StreamResponse:
+    """Response whose body is read chunk by chunk; close() frees the connection slot."""
+
+    def __init__(self, client: 'HttpClient', response):
+        self._client = client
+        self._response = response
+        self._closed = False
+        self.status = response.status
+        self.headers = dict(response.headers)
+
+    def iter_chunks(self, chunk_size: int = CHUNK_SIZE):
+        while True:
+            try:
+                chunk = self._client._run(self._response.content.read(chunk_size))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise HttpError(f"{self._response.url}: {e!r}") from e
+            if not chunk:
+                break
+            yield chunk
+
+    def read(self) -> bytes:
+        return b''.join(self.iter_chunks())
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._client._run(self._client._release(self._response))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HttpClient:
+    """Pooled aiohttp session driven from synchronous code."""
+
+    def __init__(self, concurrency: int = CONCURRENCY, max_retries: int = MAX_RETRIES):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.stats = LatencyStats()
+        self._min_interval = {}
+        self._next_slot = {}
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self._run(self._start())
+
+    async def _start(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+            headers={'User-Agent': USER_AGENT},
+        )
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def set_min_interval(self, url: str, seconds: float):
+        """Keep at least `seconds` between requests to the host of `url`."""
+        self._min_interval[urlsplit(url).netloc] = seconds
+
+    async def _pace(self, host: str):
+        interval = self._min_interval.get(host)
+        if not interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, 0.0))
+        self._next_slot[host] = slot + interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _backoff(self, attempt: int, retry_after) -> float:
+        if retry_after:
+            try:
+                return min(BACKOFF_MAX, float(retry_after))
+            except ValueError:
+                pass
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+        return delay * random.uniform(0.75, 1.25)
+
+    async def _open(self, method: str, url: str, timeout: float, retry_status: tuple, **kwargs):
+        """Send a request with retries; returns an unread response holding a semaphore slot."""
+        parts = urlsplit(url)
+        endpoint = f"{parts.netloc}{parts.path}"
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+
+        attempt = 0
+        while True:
+            await self._semaphore.acquire()
+            await self._pace(parts.netloc)
+            start = time.monotonic()
+            try:
+                response = await self._session.request(method, url, timeout=client_timeout, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._semaphore.release()
+                if attempt >= self.max_retries:
+                    raise HttpError(f"{method} {url}: {e!r}") from e
+                delay = self._backoff(attempt, None)
+                print(f"    {endpoint}: {e!r}, retrying in {delay:.0f}s...")
+            else:
+                self.stats.record(endpoint, time.monotonic() - start)
+                if response.status not in retry_status or attempt >= self.max_retries:
+                    return response
+                delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                print(f"    {endpoint}: HTTP {response.status}, retrying in {delay:.0f}s...")
+                await self._release(response)
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _release(self, response):
+        response.release()
+        self._semaphore.release()
+
+    async def _request(self, method: str, url: str, timeout: float, retry_status: tuple, **kwargs) -> Response:
+        response = await self._open(method, url, timeout, retry_status, **kwargs)
+        try:
+            body = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise HttpError(f"{method} {url}: {e!r}") from e
+        finally:
+            await self._release(response)
+        return Response(response.status, dict(response.headers), body)
+
+    def request(self, method: str, url: str, timeout: float = 60,
+                retry_status: tuple = RETRY_STATUS, **kwargs) -> Response:
+        """Send a request and read the whole body. kwargs go to aiohttp (data, params, headers)."""
+        return self._run(self._request(method, url, timeout, retry_status, **kwargs))
+
+    def get(self, url: str, **kwargs) -> Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Response:
+        return self.request('POST', url, **kwargs)
+
+    def stream(self, method: str, url: str, timeout: float = 60,
+               retry_status: tuple = RETRY_STATUS, **kwargs) -> StreamResponse:
+        """Send a request and return the response before reading its body."""
+        return StreamResponse(self, self._run(self._open(method, url, timeout, retry_status, **kwargs)))
+
+    def close(self):
+        self._run(self._session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+_client = None
+_client_pid = None
+
+# Serializes creation, so threads racing on first use (overpass_tiles) share one client
+_client_lock = threading.Lock()
+
+
+def _reset_client_lock():
+    # A fork copies the lock as it is; if another thread held it, the child could never take it
+    global _client_lock
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_client_lock)
+
+
+def get_client() -> HttpClient:
+    """Return this process's shared client (created on first use, again after fork)."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = HttpClient()
+                _client_pid = os.getpid()
+    return _client
+
+
+def take_latency_stats() -> dict:
+    """Snapshot and reset this process's latency histograms."""
+    if _client is None or _client_pid != os.getpid():
+        return {}
+    snapshot = _client.stats.snapshot()
+    _client.stats = LatencyStats()
+    return snapshot
+
+
+def print_latency_report():
+    """Print this process's latency histograms."""
+    if _client is not None and _client_pid == os.getpid():
+        _client.stats.report()
+
+
+@atexit.register
+def _close_client():
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
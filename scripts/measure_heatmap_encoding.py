@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Measure heatmap payload sizes per encoding.
+
+For every city heatmap in public/ prints the raw, gzip (level 9) and
+brotli (quality 11, if the brotli package is installed) sizes of the
+JSON, the plain binary and the packed binary encoding, and checks that
+the packed encoding decodes to the same hexagons as the plain one.
+
+Usage:
+    python measure_heatmap_encoding.py [--files heatmap_kyiv.json,heatmap_compact.json]
+"""
+
+import argparse
+import json
+import re
+from pathlib import Path
+
+from heatmap_binary import encode_heatmap, decode_heatmap, to_output
+from static_artifacts import compressed
+
+PUBLIC_DIR = Path(__file__).parent.parent / 'public'
+
+# City heatmaps and pyramid levels; not the index, manifests or content-hashed copies
+HEATMAP_FILE = re.compile(r'heatmap_(?!cities\b)(?!.*_pyramid\b)[a-z_0-9]+\.json')
+
+
+def sizes(data: bytes) -> tuple:
+    """(raw, gzip, brotli or None) sizes in bytes."""
+    variants = compressed(data)
+    return len(data), len(variants['.gz']), len(variants['.br']) if '.br' in variants else None
+
+
+def same_hexagons(plain: bytes, packed: bool) -> bool:
+    key = lambda hexagon: (hexagon['lat'], hexagon['lng'])
+    return (sorted(to_output(*decode_heatmap(plain))['hexagons'], key=key)
+            == sorted(to_output(*decode_heatmap(packed))['hexagons'], key=key))
+
+
+def kb(size) -> str:
+    return f"{size / 1024:9.1f}" if size is not None else f"{'-':>9}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure heatmap payload sizes per encoding')
+    parser.add_argument('--files', type=str, default='',
+                        help='Comma-separated file names in public/ (default: all city heatmaps)')
+    args = parser.parse_args()
+
+    if args.files:
+        paths = [PUBLIC_DIR / name.strip() for name in args.files.split(',')]
+    else:
+        paths = sorted(p for p in PUBLIC_DIR.glob('heatmap_*.json') if HEATMAP_FILE.fullmatch(p.name))
+
+    print(f"{'file':<28} {'encoding':<8} {'raw KB':>9} {'gzip KB':>9} {'brotli KB':>9}")
+    totals = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        output = json.loads(data)
+        if 'hexagons' not in output:
+            continue
+
+        encodings = {
+            'json': data,
+            'binary': encode_heatmap(output),
+            'packed': encode_heatmap(output, packed=True),
+        }
+        for name, encoded in encodings.items():
+            raw, gz, br = sizes(encoded)
+            print(f"{path.name:<28} {name:<8} {kb(raw)} {kb(gz)} {kb(br)}")
+            total = totals.setdefault(name, [0, 0, 0])
+            total[0] += raw
+            total[1] += gz
+            total[2] = total[2] + br if br is not None and total[2] is not None else None
+
+        if not same_hexagons(encodings['binary'], encodings['packed']):
+            print(f"  WARNING: packed encoding of {path.name} does not round-trip")
+
+    print()
+    for name, (raw, gz, br) in totals.items():
+        print(f"{'total':<28} {name:<8} {kb(raw)} {kb(gz)} {kb(br)}")
+
+
+if __name__ == '__main__':
+    main()
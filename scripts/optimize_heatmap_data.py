@@ -2,16 +2,32 @@
 """
 Optimize heatmap data for frontend.
 
-Creates a compact JSON format that's faster to load and process.
+Creates a compact JSON format that's faster to load and process. The
+hexagons are aggregated straight from the popular times data into dense
+arrays (hex_aggregate), so the intensities are rounded and laid out in
+one vectorized step instead of walking the nested per-hour dicts.
+
+Usage:
+    python optimize_heatmap_data.py [--binary]
 """
 
+import argparse
 import json
 from datetime import datetime
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
+from aggregate_h3_heatmap import INPUT_FILE, load_popular_times, aggregate_dense
+from hex_aggregate import intensity_lists
+from heatmap_binary import write_heatmap_binary
+
 SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / 'data'
-INPUT_FILE = DATA_DIR / 'kyiv_heatmap_h3.json'
 OUTPUT_FILE = DATA_DIR / 'kyiv_heatmap_optimized.json'
 
 # Also copy to public folder for frontend
@@ -19,12 +35,22 @@ PUBLIC_FILE = SCRIPT_DIR.parent / 'public' / 'heatmap_data.json'
 
 
 def main():
-    print("Loading full heatmap data...")
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    parser = argparse.ArgumentParser(description='Optimize heatmap data for the frontend')
+    parser.add_argument('--binary', action='store_true',
+                        help='Also write the columnar binary format (heatmap_compact.bin)')
+    args = parser.parse_args()
 
-    hexagons = data['hexagons']
-    print(f"  Loaded {len(hexagons)} hexagons")
+    if not INPUT_FILE.exists():
+        print(f"ERROR: Input file not found: {INPUT_FILE}")
+        print("Run scrape_popular_times.py first!")
+        return
+
+    print("Loading popular times data...")
+    pois = load_popular_times()
+    print(f"  Loaded {len(pois)} POIs")
+
+    aggregate = aggregate_dense(pois)
+    print(f"  Aggregated into {len(aggregate)} hexagons")
 
     # Create optimized format:
     # {
@@ -35,51 +61,25 @@ def main():
     #     'restaurant': [ [hex0_intensity_168], [hex1_intensity_168], ... ]
     #   }
     # }
+    all_types = aggregate.types
+    centers = np.round(aggregate.centers(), 5).tolist()
 
-    optimized_hexagons = []
-    types_intensity = {}  # poi_type -> list of hex intensities
-
-    # Get all unique types
-    all_types = set()
-    for hex_data in hexagons.values():
-        all_types.update(hex_data['poi_types'])
-
-    for poi_type in all_types:
-        types_intensity[poi_type] = []
-
-    for h3_index, hex_data in hexagons.items():
-        # Compact intensity: 7 arrays of 24 values each
-        intensity = []
-        for day in range(7):
-            day_hours = []
-            for hour in range(24):
-                day_hours.append(round(hex_data['hours'][str(day)][str(hour)], 1))
-            intensity.append(day_hours)
-
-        optimized_hexagons.append({
+    optimized_hexagons = [
+        {
             'h3': h3_index,
-            'lat': round(hex_data['lat'], 5),
-            'lng': round(hex_data['lng'], 5),
-            'n': hex_data['poi_count'],  # short name for size
-            't': hex_data['poi_types'],  # short name for size
+            'lat': lat,
+            'lng': lng,
+            'n': count,  # short name for size
+            't': types,  # short name for size
             'i': intensity  # 7 x 24 = 168 values
-        })
-
-        # Per-type intensity
-        for poi_type in all_types:
-            type_intensity = []
-            if poi_type in hex_data['by_type']:
-                for day in range(7):
-                    day_hours = []
-                    for hour in range(24):
-                        val = hex_data['by_type'][poi_type]['hours'][str(day)][str(hour)]
-                        day_hours.append(round(val, 1))
-                    type_intensity.append(day_hours)
-            else:
-                # No data for this type in this hex
-                type_intensity = [[0] * 24 for _ in range(7)]
-
-            types_intensity[poi_type].append(type_intensity)
+        }
+        for h3_index, (lat, lng), count, types, intensity in zip(
+            aggregate.cell_ids(), centers, aggregate.poi_count.tolist(), aggregate.poi_types(),
+            intensity_lists(aggregate.hour_means()))
+    ]
+
+    # Per-type intensity (zeros where a hex has no POI of the type)
+    types_intensity = dict(zip(all_types, intensity_lists(aggregate.type_means().swapaxes(0, 1))))
 
     output = {
         'meta': {
@@ -132,10 +132,19 @@ def main():
     compact_size = compact_file.stat().st_size / 1024 / 1024
     print(f"  Size: {compact_size:.2f} MB")
 
+    if args.binary:
+        # Same hexagons as typed-array columns (see heatmap_binary.py)
+        binary_file = compact_file.with_suffix('.bin')
+        print(f"Saving binary version: {binary_file}...")
+        binary_size = write_heatmap_binary(compact, binary_file) / 1024 / 1024
+        print(f"  Size: {binary_size:.2f} MB")
+
     print()
     print("Done!")
     print(f"  Full data: {file_size:.2f} MB")
     print(f"  Compact (no types): {compact_size:.2f} MB")
+    if args.binary:
+        print(f"  Binary (no types): {binary_size:.2f} MB")
 
 
 if __name__ == '__main__':
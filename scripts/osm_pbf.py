@@ -0,0 +1,440 @@
+"""
+Offline POI extraction from an OpenStreetMap .osm.pbf extract.
+
+An alternative to Overpass for national-scale refreshes: reads a local
+extract (e.g. ukraine-latest.osm.pbf) and produces the same POI records
+that generate_all_heatmaps.collect_pois_for_city builds from Overpass,
+for every configured city in one pass over the file.
+
+The file is decoded in two parallel passes over its data blocks:
+1. every block: tagged nodes and ways are classified with the compiled
+   tag index; matching nodes inside a city bbox become POIs directly,
+   matching ways are kept with their node refs;
+2. node blocks only: coordinates are looked up for the way refs, then
+   each way gets the bbox center of its nodes (same as Overpass
+   `out center`) and is assigned to every city it touches.
+
+Packed varint arrays are decoded with NumPy; only tagged candidates are
+handled in Python.
+"""
+
+import lzma
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
+from overpass import classify_tags
+
+# Blocks handed to a worker at once
+CHUNKSIZE = 8
+
+
+# ---------------------------------------------------------------------------
+# Protobuf wire format
+# ---------------------------------------------------------------------------
+
+def read_varint(buf, pos: int) -> tuple:
+    """Decode one varint at pos; returns (value, new_pos)."""
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def to_signed(value: int) -> int:
+    """Reinterpret a decoded (u)int64 varint as int64."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def iter_fields(buf):
+    """Yield (field_number, value) for a protobuf message; bytes fields are memoryviews."""
+    buf = memoryview(buf)
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = read_varint(buf, pos)
+        elif wire == 2:
+            length, pos = read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire == 1:
+            value = buf[pos:pos + 8]
+            pos += 8
+        elif wire == 5:
+            value = buf[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire}")
+        yield field, value
+
+
+def decode_packed(buf) -> np.ndarray:
+    """Decode a packed repeated varint field into a uint64 array."""
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if data.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    # Bit shift of every byte within its own varint
+    owner = np.repeat(np.arange(ends.size), ends - starts + 1)
+    shift = ((np.arange(data.size) - starts[owner]) * 7).astype(np.uint64)
+    parts = (data & 0x7f).astype(np.uint64) << shift
+    return np.add.reduceat(parts, starts)
+
+
+def zigzag(values: np.ndarray) -> np.ndarray:
+    """Decode zigzag-encoded sint64 values."""
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+# ---------------------------------------------------------------------------
+# File and block structure
+# ---------------------------------------------------------------------------
+
+def scan_blobs(path) -> list:
+    """Return (offset, length) of every OSMData blob in the file."""
+    blobs = []
+    with open(path, 'rb') as f:
+        while True:
+            raw = f.read(4)
+            if len(raw) < 4:
+                break
+            (header_len,) = struct.unpack('>I', raw)
+
+            blob_type = None
+            data_size = 0
+            for field, value in iter_fields(f.read(header_len)):
+                if field == 1:
+                    blob_type = bytes(value).decode('utf-8')
+                elif field == 3:
+                    data_size = value
+
+            offset = f.tell()
+            if blob_type == 'OSMData':
+                blobs.append((offset, data_size))
+            f.seek(offset + data_size)
+    return blobs
+
+
+def read_block(path, offset: int, length: int) -> bytes:
+    """Read and decompress one blob."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        blob = f.read(length)
+
+    for field, value in iter_fields(blob):
+        if field == 1:
+            return bytes(value)
+        if field == 3:
+            return zlib.decompress(value)
+        if field == 4:
+            return lzma.decompress(value)
+        if field in (5, 6, 7):
+            raise ValueError(f"Unsupported PBF blob compression (field {field})")
+    return b''
+
+
+class Block:
+    """A decoded PrimitiveBlock: string table, coordinate transform and raw groups."""
+
+    def __init__(self, data: bytes):
+        self.strings = []
+        self.groups = []
+        self.granularity = 100
+        self.lat_offset = 0
+        self.lon_offset = 0
+
+        for field, value in iter_fields(data):
+            if field == 1:
+                self.strings = [bytes(s).decode('utf-8', errors='replace')
+                                for f, s in iter_fields(value) if f == 1]
+            elif field == 2:
+                self.groups.append(value)
+            elif field == 17:
+                self.granularity = value
+            elif field == 19:
+                self.lat_offset = to_signed(value)
+            elif field == 20:
+                self.lon_offset = to_signed(value)
+
+    def to_degrees(self, lat: np.ndarray, lon: np.ndarray) -> tuple:
+        return ((self.lat_offset + self.granularity * lat) * 1e-9,
+                (self.lon_offset + self.granularity * lon) * 1e-9)
+
+    def tags(self, keys, vals) -> dict:
+        return {self.strings[k]: self.strings[v] for k, v in zip(keys, vals)}
+
+
+def iter_dense_nodes(block: Block, dense) -> tuple:
+    """Decode DenseNodes into (ids, lats, lons, keys_vals)."""
+    ids = lats = lons = None
+    keys_vals = np.zeros(0, dtype=np.int64)
+    for field, value in iter_fields(dense):
+        if field == 1:
+            ids = np.cumsum(zigzag(decode_packed(value)))
+        elif field == 8:
+            lats = np.cumsum(zigzag(decode_packed(value)))
+        elif field == 9:
+            lons = np.cumsum(zigzag(decode_packed(value)))
+        elif field == 10:
+            keys_vals = decode_packed(value).astype(np.int64)
+    if ids is None:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, np.zeros(0), np.zeros(0), keys_vals
+    lats, lons = block.to_degrees(lats, lons)
+    return ids, lats, lons, keys_vals
+
+
+def parse_node(node) -> tuple:
+    """Decode a plain (non-dense) Node into (id, lat, lon, keys, vals)."""
+    node_id = lat = lon = 0
+    keys, vals = [], []
+    for field, value in iter_fields(node):
+        if field == 1:
+            node_id = zigzag(np.array([value], dtype=np.uint64))[0]
+        elif field == 2:
+            keys = decode_packed(value).tolist()
+        elif field == 3:
+            vals = decode_packed(value).tolist()
+        elif field == 8:
+            lat = zigzag(np.array([value], dtype=np.uint64))[0]
+        elif field == 9:
+            lon = zigzag(np.array([value], dtype=np.uint64))[0]
+    return int(node_id), lat, lon, keys, vals
+
+
+def in_any_bbox(lats: np.ndarray, lons: np.ndarray, bboxes: dict) -> np.ndarray:
+    mask = np.zeros(lats.shape, dtype=bool)
+    for south, west, north, east in bboxes.values():
+        mask |= (lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)
+    return mask
+
+
+# ---------------------------------------------------------------------------
+# Pass 1: classify tagged nodes and ways
+# ---------------------------------------------------------------------------
+
+_path = None
+_tag_index = None
+_bboxes = None
+_needed_ids = None
+
+
+def _init_scan(path, tag_index: dict, bboxes: dict):
+    global _path, _tag_index, _bboxes
+    _path = path
+    _tag_index = tag_index
+    _bboxes = bboxes
+
+
+def _poi(osm_type: str, osm_id: int, tags: dict, category: str, lat: float, lng: float) -> dict:
+    return {
+        'osm_id': f"{osm_type}/{osm_id}",
+        'name': tags.get('name', f"POI {osm_id}"),
+        'lat': round(lat, 7),
+        'lng': round(lng, 7),
+        'poi_type': category,
+    }
+
+
+def _scan_dense(block: Block, dense, key_ids: np.ndarray, pois: list) -> bool:
+    ids, lats, lons, keys_vals = iter_dense_nodes(block, dense)
+    if ids.size == 0 or keys_vals.size == 0:
+        return ids.size > 0
+
+    # keys_vals is k1 v1 k2 v2 ... 0 per node; find nodes with a relevant key
+    ends = np.flatnonzero(keys_vals == 0)
+    owner = np.searchsorted(ends, np.arange(keys_vals.size))
+    seg_start = np.concatenate(([0], ends[:-1] + 1))[np.minimum(owner, ends.size - 1)]
+    is_key = (keys_vals != 0) & ((np.arange(keys_vals.size) - seg_start) % 2 == 0)
+    candidates = np.unique(owner[is_key & np.isin(keys_vals, key_ids)])
+    candidates = candidates[in_any_bbox(lats[candidates], lons[candidates], _bboxes)]
+
+    for i in candidates:
+        start = 0 if i == 0 else ends[i - 1] + 1
+        kv = keys_vals[start:ends[i]]
+        tags = block.tags(kv[0::2], kv[1::2])
+        category = classify_tags(tags, _tag_index)
+        if category:
+            pois.append(_poi('node', int(ids[i]), tags, category, float(lats[i]), float(lons[i])))
+    return True
+
+
+def _scan_blob(blob: tuple) -> tuple:
+    """Returns (node POIs, [(way_id, tags, category, refs)], block has nodes)."""
+    block = Block(read_block(_path, *blob))
+    key_ids = np.array([i for i, s in enumerate(block.strings) if s in _tag_index], dtype=np.int64)
+
+    pois = []
+    ways = []
+    has_nodes = False
+    if key_ids.size == 0:
+        # No relevant tag key in this block; still note whether it holds nodes
+        for group in block.groups:
+            if any(field in (1, 2) for field, _ in iter_fields(group)):
+                has_nodes = True
+        return pois, ways, has_nodes
+
+    for group in block.groups:
+        for field, value in iter_fields(group):
+            if field == 2:
+                has_nodes |= _scan_dense(block, value, key_ids, pois)
+            elif field == 1:
+                has_nodes = True
+                node_id, lat, lon, keys, vals = parse_node(value)
+                tags = block.tags(keys, vals)
+                category = classify_tags(tags, _tag_index)
+                if category:
+                    lat, lon = block.to_degrees(np.array([lat]), np.array([lon]))
+                    if in_any_bbox(lat, lon, _bboxes)[0]:
+                        pois.append(_poi('node', node_id, tags, category, float(lat[0]), float(lon[0])))
+            elif field == 3:
+                way_id = 0
+                keys, vals, refs = [], [], None
+                for wfield, wvalue in iter_fields(value):
+                    if wfield == 1:
+                        way_id = wvalue
+                    elif wfield == 2:
+                        keys = decode_packed(wvalue).tolist()
+                    elif wfield == 3:
+                        vals = decode_packed(wvalue).tolist()
+                    elif wfield == 8:
+                        refs = wvalue
+                if not keys:
+                    continue
+                tags = block.tags(keys, vals)
+                category = classify_tags(tags, _tag_index)
+                if category and refs is not None:
+                    ways.append((way_id, tags, category, np.cumsum(zigzag(decode_packed(refs)))))
+
+    return pois, ways, has_nodes
+
+
+# ---------------------------------------------------------------------------
+# Pass 2: coordinates of way nodes
+# ---------------------------------------------------------------------------
+
+def _init_lookup(path, needed_ids: np.ndarray):
+    global _path, _needed_ids
+    _path = path
+    _needed_ids = needed_ids
+
+
+def _lookup_blob(blob: tuple) -> tuple:
+    """Return (ids, lats, lons) of the needed nodes stored in one block."""
+    block = Block(read_block(_path, *blob))
+    found = []
+
+    for group in block.groups:
+        for field, value in iter_fields(group):
+            if field == 2:
+                ids, lats, lons, _ = iter_dense_nodes(block, value)
+            elif field == 1:
+                node_id, lat, lon, _, _ = parse_node(value)
+                ids = np.array([node_id], dtype=np.int64)
+                lats, lons = block.to_degrees(np.array([lat]), np.array([lon]))
+            else:
+                continue
+            if ids.size == 0:
+                continue
+            pos = np.minimum(np.searchsorted(_needed_ids, ids), _needed_ids.size - 1)
+            mask = _needed_ids[pos] == ids
+            found.append((ids[mask], lats[mask], lons[mask]))
+
+    if not found:
+        empty = np.zeros(0)
+        return np.zeros(0, dtype=np.int64), empty, empty
+    return tuple(np.concatenate(parts) for parts in zip(*found))
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def extract_pois(path, tag_index: dict, bboxes: dict, workers: int = None) -> dict:
+    """
+    Extract POIs for several cities from one .osm.pbf file.
+
+    tag_index is an overpass.compile_tag_index() table, bboxes maps
+    city key -> (south, west, north, east). Returns {city_key: [poi, ...]}
+    with the same records and category precedence as the Overpass path.
+    """
+    workers = workers or os.cpu_count()
+    blobs = scan_blobs(path)
+    print(f"  {path}: {len(blobs)} data blocks, {workers} workers")
+
+    node_pois = []
+    ways = []
+    node_blobs = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan,
+                             initargs=(path, tag_index, bboxes)) as pool:
+        for blob, (pois, block_ways, has_nodes) in zip(blobs, pool.map(_scan_blob, blobs, chunksize=CHUNKSIZE)):
+            node_pois.extend(pois)
+            ways.extend(block_ways)
+            if has_nodes:
+                node_blobs.append(blob)
+    print(f"    Pass 1: {len(node_pois)} node POIs, {len(ways)} candidate ways")
+
+    needed = np.unique(np.concatenate([refs for _, _, _, refs in ways])) if ways else np.zeros(0, dtype=np.int64)
+    node_ids = np.zeros(0, dtype=np.int64)
+    node_lats = node_lons = np.zeros(0)
+    if needed.size:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_lookup,
+                                 initargs=(path, needed)) as pool:
+            parts = list(pool.map(_lookup_blob, node_blobs, chunksize=CHUNKSIZE))
+        node_ids, order = np.unique(np.concatenate([p[0] for p in parts]), return_index=True)
+        node_lats = np.concatenate([p[1] for p in parts])[order]
+        node_lons = np.concatenate([p[2] for p in parts])[order]
+    print(f"    Pass 2: {node_ids.size} of {needed.size} way nodes located")
+
+    result = {city_key: [] for city_key in bboxes}
+    seen_ids = set()
+
+    for poi in node_pois:
+        if poi['osm_id'] in seen_ids:
+            continue
+        seen_ids.add(poi['osm_id'])
+        for city_key, (south, west, north, east) in bboxes.items():
+            if south <= poi['lat'] <= north and west <= poi['lng'] <= east:
+                result[city_key].append(dict(poi))
+
+    for way_id, tags, category, refs in ways:
+        if node_ids.size == 0:
+            break
+        if f"way/{way_id}" in seen_ids:
+            continue
+        seen_ids.add(f"way/{way_id}")
+        pos = np.minimum(np.searchsorted(node_ids, refs), node_ids.size - 1)
+        known = node_ids[pos] == refs
+        if not known.any():
+            continue
+        lats = node_lats[pos[known]]
+        lons = node_lons[pos[known]]
+        center_lat = float(lats.min() + lats.max()) / 2
+        center_lng = float(lons.min() + lons.max()) / 2
+
+        for city_key, (south, west, north, east) in bboxes.items():
+            inside = (lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)
+            if inside.any():
+                result[city_key].append(_poi('way', way_id, tags, category, center_lat, center_lng))
+
+    return result
@@ -0,0 +1,214 @@
+"""
+Shared helpers for Overpass API (OpenStreetMap) queries.
+
+Builds single union queries for a whole set of POI categories and maps
+returned elements back to a category locally, so a city can be collected
+with one round trip instead of one request per tag.
+
+All scripts send their queries through post_query() or iter_query(), which
+serve repeated queries from the on-disk OverpassCache and send the rest
+through the shared pooled HTTP client (retries/backoff on 429 and 5xx).
+iter_query() parses the response incrementally, so large results never
+sit in memory whole.
+"""
+
+import json
+
+from http_client import get_client
+from overpass_cache import OverpassCache
+from overpass_stream import CHUNK_SIZE, ElementParser, iter_elements, iter_file_chunks
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+# Response cache shared by every query in this process
+_cache = OverpassCache()
+
+
+class OverpassError(Exception):
+    """Overpass request failed (status_code is None for offline cache misses)."""
+
+    def __init__(self, status_code, message: str = ''):
+        super().__init__(f"HTTP {status_code}" if status_code else message)
+        self.status_code = status_code
+        self.message = message
+
+
+class OverpassRuntimeError(OverpassError):
+    """Overpass aborted the query (e.g. timeout or out of memory); results are truncated."""
+
+    def __init__(self, remark: str):
+        super().__init__(None, remark)
+
+
+def configure_cache(offline: bool = False, enabled: bool = True, **kwargs):
+    """
+    Configure the response cache for this process.
+
+    offline=True serves only cached responses (ignoring TTL) and never
+    touches the network; enabled=False bypasses the cache entirely.
+    """
+    global _cache
+    _cache = OverpassCache(offline=offline, **kwargs) if enabled else None
+
+
+def post_query(query: str, timeout: int = 180, throttle=None) -> dict:
+    """
+    Run an Overpass query and return the decoded JSON response.
+
+    Cached responses are returned without a network round trip; `throttle`
+    (if given) is called only before real requests.
+    Raises OverpassError on non-200 responses and offline cache misses,
+    http_client.HttpError on connection failures.
+    """
+    if _cache is not None:
+        body = _cache.get(query)
+        if body is not None:
+            return json.loads(body)
+        if _cache.offline:
+            raise OverpassError(None, 'not in cache (offline mode)')
+
+    if throttle:
+        throttle()
+
+    response = get_client().post(OVERPASS_URL, data={'data': query}, timeout=timeout)
+    if response.status != 200:
+        raise OverpassError(response.status, response.text)
+
+    data = response.json()
+
+    # Runtime errors (e.g. query timeout) come back as 200 with partial
+    # results and a remark; never cache those
+    if _cache is not None and not _is_runtime_error(data.get('remark')):
+        _cache.put(query, response.body)
+    return data
+
+
+def _is_runtime_error(remark: str) -> bool:
+    return 'error' in (remark or '').lower()
+
+
+def iter_query(query: str, timeout: int = 180, throttle=None, strict: bool = False):
+    """
+    Run an Overpass query and yield its elements one by one.
+
+    The response body is streamed through ElementParser (and, on a cache
+    miss, into the cache at the same time), so peak memory does not grow
+    with the size of the result. Raises OverpassError like post_query();
+    with strict=True a truncated result (runtime error remark) raises
+    OverpassRuntimeError after its elements have been yielded.
+    """
+    if _cache is not None:
+        f = _cache.open(query)
+        if f is not None:
+            with f:
+                yield from iter_elements(iter_file_chunks(f))
+            return
+        if _cache.offline:
+            raise OverpassError(None, 'not in cache (offline mode)')
+
+    if throttle:
+        throttle()
+
+    with get_client().stream('POST', OVERPASS_URL, data={'data': query}, timeout=timeout) as response:
+        if response.status != 200:
+            raise OverpassError(response.status, response.read().decode('utf-8', errors='replace'))
+
+        writer = _cache.writer(query) if _cache is not None else None
+        parser = ElementParser()
+        try:
+            for chunk in response.iter_chunks(CHUNK_SIZE):
+                if writer:
+                    writer.write(chunk)
+                yield from parser.feed(chunk)
+            parser.close()
+        except BaseException:
+            if writer:
+                writer.discard()
+            raise
+
+    if _is_runtime_error(parser.remark):
+        if writer:
+            writer.discard()
+        if strict:
+            raise OverpassRuntimeError(parser.remark)
+    elif writer:
+        writer.commit()
+
+
+def bbox_to_str(bbox) -> str:
+    """Format a (south, west, north, east) bbox for Overpass QL."""
+    return f"{bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}"
+
+
+def split_tag(tag: str) -> tuple:
+    """Split 'key=value' into (key, value); value '*' means any value."""
+    key, value = tag.split('=', 1)
+    return key, value
+
+
+def compile_tag_index(categories: dict) -> dict:
+    """
+    Compile {category: ['key=value', ...]} into a lookup table.
+
+    Returns {key: {value: (rank, category)}} where value '*' is a wildcard.
+    Rank is the category's position in `categories`; when an element matches
+    several categories the lowest rank wins, the same result as fetching the
+    categories one by one in order and skipping already seen osm_ids.
+    """
+    index = {}
+    for rank, (category, tags) in enumerate(categories.items()):
+        for tag in tags:
+            key, value = split_tag(tag)
+            values = index.setdefault(key, {})
+            if value not in values:
+                values[value] = (rank, category)
+    return index
+
+
+def classify_tags(tags: dict, index: dict):
+    """Return the category for an element's tags, or None if nothing matches."""
+    best = None
+    for key, value in tags.items():
+        values = index.get(key)
+        if values is None:
+            continue
+        # An exact value and the key's wildcard can both match; the lower rank wins
+        for match in (values.get(value), values.get('*')):
+            if match and (best is None or match[0] < best[0]):
+                best = match
+    return best[1] if best else None
+
+
+def build_union_query(categories: dict, bbox, timeout: int = 180) -> str:
+    """Build one Overpass query that returns nodes and ways for all category tags."""
+    bbox_str = bbox_to_str(bbox)
+
+    statements = []
+    seen = set()
+    for tags in categories.values():
+        for tag in tags:
+            key, value = split_tag(tag)
+            selector = f'["{key}"]' if value == '*' else f'["{key}"="{value}"]'
+            if selector in seen:
+                continue
+            seen.add(selector)
+            statements.append(f'node{selector}({bbox_str});')
+            statements.append(f'way{selector}({bbox_str});')
+
+    body = '\n      '.join(statements)
+    return f"""
+    [out:json][timeout:{timeout}];
+    (
+      {body}
+    );
+    out center;
+    """
+
+
+def element_coords(element: dict):
+    """Return (lat, lng) of a node or the center of a way, or None."""
+    if element['type'] == 'node':
+        return element['lat'], element['lon']
+    if 'center' in element:
+        return element['center']['lat'], element['center']['lon']
+    return None
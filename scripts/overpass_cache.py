@@ -0,0 +1,165 @@
+"""
+On-disk cache for Overpass API responses.
+
+Entries are keyed by the SHA-256 of the normalized query text and stored
+gzip-compressed under data/cache/overpass/. Each entry has a sidecar
+.meta file with its expiry time; the sidecar's mtime doubles as the
+last-access time for LRU eviction once the cache exceeds its size budget.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).parent / 'data' / 'cache' / 'overpass'
+
+# Entries older than this are refetched (offline mode still serves them)
+DEFAULT_TTL = 20 * 3600
+
+# Total compressed size kept on disk before the least recently used entries go
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace so formatting differences map to the same entry."""
+    return ' '.join(query.split())
+
+
+def query_key(query: str) -> str:
+    """Content address of a query."""
+    return hashlib.sha256(normalize_query(query).encode('utf-8')).hexdigest()
+
+
+class OverpassCache:
+    """Compressed, size-bounded LRU cache of raw Overpass response bodies."""
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES, offline: bool = False):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+    def _paths(self, key: str) -> tuple:
+        return self.cache_dir / f'{key}.gz', self.cache_dir / f'{key}.meta'
+
+    def _read_meta(self, meta_path: Path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def open(self, query: str):
+        """Open a cached response body for streaming reads, or None on a miss."""
+        data_path, meta_path = self._paths(query_key(query))
+
+        meta = self._read_meta(meta_path)
+        if meta is None or not data_path.exists():
+            return None
+        if not self.offline and meta['expires'] < time.time():
+            return None
+
+        try:
+            f = gzip.open(data_path, 'rb')
+        except OSError:
+            return None
+
+        # Mark as recently used
+        os.utime(meta_path)
+        return f
+
+    def get(self, query: str):
+        """Return the cached response body, or None on a miss or expired entry."""
+        f = self.open(query)
+        if f is None:
+            return None
+        try:
+            with f:
+                return f.read()
+        except (OSError, EOFError):
+            return None
+
+    def writer(self, query: str, ttl: float = None) -> 'CacheWriter':
+        """Start a streaming write of a response body."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        return CacheWriter(self, query, self.ttl if ttl is None else ttl)
+
+    def put(self, query: str, body: bytes, ttl: float = None):
+        """Store a response body and evict old entries if over budget."""
+        writer = self.writer(query, ttl)
+        writer.write(body)
+        writer.commit()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes."""
+        entries = []
+        total = 0
+        for meta_path in self.cache_dir.glob('*.meta'):
+            data_path = meta_path.with_suffix('.gz')
+            try:
+                size = data_path.stat().st_size
+                last_used = meta_path.stat().st_mtime
+            except OSError:
+                continue
+            entries.append((last_used, size, data_path, meta_path))
+            total += size
+
+        entries.sort()
+        for _, size, data_path, meta_path in entries:
+            if total <= self.max_bytes:
+                break
+            for path in (meta_path, data_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total -= size
+
+
+class CacheWriter:
+    """
+    Streams a response body into a temporary compressed file.
+
+    commit() publishes the entry atomically; discard() drops it, so a
+    failed or partial download never becomes visible to readers.
+    """
+
+    def __init__(self, cache: OverpassCache, query: str, ttl: float):
+        self.cache = cache
+        self.query = query
+        self.ttl = ttl
+        self.data_path, self.meta_path = cache._paths(query_key(query))
+        self._tmp_path = self.data_path.with_name(f'{self.data_path.name}.{os.getpid()}.tmp')
+        self._file = gzip.open(self._tmp_path, 'wb')
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.data_path)
+
+        now = time.time()
+        meta = {
+            'query': normalize_query(self.query),
+            'created': now,
+            'expires': now + self.ttl,
+            'size': self.data_path.stat().st_size,
+        }
+        tmp_meta = self.meta_path.with_name(f'{self.meta_path.name}.{os.getpid()}.tmp')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_meta, self.meta_path)
+
+        self.cache.evict()
+
+    def discard(self):
+        self._file.close()
+        try:
+            self._tmp_path.unlink()
+        except OSError:
+            pass
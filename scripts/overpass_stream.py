@@ -0,0 +1,155 @@
+"""
+Incremental parser for Overpass API JSON responses.
+
+Overpass returns one top-level object whose "elements" array can run to
+hundreds of MB. ElementParser is fed the raw bytes chunk by chunk and
+yields the elements one at a time, so memory stays bounded by the largest
+single element instead of the whole response.
+"""
+
+import codecs
+import json
+
+# Read size for response bodies and cached files
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',]}'
+
+# Parser states
+_START, _KEY, _COLON, _VALUE, _ELEMENTS, _AFTER_VALUE, _DONE = range(7)
+
+
+class ElementParser:
+    """
+    Push parser for {"...": ..., "elements": [ {...}, ... ], "remark": ...}.
+
+    feed() returns the elements completed by the new chunk; other top-level
+    keys (version, osm3s, remark, ...) are kept in `header`.
+    """
+
+    def __init__(self):
+        self.header = {}
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._state = _START
+        self._key = None
+
+    @property
+    def remark(self) -> str:
+        """Overpass remark (set on runtime errors such as query timeouts)."""
+        return self.header.get('remark', '')
+
+    def _skip_ws(self):
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return buf[pos] if pos < len(buf) else None
+
+    def _decode(self):
+        """Decode one JSON value at the cursor, or return (False, None) if incomplete."""
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            return False, None
+        # A number or literal is only complete once a delimiter follows it
+        # ("0." decodes as 0 until the rest of "0.6" arrives)
+        if not isinstance(value, (dict, list, str)):
+            if end == len(self._buf) or self._buf[end] not in _DELIMITERS:
+                return False, None
+        self._pos = end
+        return True, value
+
+    def feed(self, chunk: bytes) -> list:
+        """Add a chunk of the response body and return newly completed elements."""
+        self._buf = self._buf[self._pos:] + self._text.decode(chunk)
+        self._pos = 0
+
+        elements = []
+        while True:
+            char = self._skip_ws()
+            if char is None:
+                break
+
+            if self._state == _START:
+                if char != '{':
+                    raise ValueError("Overpass response is not a JSON object")
+                self._pos += 1
+                self._state = _KEY
+
+            elif self._state == _KEY:
+                if char == '}':
+                    self._pos += 1
+                    self._state = _DONE
+                    continue
+                ok, key = self._decode()
+                if not ok:
+                    break
+                self._key = key
+                self._state = _COLON
+
+            elif self._state == _COLON:
+                if char != ':':
+                    raise ValueError("Malformed Overpass response")
+                self._pos += 1
+                self._state = _VALUE
+
+            elif self._state == _VALUE:
+                if self._key == 'elements' and char == '[':
+                    self._pos += 1
+                    self._state = _ELEMENTS
+                    continue
+                ok, value = self._decode()
+                if not ok:
+                    break
+                self.header[self._key] = value
+                self._state = _AFTER_VALUE
+
+            elif self._state == _ELEMENTS:
+                if char == ',':
+                    self._pos += 1
+                elif char == ']':
+                    self._pos += 1
+                    self._state = _AFTER_VALUE
+                else:
+                    ok, element = self._decode()
+                    if not ok:
+                        break
+                    elements.append(element)
+
+            elif self._state == _AFTER_VALUE:
+                if char not in ',}':
+                    raise ValueError("Malformed Overpass response")
+                self._pos += 1
+                self._state = _KEY if char == ',' else _DONE
+
+            else:
+                break
+
+        return elements
+
+    def close(self):
+        """Check that the whole response was consumed."""
+        self.feed(b'')
+        if self._state != _DONE:
+            raise ValueError("Truncated Overpass response")
+
+
+def iter_elements(chunks):
+    """Yield Overpass elements from an iterable of byte chunks."""
+    parser = ElementParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
+
+
+def iter_file_chunks(f, chunk_size: int = CHUNK_SIZE):
+    """Read a binary file object in chunks."""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
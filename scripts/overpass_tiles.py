@@ -0,0 +1,161 @@
+"""
+Adaptive bbox tiling for Overpass queries.
+
+Dense cities are too big for a single Overpass query: wildcard categories
+time out or come back truncated. fetch_tiled() splits a bbox into a grid
+of tiles, fetches them with bounded concurrency and recursively splits
+any tile that times out, is truncated or is still rate limited (429/504)
+after the HTTP client's own retries; other errors are raised at once.
+Elements are streamed to the caller as they are parsed and merged with
+osm_id dedup, since ways crossing a tile border are returned by every
+tile they touch.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from overpass import OverpassError, OverpassRuntimeError, bbox_to_str, iter_query
+
+# Tiles fetched at the same time (the HTTP client caps requests in flight too)
+MAX_WORKERS = 4
+
+# How many times a failing tile may be split into quarters
+MAX_DEPTH = 4
+
+# HTTP statuses that mean "query too expensive, try smaller"
+SPLIT_STATUS = (429, 504)
+
+# Elements parsed by the fetch threads but not yet consumed (bounds memory)
+QUEUE_SIZE = 4096
+
+# Marks the end of a tile's elements in the queue
+TILE_DONE = object()
+
+
+class TileFetchError(OverpassError):
+    """Some tiles still failed at the maximum split depth."""
+
+    def __init__(self, failed: list):
+        self.failed = failed
+        tiles = ', '.join(f"({bbox_to_str(bbox)}): {error}" for bbox, error in failed)
+        super().__init__(None, f"{len(failed)} tile(s) failed: {tiles}")
+
+
+def split_bbox(bbox, rows: int = 2, cols: int = 2) -> list:
+    """Split a (south, west, north, east) bbox into a rows x cols grid."""
+    south, west, north, east = bbox
+    lat_step = (north - south) / rows
+    lng_step = (east - west) / cols
+    # Rounded so tile queries (and their cache keys) are stable across runs
+    return [
+        (round(south + r * lat_step, 6), round(west + c * lng_step, 6),
+         round(south + (r + 1) * lat_step, 6), round(west + (c + 1) * lng_step, 6))
+        for r in range(rows)
+        for c in range(cols)
+    ]
+
+
+def should_split(error: Exception) -> bool:
+    """
+    Whether a failed tile is worth retrying as four smaller tiles.
+
+    Only "query too expensive" failures are: an Overpass runtime error
+    (timeout, out of memory) or a 429/504 left after the HTTP client's
+    retries. Anything else (a 4xx, an offline cache miss, a connection
+    failure) would fail the same way for every sub-tile.
+    """
+    if isinstance(error, OverpassRuntimeError):
+        return True
+    return isinstance(error, OverpassError) and error.status_code in SPLIT_STATUS
+
+
+def _put(results: queue.Queue, stop: threading.Event, item) -> bool:
+    """Put item on the bounded queue unless the consumer has stopped; returns False if it has."""
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def fetch_tile(build_query, bbox, depth: int, timeout: int, throttle,
+               results: queue.Queue, stop: threading.Event):
+    """
+    Stream one tile's elements into results, then (bbox, depth, TILE_DONE, error).
+
+    A truncated result raises OverpassRuntimeError after its elements,
+    which ends up as the error of the TILE_DONE item.
+    """
+    error = None
+    try:
+        for el in iter_query(build_query(bbox), timeout=timeout, throttle=throttle, strict=True):
+            if not _put(results, stop, (bbox, depth, el, None)):
+                return
+    except Exception as e:
+        error = e
+    _put(results, stop, (bbox, depth, TILE_DONE, error))
+
+
+def fetch_tiled(build_query, bbox, grid: int = 1, max_workers: int = MAX_WORKERS,
+                max_depth: int = MAX_DEPTH, timeout: int = 180, throttle=None):
+    """
+    Yield the merged, deduplicated elements of a tiled query.
+
+    build_query(bbox) returns the Overpass query for one tile. The bbox is
+    first split into grid x grid tiles; tiles that are too expensive are
+    quartered up to max_depth times. Elements are passed on as they are
+    parsed (through a bounded queue), so no tile is held in memory. The
+    elements a truncated tile already delivered are complete and kept;
+    its sub-tiles return them again and the osm_id dedup drops the
+    repeats, so nothing of the partial output is duplicated.
+
+    Errors that splitting cannot fix are raised immediately; tiles still
+    too expensive at max_depth raise TileFetchError after all other tiles
+    are yielded.
+    """
+    seen_ids = set()
+    failed = []
+    results = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = 0
+
+        def submit(tile, depth):
+            nonlocal running
+            running += 1
+            pool.submit(fetch_tile, build_query, tile, depth, timeout, throttle, results, stop)
+
+        try:
+            for tile in split_bbox(bbox, grid, grid):
+                submit(tile, 0)
+
+            while running:
+                tile, depth, el, error = results.get()
+                if el is not TILE_DONE:
+                    osm_id = f"{el['type']}/{el['id']}"
+                    if osm_id not in seen_ids:
+                        seen_ids.add(osm_id)
+                        yield el
+                    continue
+
+                running -= 1
+                if error is None:
+                    continue
+                if not should_split(error):
+                    raise error
+                if depth < max_depth:
+                    print(f"    Tile ({bbox_to_str(tile)}): {error} - splitting")
+                    for sub in split_bbox(tile):
+                        submit(sub, depth + 1)
+                else:
+                    failed.append((tile, error))
+        finally:
+            # Lets the fetch threads return if the caller stopped early or an error is raised
+            stop.set()
+
+    if failed:
+        raise TileFetchError(failed)
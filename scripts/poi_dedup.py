@@ -0,0 +1,108 @@
+"""
+Spatial deduplication of POIs.
+
+The same place often appears several times: as a node and as a building
+way, or once per source. Dedup by osm_id misses these, so POIs are also
+merged when they lie within `max_distance_m` of each other and their
+names are similar enough.
+
+Candidate pairs come from a grid with cells as large as the distance
+threshold, so only the 3x3 neighbourhood of each POI is compared
+(roughly linear in the number of POIs). Each grid row has its own cell
+width in longitude, taken at the row's poleward edge, so cells stay at
+least the threshold wide however far apart the input latitudes are
+(e.g. all cities at once). Merges are transitive
+(union-find); each group keeps its first POI in input order, so callers
+keep their category precedence.
+"""
+
+import math
+import re
+from difflib import SequenceMatcher
+
+# POIs closer than this may be the same place (meters)
+DEFAULT_DISTANCE_M = 50
+
+# Minimum difflib ratio between normalized names
+DEFAULT_SIMILARITY = 0.8
+
+METERS_PER_DEGREE = 111320
+
+# Names the collectors use when an object has none; never merged
+_PLACEHOLDER = re.compile(r'^(poi \d+|unknown)?$')
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_name(name) -> str:
+    """Casefold and strip punctuation/quotes ('ТРЦ «Гулівер»' -> 'трц гулівер')."""
+    return _NON_WORD.sub(' ', (name or '').casefold()).strip()
+
+
+def names_match(a: str, b: str, min_similarity: float) -> bool:
+    if a == b:
+        return True
+    matcher = SequenceMatcher(None, a, b)
+    return (matcher.real_quick_ratio() >= min_similarity
+            and matcher.quick_ratio() >= min_similarity
+            and matcher.ratio() >= min_similarity)
+
+
+def _find(parent: list, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def dedup_pois(pois: list, max_distance_m: float = DEFAULT_DISTANCE_M,
+               min_similarity: float = DEFAULT_SIMILARITY) -> list:
+    """
+    Merge near-duplicate POIs (dicts with 'name', 'lat', 'lng').
+
+    Returns the kept POIs in input order. POIs without a real name are
+    always kept.
+    """
+    if not pois:
+        return []
+
+    cell_lat = max_distance_m / METERS_PER_DEGREE
+    row_cell_lng = {}
+
+    def cell_lng(row: int) -> float:
+        width = row_cell_lng.get(row)
+        if width is None:
+            edge = max(abs(row * cell_lat), abs((row + 1) * cell_lat))
+            width = row_cell_lng[row] = cell_lat / max(math.cos(math.radians(min(edge, 90))), 0.01)
+        return width
+
+    names = [normalize_name(poi.get('name')) for poi in pois]
+    parent = list(range(len(pois)))
+    grid = {}
+
+    for i, poi in enumerate(pois):
+        if _PLACEHOLDER.match(names[i]):
+            continue
+        lat, lng = poi['lat'], poi['lng']
+        cx = int(math.floor(lat / cell_lat))
+        cos_lat = math.cos(math.radians(lat))
+
+        for dx in (-1, 0, 1):
+            # Columns are per row: locate lng in the neighbour row's own grid
+            cy = int(math.floor(lng / cell_lng(cx + dx)))
+            for dy in (-1, 0, 1):
+                for j in grid.get((cx + dx, cy + dy), ()):
+                    other = pois[j]
+                    d_lat = (other['lat'] - lat) * METERS_PER_DEGREE
+                    d_lng = (other['lng'] - lng) * METERS_PER_DEGREE * cos_lat
+                    if d_lat * d_lat + d_lng * d_lng > max_distance_m * max_distance_m:
+                        continue
+                    if not names_match(names[i], names[j], min_similarity):
+                        continue
+                    root_i, root_j = _find(parent, i), _find(parent, j)
+                    if root_i != root_j:
+                        # The earlier POI stays the representative
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        grid.setdefault((cx, int(math.floor(lng / cell_lng(cx)))), []).append(i)
+
+    return [poi for i, poi in enumerate(pois) if _find(parent, i) == i]
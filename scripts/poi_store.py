@@ -0,0 +1,215 @@
+"""
+Local POI warehouse shared by the collectors and scrapers.
+
+One SQLite database (data/pois.sqlite) holds every OSM object any script
+has fetched, keyed by osm_id, with all of its tags. Collectors upsert the
+Overpass elements they receive; consumers read an indexed subset by bbox,
+radius or tag instead of re-downloading. Objects come back in Overpass
+element shape, so the existing element handling works on them unchanged.
+
+Indexes: an R*Tree over object positions and a (key, value) index over
+tags. Writes from several processes are serialized by SQLite (WAL mode).
+
+Usage:
+    from poi_store import get_store
+    get_store().upsert_elements(data['elements'])
+    for element in get_store().upsert_iter(iter_query(query)):  # stored in batches while streaming
+        ...
+    elements = get_store().query_elements(bbox=(s, w, n, e), tags=['shop=supermarket'])
+"""
+
+import json
+import math
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from overpass import element_coords, split_tag
+
+STORE_PATH = Path(__file__).parent / 'data' / 'pois.sqlite'
+
+# Elements buffered by upsert_iter() before they are written in one transaction
+UPSERT_BATCH = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    id INTEGER PRIMARY KEY,
+    osm_id TEXT NOT NULL UNIQUE,
+    name TEXT,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    tags TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    object_id INTEGER NOT NULL,
+    PRIMARY KEY (key, value, object_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_object ON tags(object_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS objects_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng);
+CREATE TABLE IF NOT EXISTS fetches (
+    source TEXT NOT NULL,
+    area TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (source, area)
+);
+"""
+
+EARTH_RADIUS_M = 6371000
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Haversine distance in meters."""
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (math.sin(dlat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def around_bbox(radius_m: float, lat: float, lng: float) -> tuple:
+    """(south, west, north, east) enclosing a circle, as for Overpass around:."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+
+class PoiStore:
+    """SQLite-backed store of OSM objects with spatial and tag indexes."""
+
+    def __init__(self, path: Path = STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def upsert_elements(self, elements) -> int:
+        """Insert or update Overpass elements (nodes, ways with center). Returns the count stored."""
+        count = 0
+        now = time.time()
+        with self.conn:
+            for element in elements:
+                coords = element_coords(element)
+                if coords is None:
+                    continue
+                tags = element.get('tags', {})
+                osm_id = f"{element['type']}/{element['id']}"
+
+                (object_id,) = self.conn.execute(
+                    """INSERT INTO objects (osm_id, name, lat, lng, tags, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(osm_id) DO UPDATE SET
+                           name = excluded.name, lat = excluded.lat, lng = excluded.lng,
+                           tags = excluded.tags, updated_at = excluded.updated_at
+                       RETURNING id""",
+                    (osm_id, tags.get('name'), coords[0], coords[1],
+                     json.dumps(tags, ensure_ascii=False), now),
+                ).fetchone()
+
+                self.conn.execute('DELETE FROM tags WHERE object_id = ?', (object_id,))
+                self.conn.executemany(
+                    'INSERT INTO tags (key, value, object_id) VALUES (?, ?, ?)',
+                    [(key, value, object_id) for key, value in tags.items()],
+                )
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO objects_rtree VALUES (?, ?, ?, ?, ?)',
+                    (object_id, coords[0], coords[0], coords[1], coords[1]),
+                )
+                count += 1
+        return count
+
+    def upsert_iter(self, elements, batch_size: int = UPSERT_BATCH):
+        """
+        Pass elements through while upserting them in batches of batch_size.
+
+        Lets streamed Overpass results be stored without keeping a second
+        copy of the whole response; whatever was consumed is stored even if
+        the stream fails or the caller stops early.
+        """
+        batch = []
+        try:
+            for element in elements:
+                batch.append(element)
+                if len(batch) >= batch_size:
+                    self.upsert_elements(batch)
+                    batch = []
+                yield element
+        finally:
+            self.upsert_elements(batch)
+
+    def query_elements(self, bbox: tuple = None, tags: list = None, around: tuple = None) -> list:
+        """
+        Objects matching any of `tags` ('key=value', value '*' = any) within
+        a bbox (south, west, north, east) or around=(radius_m, lat, lng).
+        Returned in Overpass element shape, ordered by osm_id.
+        """
+        if around is not None:
+            bbox = around_bbox(*around)
+
+        sql = 'SELECT o.osm_id, o.lat, o.lng, o.tags FROM objects o'
+        where = []
+        params = []
+        if bbox is not None:
+            sql += ' JOIN objects_rtree r ON r.id = o.id'
+            where.append('r.min_lat >= ? AND r.max_lat <= ? AND r.min_lng >= ? AND r.max_lng <= ?')
+            south, west, north, east = bbox
+            params += [south, north, west, east]
+        if tags:
+            matches = []
+            for tag in tags:
+                key, value = split_tag(tag)
+                if value == '*':
+                    matches.append('(t.key = ?)')
+                    params.append(key)
+                else:
+                    matches.append('(t.key = ? AND t.value = ?)')
+                    params += [key, value]
+            where.append(f"o.id IN (SELECT t.object_id FROM tags t WHERE {' OR '.join(matches)})")
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY o.osm_id'
+
+        elements = []
+        for osm_id, lat, lng, tags_json in self.conn.execute(sql, params):
+            if around is not None and distance_m(around[1], around[2], lat, lng) > around[0]:
+                continue
+            osm_type, el_id = osm_id.split('/', 1)
+            element = {'type': osm_type, 'id': int(el_id), 'tags': json.loads(tags_json)}
+            if osm_type == 'node':
+                element['lat'], element['lon'] = lat, lng
+            else:
+                element['center'] = {'lat': lat, 'lon': lng}
+            elements.append(element)
+        return elements
+
+    def mark_fetched(self, source: str, area: str):
+        """Record that `source` (e.g. 'heatmap') fetched `area` (e.g. a city key) just now."""
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO fetches VALUES (?, ?, ?)', (source, area, time.time()))
+
+    def fetched_at(self, source: str, area: str):
+        """Unix time of the last mark_fetched(source, area), or None."""
+        row = self.conn.execute('SELECT fetched_at FROM fetches WHERE source = ? AND area = ?',
+                                (source, area)).fetchone()
+        return row[0] if row else None
+
+
+_store = None
+_store_pid = None
+
+
+def get_store() -> PoiStore:
+    """Return this process's store connection (opened on first use, again after fork)."""
+    global _store, _store_pid
+    if _store is None or _store_pid != os.getpid():
+        _store = PoiStore()
+        _store_pid = os.getpid()
+    return _store
@@ -0,0 +1,154 @@
+"""
+Vectorized synthetic popular times.
+
+generate_batch() builds the 7 x 24 busyness grid of N POIs at once as an
+(N, 7, 24) uint8 array. Per-POI randomness comes from a counter-based
+generator (splitmix64 over key + counter) keyed on a blake2b hash of
+osm_id, so a POI gets the same values in every run, chunk and worker
+regardless of which other POIs are generated with it.
+
+The model is the one the scripts used before: a weekday/weekend base
+pattern per type (activity_patterns), shifted by -2..2 hours, scaled by an overall intensity
+U(0.5, 1.5), a per-day factor U(0.7, 1.3), a location factor and
+per-hour noise U(0.85, 1.15), then truncated to 0..100.
+
+generate_synthetic_batch() is the Kyiv fallback for POIs without scraped
+values; it lives here rather than in scrape_popular_times.py so the
+aggregation does not need the populartimes package.
+"""
+
+import hashlib
+
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
+from activity_patterns import PATTERNS, SHIFTS, ActivityPatterns
+from activity_hubs import hub_index, effective_distance_km
+from cities_config import CITIES
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Kyiv city center coordinates for location-based modulation
+KYIV_CENTER = (50.4501, 30.5234)
+
+# Metro stations and malls inside this bbox act as secondary centers
+KYIV_BBOX = CITIES['kyiv']['bbox']
+
+# POIs generated per vectorized step (bounds the temporary arrays)
+CHUNK_SIZE = 1 << 16
+
+# Random streams of one POI (counter offsets): per-POI modifiers, per-hour noise
+_MODIFIERS = 0
+_NOISE = 1 << 32
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def stable_key(osm_id: str) -> int:
+    """64-bit key of an osm_id, identical in every process (unlike hash())."""
+    return int.from_bytes(hashlib.blake2b(str(osm_id).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def stable_keys(osm_ids) -> np.ndarray:
+    return np.fromiter((stable_key(osm_id) for osm_id in osm_ids), dtype=np.uint64)
+
+
+def splitmix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 output function (wrapping uint64 arithmetic), computed in place on x."""
+    x += _GOLDEN
+    x ^= x >> np.uint64(30)
+    x *= _MIX1
+    x ^= x >> np.uint64(27)
+    x *= _MIX2
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def uniforms(keys: np.ndarray, count: int, stream: int = 0) -> np.ndarray:
+    """
+    (N, count) float32 in [0, 1): draw i of POI k is a pure function of (keys[k], stream, i).
+
+    Each 64-bit output yields two 24-bit draws (exact in float32).
+    """
+    words = (count + 1) // 2
+    counters = (np.arange(words, dtype=np.uint64) + np.uint64(stream)) * _GOLDEN
+    bits = splitmix64(keys[:, None] + counters[None, :])
+    draws = np.empty((len(keys), words * 2), dtype=np.float32)
+    draws[:, :words] = bits >> np.uint64(40)
+    draws[:, words:] = bits & np.uint64(0xFFFFFF)
+    draws *= np.float32(1.0 / (1 << 24))
+    return draws[:, :count] if count < words * 2 else draws
+
+
+def distance_km(lats, lngs, center: tuple) -> np.ndarray:
+    """Approximate distance (km) from `center`, as the scalar code computed it."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    lat_diff = np.abs(lats - center[0]) * 111
+    lng_diff = np.abs(lngs - center[1]) * 111 * np.cos(np.radians(lats))
+    return np.sqrt(lat_diff ** 2 + lng_diff ** 2)
+
+
+def generate_batch(codes: np.ndarray, keys: np.ndarray, location_mod,
+                   patterns: ActivityPatterns = PATTERNS) -> np.ndarray:
+    """
+    Popular times of N POIs.
+
+    codes: (N,) type codes from patterns.codes(), keys: (N,) uint64 stable
+    keys, location_mod: scalar or (N,) factor. Returns (N, 7, 24) uint8.
+    """
+    n = len(keys)
+    location_mod = np.broadcast_to(np.asarray(location_mod, dtype=np.float32), (n,))
+    result = np.empty((n, 7, 24), dtype=np.uint8)
+    weekend = np.array([0, 0, 0, 0, 0, 1, 1])
+
+    for start in range(0, n, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, n)
+        u = uniforms(keys[start:stop], 9, _MODIFIERS)
+        intensity = np.float32(0.5) + u[:, 0]
+        shift_index = np.floor(u[:, 1] * len(SHIFTS)).astype(np.intp)
+        day_variation = np.float32(0.7) + np.float32(0.6) * u[:, 2:9]
+
+        hour_noise = uniforms(keys[start:stop], 7 * 24, _NOISE).reshape(-1, 7, 24)
+        hour_noise *= np.float32(0.3)
+        hour_noise += np.float32(0.85)
+
+        hour_noise *= patterns.curves(codes[start:stop], shift_index)[:, weekend, :]
+        hour_noise *= (intensity * location_mod[start:stop])[:, None, None]
+        hour_noise *= day_variation[:, :, None]
+        np.clip(hour_noise, 0, 100, out=hour_noise)
+        result[start:stop] = hour_noise
+
+    return result
+
+
+def to_populartimes(grid: np.ndarray) -> list:
+    """One POI's (7, 24) grid in the populartimes JSON form."""
+    return [{'name': DAY_NAMES[day], 'data': hours} for day, hours in enumerate(grid.tolist())]
+
+
+def location_modulation(dist_km: np.ndarray) -> np.ndarray:
+    """Center (0-3km): 1.2x, Middle (3-8km): 1.0x, Suburbs (8+km): down to 0.5x."""
+    return np.where(dist_km < 3, 1.2 - (dist_km / 3) * 0.2,
+                    np.where(dist_km < 8, 1.0 - (dist_km - 3) / 5 * 0.2,
+                             np.maximum(0.5, 0.8 - (dist_km - 8) / 15 * 0.3)))
+
+
+def generate_synthetic_batch(pois: list) -> np.ndarray:
+    """
+    Synthetic popular times of all POIs as an (N, 7, 24) uint8 array.
+
+    Values are reproducible per osm_id across runs and processes; the
+    location factor uses the nearer of the city center and the metro/mall hubs.
+    """
+    codes = PATTERNS.codes(poi['poi_type'] for poi in pois)
+    keys = stable_keys(poi['osm_id'] for poi in pois)
+    lats = [poi['lat'] for poi in pois]
+    lngs = [poi['lng'] for poi in pois]
+    dist = effective_distance_km(lats, lngs, distance_km(lats, lngs, KYIV_CENTER), hub_index(KYIV_BBOX))
+    return generate_batch(codes, keys, location_modulation(dist))
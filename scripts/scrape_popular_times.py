@@ -9,13 +9,14 @@ WARNING: This scrapes Google and may violate their ToS.
 Use responsibly and only for research purposes.
 
 Usage:
-    python scrape_popular_times.py [--batch-size 100] [--delay 1.5] [--resume]
+    python scrape_popular_times.py [--batch-size 100] [--delay 1.5] [--resume] [--defer-synthetic]
 """
 
 import json
 import time
 import argparse
 import os
+import random
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any
@@ -28,6 +29,17 @@ except ImportError:
     print("Install with: pip install git+https://github.com/m-wrzr/populartimes")
     exit(1)
 
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: numpy not installed. Run: pip install numpy")
+    exit(1)
+
+from activity_patterns import PATTERNS
+from activity_hubs import hub_index, effective_distance_km
+from popular_times import (CHUNK_SIZE, KYIV_CENTER, KYIV_BBOX, stable_keys, distance_km, generate_batch,
+                           to_populartimes, location_modulation, generate_synthetic_batch)
+
 # Google Places API key (optional, for place_id lookups)
 GOOGLE_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', '')
 
@@ -158,17 +170,9 @@ def scrape_by_coordinates(lat: float, lng: float, name: str, poi_type: str) -> O
         return None
 
 
-import random
-import math
-
-# Kyiv city center coordinates for location-based modulation
-KYIV_CENTER = (50.4501, 30.5234)
-
 def calculate_distance_from_center(lat: float, lng: float) -> float:
     """Calculate distance from Kyiv center in km (approximate)."""
-    lat_diff = abs(lat - KYIV_CENTER[0]) * 111  # ~111 km per degree lat
-    lng_diff = abs(lng - KYIV_CENTER[1]) * 111 * math.cos(math.radians(lat))
-    return math.sqrt(lat_diff**2 + lng_diff**2)
+    return float(distance_km(lat, lng, KYIV_CENTER))
 
 
 def generate_synthetic_populartimes(poi_type: str, poi_id: str = None, lat: float = None, lng: float = None) -> list:
@@ -180,123 +184,18 @@ def generate_synthetic_populartimes(poi_type: str, poi_id: str = None, lat: floa
 
     Args:
         poi_type: Type of POI (restaurant, cafe, gym, etc.)
-        poi_id: Unique ID for reproducible randomness
+        poi_id: Unique ID for reproducible randomness (random if omitted)
         lat, lng: Coordinates for location-based modulation
     """
-    # Seed random with poi_id for reproducibility
-    if poi_id:
-        random.seed(hash(poi_id) % (2**32))
-
-    # Base patterns by day of week (Mon=0, Sun=6)
-    # Values are relative popularity (0-100)
-    patterns = {
-        'restaurant': {
-            'weekday': [0, 0, 0, 0, 0, 0, 10, 15, 20, 15, 10, 20, 60, 70, 40, 20, 30, 50, 80, 100, 90, 70, 40, 10],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 10, 20, 30, 50, 70, 90, 100, 80, 60, 50, 60, 80, 100, 90, 70, 40, 10]
-        },
-        'cafe': {
-            'weekday': [0, 0, 0, 0, 0, 5, 20, 50, 80, 100, 90, 70, 80, 70, 60, 50, 60, 70, 60, 40, 20, 10, 5, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 10, 30, 60, 80, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0, 0]
-        },
-        'gym': {
-            'weekday': [0, 0, 0, 0, 0, 5, 30, 70, 90, 60, 40, 50, 70, 50, 40, 50, 70, 100, 90, 80, 60, 30, 10, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 50, 80, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0, 0, 0]
-        },
-        'shopping_mall': {
-            'weekday': [0, 0, 0, 0, 0, 0, 0, 5, 10, 30, 50, 60, 70, 60, 50, 60, 80, 100, 90, 80, 70, 50, 20, 5],
-            'weekend': [0, 0, 0, 0, 0, 0, 0, 5, 10, 40, 70, 90, 100, 100, 90, 80, 90, 100, 90, 70, 50, 30, 10, 0]
-        },
-        'supermarket': {
-            'weekday': [0, 0, 0, 0, 0, 0, 5, 20, 50, 70, 60, 50, 60, 50, 40, 50, 70, 100, 80, 60, 40, 20, 10, 5],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 10, 30, 60, 80, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0, 0]
-        },
-        'transit_station': {
-            'weekday': [5, 0, 0, 0, 0, 10, 40, 90, 100, 70, 40, 30, 40, 40, 30, 40, 60, 100, 90, 60, 30, 20, 10, 5],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 40, 60, 70, 80, 80, 70, 60, 50, 50, 60, 50, 40, 30, 20, 10, 5]
-        },
-        'office': {
-            'weekday': [0, 0, 0, 0, 0, 0, 10, 50, 90, 100, 100, 90, 70, 80, 100, 100, 90, 70, 30, 10, 5, 0, 0, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 0, 0, 5, 10, 15, 15, 10, 10, 10, 5, 0, 0, 0, 0, 0, 0, 0, 0]
-        },
-        'bar': {
-            'weekday': [5, 0, 0, 0, 0, 0, 0, 0, 0, 0, 5, 10, 20, 20, 15, 20, 30, 50, 70, 90, 100, 100, 80, 30],
-            'weekend': [10, 5, 0, 0, 0, 0, 0, 0, 0, 5, 10, 20, 30, 30, 25, 30, 40, 60, 80, 100, 100, 100, 90, 50]
-        },
-        'nightclub': {
-            'weekday': [20, 10, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 10, 30, 50, 70, 90, 100, 80],
-            'weekend': [50, 30, 10, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 10, 30, 50, 80, 100, 100, 100, 90]
-        },
-        'pharmacy': {
-            'weekday': [0, 0, 0, 0, 0, 0, 5, 30, 70, 100, 90, 70, 80, 70, 60, 70, 80, 90, 60, 30, 10, 5, 0, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 0, 10, 30, 60, 80, 100, 90, 70, 50, 40, 30, 20, 10, 5, 0, 0, 0, 0]
-        },
-        'bank': {
-            'weekday': [0, 0, 0, 0, 0, 0, 0, 20, 60, 100, 90, 80, 90, 100, 80, 70, 60, 50, 20, 5, 0, 0, 0, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 0, 0, 10, 30, 50, 60, 50, 30, 20, 10, 5, 0, 0, 0, 0, 0, 0, 0]
-        },
-        'park': {
-            'weekday': [0, 0, 0, 0, 0, 5, 20, 40, 50, 40, 30, 40, 50, 40, 30, 40, 60, 80, 100, 80, 50, 30, 10, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 40, 60, 80, 100, 100, 100, 90, 80, 70, 60, 50, 40, 20, 10, 5, 0]
-        },
-        'museum': {
-            'weekday': [0, 0, 0, 0, 0, 0, 0, 0, 10, 40, 70, 90, 100, 90, 80, 70, 60, 40, 20, 5, 0, 0, 0, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 0, 5, 20, 50, 80, 100, 100, 100, 90, 80, 60, 40, 20, 10, 5, 0, 0, 0]
-        },
-        'default': {
-            'weekday': [0, 0, 0, 0, 0, 0, 10, 30, 50, 60, 70, 70, 80, 70, 60, 70, 80, 90, 100, 80, 50, 30, 10, 0],
-            'weekend': [0, 0, 0, 0, 0, 0, 5, 20, 40, 60, 80, 90, 100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 0]
-        }
-    }
+    key = stable_keys([poi_id]) if poi_id else np.array([random.getrandbits(64)], dtype=np.uint64)
+    codes = PATTERNS.codes([poi_type])
 
-    pattern = patterns.get(poi_type, patterns['default'])
-
-    # Random modifiers for this POI (reproducible via poi_id seed)
-    intensity_mod = random.uniform(0.5, 1.5)  # Overall intensity ±50%
-    time_shift = random.randint(-2, 2)  # Peak hours shift ±2 hours
-    day_variation = [random.uniform(0.7, 1.3) for _ in range(7)]  # Per-day variation
-
-    # Location-based modulation (center is busier)
     location_mod = 1.0
     if lat is not None and lng is not None:
-        dist_km = calculate_distance_from_center(lat, lng)
-        # Center (0-3km): 1.2x, Middle (3-8km): 1.0x, Suburbs (8+km): 0.7x
-        if dist_km < 3:
-            location_mod = 1.2 - (dist_km / 3) * 0.2
-        elif dist_km < 8:
-            location_mod = 1.0 - (dist_km - 3) / 5 * 0.2
-        else:
-            location_mod = max(0.5, 0.8 - (dist_km - 8) / 15 * 0.3)
-
-    # Generate 7 days (Mon-Sun)
-    result = []
-    for day_idx in range(7):
-        is_weekend = day_idx >= 5
-        base_pattern = pattern['weekend'] if is_weekend else pattern['weekday']
-
-        # Apply time shift
-        shifted_pattern = base_pattern[time_shift:] + base_pattern[:time_shift] if time_shift > 0 else \
-                         base_pattern[time_shift:] + base_pattern[:time_shift]
-
-        # Apply all modulations with per-hour noise
-        modified_pattern = []
-        for hour, value in enumerate(shifted_pattern):
-            # Per-hour random noise ±15%
-            hour_noise = random.uniform(0.85, 1.15)
-            # Combine all modifiers
-            new_value = value * intensity_mod * day_variation[day_idx] * location_mod * hour_noise
-            # Clamp to 0-100
-            modified_pattern.append(int(max(0, min(100, new_value))))
-
-        day_data = {
-            'name': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'][day_idx],
-            'data': modified_pattern
-        }
-        result.append(day_data)
+        dist = effective_distance_km([lat], [lng], distance_km([lat], [lng], KYIV_CENTER), hub_index(KYIV_BBOX))
+        location_mod = location_modulation(dist)
 
-    # Reset random seed
-    random.seed()
-
-    return result
+    return to_populartimes(generate_batch(codes, key, location_mod)[0])
 
 
 def main():
@@ -306,6 +205,9 @@ def main():
     parser.add_argument('--resume', action='store_true', help='Resume from last progress')
     parser.add_argument('--synthetic', action='store_true', help='Use synthetic data (no scraping)')
     parser.add_argument('--limit', type=int, default=0, help='Limit number of POIs to process (0 = all)')
+    parser.add_argument('--defer-synthetic', action='store_true',
+                        help='Leave synthetic popular times out of the output; aggregate_h3_heatmap.py '
+                             'generates them on demand')
     args = parser.parse_args()
 
     print("=" * 60)
@@ -346,10 +248,16 @@ def main():
     processed_count = 0
     with_data_count = 0
 
-    for idx, poi in enumerate(pois):
+    # Synthetic values only for POIs that need them (unless deferred to the aggregator): in
+    # synthetic mode one vectorized batch per CHUNK_SIZE pending POIs, generated when the
+    # loop reaches it; otherwise per POI the scraper found no data for
+    pending = [(idx, poi) for idx, poi in enumerate(pois) if poi['osm_id'] not in processed_ids]
+    synthetic, synthetic_chunk = None, None
+
+    for k, (idx, poi) in enumerate(pending):
         osm_id = poi['osm_id']
 
-        # Skip already processed
+        # Skip duplicate osm_ids
         if osm_id in processed_ids:
             continue
 
@@ -365,12 +273,14 @@ def main():
 
         # Get popular times data
         if args.synthetic:
-            pop_times = generate_synthetic_populartimes(
-                poi['poi_type'],
-                poi_id=osm_id,
-                lat=poi['lat'],
-                lng=poi['lng']
-            )
+            pop_times = None
+            if not args.defer_synthetic:
+                chunk, row = divmod(k, CHUNK_SIZE)
+                if chunk != synthetic_chunk:
+                    start = chunk * CHUNK_SIZE
+                    synthetic = generate_synthetic_batch([p for _, p in pending[start:start + CHUNK_SIZE]])
+                    synthetic_chunk = chunk
+                pop_times = to_populartimes(synthetic[row])
         else:
             # Try API-based scraping
             pop_times = None
@@ -382,14 +292,9 @@ def main():
                 pop_times = api_result['populartimes']
                 with_data_count += 1
 
-            if not pop_times:
+            if not pop_times and not args.defer_synthetic:
                 # Fallback to synthetic
-                pop_times = generate_synthetic_populartimes(
-                    poi['poi_type'],
-                    poi_id=osm_id,
-                    lat=poi['lat'],
-                    lng=poi['lng']
-                )
+                pop_times = to_populartimes(generate_synthetic_batch([poi])[0])
 
             time.sleep(args.delay)
 
@@ -4,12 +4,16 @@ Fetch Fitness Clubs from OpenStreetMap via Overpass API
 for major Ukrainian cities
 """
 
+import argparse
 import json
-import requests
+import sys
 from datetime import datetime
 import os
 
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from http_client import HttpError, print_latency_report
+from overpass import OverpassError, configure_cache, post_query
+from poi_store import get_store
 
 # Major Ukrainian cities with coordinates
 CITIES = [
@@ -30,7 +34,11 @@ FITNESS_BRANDS = [
 ]
 
 
-def fetch_fitness_for_city(city):
+# Tags queried from Overpass; also used to read the same objects from the POI store
+FITNESS_TAGS = ['leisure=fitness_centre', 'leisure=sports_centre', 'amenity=gym']
+
+
+def fetch_fitness_for_city(city, from_store=False):
     """Fetch fitness clubs for a specific city"""
 
     # Query for fitness/gym facilities within 30km radius of city center
@@ -49,14 +57,17 @@ def fetch_fitness_for_city(city):
 
     print(f"  Fetching fitness clubs for {city['name']}...")
 
-    response = requests.post(OVERPASS_URL, data={'data': query})
+    if from_store:
+        elements = get_store().query_elements(tags=FITNESS_TAGS, around=(30000, city['lat'], city['lng']))
+    else:
+        try:
+            data = post_query(query)
+        except (OverpassError, HttpError) as e:
+            print(f"  Error: {e}")
+            return []
 
-    if response.status_code != 200:
-        print(f"  Error: {response.status_code}")
-        return []
-
-    data = response.json()
-    elements = data.get('elements', [])
+        elements = data.get('elements', [])
+        get_store().upsert_elements(elements)
 
     clubs = []
     seen_names = set()
@@ -117,7 +128,7 @@ def fetch_fitness_for_city(city):
     return clubs
 
 
-def fetch_all_fitness():
+def fetch_all_fitness(from_store=False):
     """Fetch fitness clubs for all cities"""
 
     print("=" * 50)
@@ -127,7 +138,7 @@ def fetch_all_fitness():
     all_clubs = []
 
     for city in CITIES:
-        clubs = fetch_fitness_for_city(city)
+        clubs = fetch_fitness_for_city(city, from_store)
         all_clubs.extend(clubs)
 
     print(f"\nTotal: {len(all_clubs)} fitness clubs")
@@ -217,7 +228,15 @@ def generate_sql(clubs):
 
 
 if __name__ == '__main__':
-    clubs = fetch_all_fitness()
+    parser = argparse.ArgumentParser(description='Fetch fitness clubs from OpenStreetMap')
+    parser.add_argument('--offline', action='store_true',
+                        help='Serve Overpass responses only from the local cache')
+    parser.add_argument('--from-store', action='store_true',
+                        help='Read objects from the local POI store instead of querying Overpass')
+    args = parser.parse_args()
+    configure_cache(offline=args.offline)
+
+    clubs = fetch_all_fitness(args.from_store)
 
     if clubs:
         save_to_json(clubs)
@@ -227,4 +246,6 @@ if __name__ == '__main__':
         for c in clubs[:5]:
             print(f"  - {c['name_uk']} ({c['brand']}, {c['city']})")
 
+    print()
+    print_latency_report()
     print("\nDone!")
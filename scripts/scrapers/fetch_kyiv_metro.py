@@ -5,17 +5,20 @@ and upload to Supabase
 """
 
 import os
+import sys
 import json
+import argparse
 import requests
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from http_client import HttpError, print_latency_report
+from overpass import OverpassError, configure_cache, post_query
+
 # Supabase config
 SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://fmsbzjwzyoheupbqzcwo.supabase.co')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY', '')
 
-# Overpass API
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
-
 # Kyiv Metro lines colors
 METRO_LINES = {
     'M1': {'name': 'Святошинсько-Броварська', 'name_en': 'Sviatoshynsko-Brovarska', 'color': '#E4181C'},  # Red
@@ -40,14 +43,16 @@ def fetch_metro_stations():
 
     print("Fetching Kyiv metro stations from Overpass API...")
 
-    response = requests.post(OVERPASS_URL, data={'data': query})
-
-    if response.status_code != 200:
-        print(f"Error: {response.status_code}")
-        print(response.text)
+    try:
+        data = post_query(query)
+    except OverpassError as e:
+        print(f"Error: {e}")
+        print(e.message)
+        return []
+    except HttpError as e:
+        print(f"Error: {e}")
         return []
 
-    data = response.json()
     elements = data.get('elements', [])
 
     print(f"Found {len(elements)} elements")
@@ -178,6 +183,12 @@ def upload_to_supabase(stations):
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Fetch Kyiv metro stations from OpenStreetMap')
+    parser.add_argument('--offline', action='store_true',
+                        help='Serve Overpass responses only from the local cache')
+    args = parser.parse_args()
+    configure_cache(offline=args.offline)
+
     print("=" * 50)
     print("Kyiv Metro Stations Fetcher")
     print("=" * 50)
@@ -200,6 +211,8 @@ def main():
     # Upload to Supabase (if key is set)
     upload_to_supabase(stations)
 
+    print()
+    print_latency_report()
     print("\nDone!")
 
 
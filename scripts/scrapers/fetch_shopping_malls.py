@@ -4,12 +4,16 @@ Fetch Shopping Malls from OpenStreetMap via Overpass API
 for major Ukrainian cities
 """
 
+import argparse
 import json
-import requests
+import sys
 from datetime import datetime
 import os
 
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from http_client import HttpError, print_latency_report
+from overpass import OverpassError, configure_cache, post_query
+from poi_store import get_store
 
 # Major Ukrainian cities with coordinates
 CITIES = [
@@ -21,7 +25,11 @@ CITIES = [
 ]
 
 
-def fetch_malls_for_city(city):
+# Tags queried from Overpass; also used to read the same objects from the POI store
+MALL_TAGS = ['shop=mall', 'building=mall']
+
+
+def fetch_malls_for_city(city, from_store=False):
     """Fetch shopping malls for a specific city"""
 
     # Query for shopping malls within 30km radius of city center
@@ -39,14 +47,17 @@ def fetch_malls_for_city(city):
 
     print(f"  Fetching malls for {city['name']}...")
 
-    response = requests.post(OVERPASS_URL, data={'data': query})
+    if from_store:
+        elements = get_store().query_elements(tags=MALL_TAGS, around=(30000, city['lat'], city['lng']))
+    else:
+        try:
+            data = post_query(query)
+        except (OverpassError, HttpError) as e:
+            print(f"  Error: {e}")
+            return []
 
-    if response.status_code != 200:
-        print(f"  Error: {response.status_code}")
-        return []
-
-    data = response.json()
-    elements = data.get('elements', [])
+        elements = data.get('elements', [])
+        get_store().upsert_elements(elements)
 
     malls = []
     seen_names = set()
@@ -92,7 +103,7 @@ def fetch_malls_for_city(city):
     return malls
 
 
-def fetch_all_malls():
+def fetch_all_malls(from_store=False):
     """Fetch malls for all cities"""
 
     print("=" * 50)
@@ -102,7 +113,7 @@ def fetch_all_malls():
     all_malls = []
 
     for city in CITIES:
-        malls = fetch_malls_for_city(city)
+        malls = fetch_malls_for_city(city, from_store)
         all_malls.extend(malls)
 
     print(f"\nTotal: {len(all_malls)} shopping malls")
@@ -191,7 +202,15 @@ def generate_sql(malls):
 
 
 if __name__ == '__main__':
-    malls = fetch_all_malls()
+    parser = argparse.ArgumentParser(description='Fetch shopping malls from OpenStreetMap')
+    parser.add_argument('--offline', action='store_true',
+                        help='Serve Overpass responses only from the local cache')
+    parser.add_argument('--from-store', action='store_true',
+                        help='Read objects from the local POI store instead of querying Overpass')
+    args = parser.parse_args()
+    configure_cache(offline=args.offline)
+
+    malls = fetch_all_malls(args.from_store)
 
     if malls:
         save_to_json(malls)
@@ -201,4 +220,6 @@ if __name__ == '__main__':
         for m in malls[:5]:
             print(f"  - {m['name_uk']} ({m['city']})")
 
+    print()
+    print_latency_report()
     print("\nDone!")
@@ -4,13 +4,20 @@ Fetch Supermarkets from OpenStreetMap via Overpass API
 for major Ukrainian cities
 """
 
+import argparse
 import json
-import requests
+import sys
 from datetime import datetime
 import os
-import time
 
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from http_client import HttpError, get_client, print_latency_report
+from overpass import OVERPASS_URL, OverpassError, configure_cache, post_query
+from poi_store import get_store
+from poi_dedup import dedup_pois
+
+# Minimum spacing between Overpass requests (seconds) - be nice to Overpass API
+REQUEST_INTERVAL = 2
 
 # Major Ukrainian cities with coordinates
 CITIES = [
@@ -43,8 +50,12 @@ SUPERMARKET_BRANDS = {
 }
 
 
-def fetch_supermarkets_for_city(city, retries=2):
-    """Fetch supermarkets for a specific city with retry logic"""
+# Tags queried from Overpass; also used to read the same objects from the POI store
+SUPERMARKET_TAGS = ['shop=supermarket']
+
+
+def fetch_supermarkets_for_city(city, from_store=False):
+    """Fetch supermarkets for a specific city (the HTTP client retries 429/504)"""
 
     query = f"""
     [out:json][timeout:90];
@@ -57,31 +68,19 @@ def fetch_supermarkets_for_city(city, retries=2):
 
     print(f"  Fetching supermarkets for {city['name']}...")
 
-    for attempt in range(retries + 1):
+    if from_store:
+        elements = get_store().query_elements(tags=SUPERMARKET_TAGS, around=(25000, city['lat'], city['lng']))
+    else:
         try:
-            response = requests.post(OVERPASS_URL, data={'data': query}, timeout=120)
-
-            if response.status_code == 200:
-                break
-            elif response.status_code == 504 and attempt < retries:
-                print(f"    Timeout, retrying in 10s...")
-                time.sleep(10)
-                continue
-            else:
-                print(f"  Error: {response.status_code}")
-                return []
-        except requests.exceptions.Timeout:
-            if attempt < retries:
-                print(f"    Request timeout, retrying in 10s...")
-                time.sleep(10)
-                continue
+            data = post_query(query, timeout=120)
+        except (OverpassError, HttpError) as e:
+            print(f"  Error: {e}")
             return []
 
-    data = response.json()
-    elements = data.get('elements', [])
+        elements = data.get('elements', [])
+        get_store().upsert_elements(elements)
 
     markets = []
-    seen = set()
 
     for elem in elements:
         tags = elem.get('tags', {})
@@ -101,11 +100,6 @@ def fetch_supermarkets_for_city(city, retries=2):
         if not lat or not lng:
             continue
 
-        loc_key = f"{name}_{round(lat, 4)}_{round(lng, 4)}"
-        if loc_key in seen:
-            continue
-        seen.add(loc_key)
-
         # Detect brand
         brand = tags.get('brand', '')
         if not brand:
@@ -135,7 +129,7 @@ def fetch_supermarkets_for_city(city, retries=2):
     return markets
 
 
-def fetch_all_supermarkets():
+def fetch_all_supermarkets(from_store=False):
     """Fetch supermarkets for all cities"""
 
     print("=" * 50)
@@ -145,9 +139,11 @@ def fetch_all_supermarkets():
     all_markets = []
 
     for city in CITIES:
-        markets = fetch_supermarkets_for_city(city)
+        markets = fetch_supermarkets_for_city(city, from_store)
         all_markets.extend(markets)
-        time.sleep(2)  # Be nice to Overpass API
+
+    # Merge node/way duplicates of the same store, across all cities at once
+    all_markets = dedup_pois(all_markets)
 
     print(f"\nTotal: {len(all_markets)} supermarkets")
 
@@ -247,7 +243,16 @@ def generate_sql(markets):
 
 
 if __name__ == '__main__':
-    markets = fetch_all_supermarkets()
+    parser = argparse.ArgumentParser(description='Fetch supermarkets from OpenStreetMap')
+    parser.add_argument('--offline', action='store_true',
+                        help='Serve Overpass responses only from the local cache')
+    parser.add_argument('--from-store', action='store_true',
+                        help='Read objects from the local POI store instead of querying Overpass')
+    args = parser.parse_args()
+    configure_cache(offline=args.offline)
+    get_client().set_min_interval(OVERPASS_URL, REQUEST_INTERVAL)
+
+    markets = fetch_all_supermarkets(args.from_store)
 
     if markets:
         save_to_json(markets)
@@ -257,4 +262,6 @@ if __name__ == '__main__':
         for m in markets[:5]:
             print(f"  - {m['name_uk']} ({m['brand']}, {m['city']})")
 
+    print()
+    print_latency_report()
     print("\nDone!")
@@ -0,0 +1,157 @@
+"""
+Static artifacts for public/.
+
+Every file is written atomically (temporary file + rename, so a reader
+never sees a half-written file) together with maximally compressed .gz
+and .br siblings a static server or CDN can send as-is (.br only when
+the brotli package is installed; a warning is printed once otherwise).
+
+Files that clients should cache long-term are also published under a
+content-hashed name, <stem>.<hash><suffix>, which never changes content
+and can be served with immutable cache headers. The fixed name keeps
+pointing at the latest version for existing clients; the index and
+manifests point at the hashed names. The newest KEEP_VERSIONS hashed
+versions of a file are kept, so clients holding the previous index can
+still fetch its files.
+
+Directories of files that belong together (the time slices of a
+heatmap) are published the same way as <name>.<hash>/: filled under a
+temporary name and renamed into place, so clients never see a partial
+directory, with the older versions beyond KEEP_VERSIONS removed.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+import shutil
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASH_LENGTH = 12
+
+KEEP_VERSIONS = 2
+
+_brotli_warned = False
+
+
+def atomic_write(path: Path, data: bytes):
+    """Write data to path via a temporary file in the same directory and a rename."""
+    path = Path(path)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def compressed(data: bytes) -> dict:
+    """{suffix: bytes} of the precompressed variants of data."""
+    global _brotli_warned
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    elif not _brotli_warned:
+        print("  Warning: brotli not installed, writing .gz siblings only. Run: pip install brotli")
+        _brotli_warned = True
+    return variants
+
+
+def write_artifact(path: Path, data: bytes):
+    """Atomically write path and its compressed siblings (siblings first, so they are never older)."""
+    path = Path(path)
+    for suffix, variant in compressed(data).items():
+        atomic_write(path.with_name(path.name + suffix), variant)
+    atomic_write(path, data)
+
+
+def content_hashed(path: Path, data: bytes) -> Path:
+    """path with the content hash of data before its suffix."""
+    path = Path(path)
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    return path.with_name(f'{path.stem}.{digest}{path.suffix}')
+
+
+def prune_versions(path: Path):
+    """Delete all but the newest KEEP_VERSIONS hashed versions of path (and their siblings)."""
+    path = Path(path)
+    pattern = re.compile(rf'{re.escape(path.stem)}\.[0-9a-f]{{{HASH_LENGTH}}}{re.escape(path.suffix)}')
+    versions = sorted((p for p in path.parent.iterdir() if pattern.fullmatch(p.name)),
+                      key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in versions[KEEP_VERSIONS:]:
+        if old.is_dir():
+            shutil.rmtree(old, ignore_errors=True)
+            continue
+        for stale in (old, old.with_name(old.name + '.gz'), old.with_name(old.name + '.br')):
+            try:
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def publish(path: Path, data: bytes, hashed: bool = True) -> Path:
+    """
+    Write data to path (and, if hashed, to its content-hashed name) with compressed siblings.
+
+    Returns the path clients should reference: the hashed one, or path itself.
+    """
+    path = Path(path)
+    if not hashed:
+        write_artifact(path, data)
+        return path
+
+    hashed_path = content_hashed(path, data)
+    if hashed_path.exists():
+        os.utime(hashed_path)  # still the newest version
+    else:
+        write_artifact(hashed_path, data)
+    write_artifact(path, data)
+    prune_versions(path)
+    return hashed_path
+
+
+def publish_directory(path: Path, files: dict) -> Path:
+    """
+    Publish {file name: bytes} as the content-hashed directory <path>.<hash>/ with compressed siblings.
+
+    Returns the hashed directory, which clients should reference.
+    """
+    path = Path(path)
+    listing = ''.join(f'{name} {hashlib.sha256(files[name]).hexdigest()}\n' for name in sorted(files))
+    hashed_path = content_hashed(path, listing.encode('utf-8'))
+    if hashed_path.exists():
+        os.utime(hashed_path)  # still the newest version
+    else:
+        tmp_path = path.with_name(f'.{hashed_path.name}.{os.getpid()}.tmp')
+        try:
+            tmp_path.mkdir(parents=True)
+            for name, data in files.items():
+                write_artifact(tmp_path / name, data)
+            try:
+                os.replace(tmp_path, hashed_path)
+            except OSError:
+                if not hashed_path.is_dir():  # unless a concurrent run published the same content
+                    raise
+        finally:
+            if tmp_path.exists():
+                shutil.rmtree(tmp_path)
+    prune_versions(path)
+    return hashed_path
+
+
+def hashed_name(path: Path) -> str:
+    """Content-hashed name of an existing file (published now if it was written without one)."""
+    path = Path(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    hashed_path = content_hashed(path, data)
+    if not hashed_path.exists():
+        publish(path, data)
+    return hashed_path.name
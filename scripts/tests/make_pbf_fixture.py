@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Write tests/data/cities.osm.pbf, the tiny extract used by test_osm_pbf.py.
+
+Two cities with overlapping bboxes: A (50.0, 30.0, 50.2, 30.2) and
+B (50.15, 30.15, 50.4, 30.4). The file holds an OSMHeader blob, a raw
+node block (DenseNodes plus one plain Node) and a zlib way block:
+
+    node 1   amenity=cafe        50.05, 30.05   A
+    node 2   amenity=restaurant  50.30, 30.30   B
+    node 3   amenity=cafe        50.17, 30.17   A and B
+    node 4   amenity=cafe        51.00, 31.00   outside both
+    node 5-8 (untagged way nodes)
+    node 9   shop=bakery         50.06, 30.06   not a POI tag
+    node 10  amenity=restaurant  50.25, 30.25   B (plain Node)
+    way 100  amenity=restaurant  nodes 5, 6     A, center 50.02, 30.02
+    way 101  amenity=cafe        nodes 7, 8     A and B, center 50.20, 30.20
+    way 102  highway=residential nodes 5, 7     not a POI tag
+
+Usage:
+    python tests/make_pbf_fixture.py
+"""
+
+import struct
+import zlib
+from pathlib import Path
+
+FIXTURE = Path(__file__).parent / 'data' / 'cities.osm.pbf'
+
+
+def varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def field(number: int, value) -> bytes:
+    """Varint field for ints, length-delimited field for bytes."""
+    if isinstance(value, int):
+        return varint(number << 3) + varint(value)
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+
+def packed(values) -> bytes:
+    return b''.join(varint(v) for v in values)
+
+
+def deltas(values) -> list:
+    return [zigzag(b - a) for a, b in zip([0] + values[:-1], values)]
+
+
+STRINGS = ['', 'amenity', 'cafe', 'restaurant', 'shop', 'bakery', 'name', 'Cafe One', 'highway', 'residential']
+S = {s: i for i, s in enumerate(STRINGS)}
+
+# id, lat, lon, tags
+DENSE_NODES = [
+    (1, 50.05, 30.05, {'amenity': 'cafe', 'name': 'Cafe One'}),
+    (2, 50.30, 30.30, {'amenity': 'restaurant'}),
+    (3, 50.17, 30.17, {'amenity': 'cafe'}),
+    (4, 51.00, 31.00, {'amenity': 'cafe'}),
+    (5, 50.01, 30.01, {}),
+    (6, 50.03, 30.03, {}),
+    (7, 50.10, 30.10, {}),
+    (8, 50.30, 30.30, {}),
+    (9, 50.06, 30.06, {'shop': 'bakery'}),
+]
+PLAIN_NODE = (10, 50.25, 30.25, {'amenity': 'restaurant'})
+WAYS = [
+    (100, [5, 6], {'amenity': 'restaurant'}),
+    (101, [7, 8], {'amenity': 'cafe'}),
+    (102, [5, 7], {'highway': 'residential'}),
+]
+
+
+def coord(degrees: float) -> int:
+    """Degrees in units of the default granularity (100 nanodegrees)."""
+    return round(degrees * 1e7)
+
+
+def string_table() -> bytes:
+    return b''.join(field(1, s.encode('utf-8')) for s in STRINGS)
+
+
+def block(groups: list) -> bytes:
+    return field(1, string_table()) + b''.join(field(2, group) for group in groups)
+
+
+def node_block() -> bytes:
+    keys_vals = []
+    for _, _, _, tags in DENSE_NODES:
+        for key, value in tags.items():
+            keys_vals += [S[key], S[value]]
+        keys_vals.append(0)
+    dense = (field(1, packed(deltas([n[0] for n in DENSE_NODES])))
+             + field(8, packed(deltas([coord(n[1]) for n in DENSE_NODES])))
+             + field(9, packed(deltas([coord(n[2]) for n in DENSE_NODES])))
+             + field(10, packed(keys_vals)))
+
+    node_id, lat, lon, tags = PLAIN_NODE
+    node = (field(1, zigzag(node_id))
+            + field(2, packed(S[k] for k in tags))
+            + field(3, packed(S[v] for v in tags.values()))
+            + field(8, zigzag(coord(lat)))
+            + field(9, zigzag(coord(lon))))
+    return block([field(2, dense), field(1, node)])
+
+
+def way_block() -> bytes:
+    ways = b''
+    for way_id, refs, tags in WAYS:
+        ways += field(3, field(1, way_id)
+                      + field(2, packed(S[k] for k in tags))
+                      + field(3, packed(S[v] for v in tags.values()))
+                      + field(8, packed(deltas(refs))))
+    return block([ways])
+
+
+def file_block(blob_type: str, blob: bytes) -> bytes:
+    header = field(1, blob_type.encode('utf-8')) + field(3, len(blob))
+    return struct.pack('>I', len(header)) + header + blob
+
+
+def main():
+    osm_header = field(4, b'OsmSchema-V0.6') + field(4, b'DenseNodes')
+    ways = way_block()
+    data = (file_block('OSMHeader', field(1, osm_header))
+            + file_block('OSMData', field(1, node_block()))
+            + file_block('OSMData', field(2, len(ways)) + field(3, zlib.compress(ways))))
+    FIXTURE.parent.mkdir(parents=True, exist_ok=True)
+    FIXTURE.write_bytes(data)
+    print(f"Wrote {FIXTURE} ({len(data)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
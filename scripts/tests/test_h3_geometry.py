@@ -0,0 +1,20 @@
+"""GeometryCache lookups against h3, including pentagons and cells with more than 6 vertices."""
+
+import h3.api.basic_int as h3_int
+
+from h3_geometry import GeometryCache
+
+
+def test_centers_and_boundaries(tmp_path):
+    # Center children of the base cells include pentagons and cells crossing icosahedron edges
+    cells = [h3_int.cell_to_center_child(base, resolution)
+             for resolution in (6, 7, 8, 9) for base in h3_int.get_res0_cells()]
+    expected = [[list(vertex) for vertex in h3_int.cell_to_boundary(cell)] for cell in cells]
+    assert {len(boundary) for boundary in expected} > {5, 6}
+
+    cache = GeometryCache(tmp_path)
+    assert cache.boundaries(cells) == expected
+    assert cache.centers(cells).tolist() == [list(h3_int.cell_to_latlng(cell)) for cell in cells]
+
+    # A fresh cache reads the same geometry back from the tables
+    assert GeometryCache(tmp_path).boundaries(cells) == expected
@@ -0,0 +1,81 @@
+"""encode_heatmap() / decode_heatmap() round trips of the plain and packed encodings."""
+
+import h3
+import numpy as np
+import pytest
+
+from heatmap_binary import decode_heatmap, encode_heatmap, to_output
+
+TYPES = ['bar', 'cafe', 'gym', 'restaurant']
+
+
+def make_output(quantiles: bool) -> dict:
+    """A resolution 8 heatmap in the JSON form, with fractional intensities as the aggregation writes them."""
+    rng = np.random.default_rng(8)
+    cells = sorted(h3.grid_disk(h3.latlng_to_cell(50.45, 30.52, 8), 3), reverse=True)
+    hexagons = []
+    for cell in cells:
+        lat, lng = h3.cell_to_latlng(cell)
+        hexagon = {
+            'lat': round(lat, 5),
+            'lng': round(lng, 5),
+            'n': int(rng.integers(1, 500)),
+            't': [name for name in TYPES if rng.random() < 0.5],
+            'i': np.round(rng.uniform(0, 100, (7, 24)), 1).tolist(),
+        }
+        if quantiles:
+            hexagon['m'] = np.round(rng.uniform(0, 100, (7, 24)), 1).tolist()
+            hexagon['p'] = np.round(rng.uniform(0, 100, (7, 24)), 1).tolist()
+        hexagons.append(hexagon)
+    return {'meta': {'city': 'kyiv', 'resolution': 8, 'hex_count': len(hexagons)}, 'hexagons': hexagons}
+
+
+def rounded(output: dict) -> dict:
+    """The output as it comes back from the binary form: hour values rounded to integers."""
+    hexagons = [{key: np.rint(value).astype(int).tolist() if key in ('i', 'm', 'p') else value
+                 for key, value in hexagon.items()} for hexagon in output['hexagons']]
+    return {'meta': output['meta'], 'hexagons': hexagons}
+
+
+def by_center(hexagons: list) -> list:
+    return sorted(hexagons, key=lambda hexagon: (hexagon['lat'], hexagon['lng']))
+
+
+@pytest.mark.parametrize('quantiles', [False, True], ids=['mean', 'quantiles'])
+def test_plain_round_trip(quantiles):
+    output = make_output(quantiles)
+    header, columns = decode_heatmap(encode_heatmap(output))
+    assert header['encoding'] == 'plain'
+    assert ('median' in columns) == ('p90' in columns) == quantiles
+    assert to_output(header, columns) == rounded(output)
+
+
+@pytest.mark.parametrize('quantiles', [False, True], ids=['mean', 'quantiles'])
+def test_packed_round_trip(quantiles):
+    output = make_output(quantiles)
+    packed = encode_heatmap(output, packed=True)
+    header, columns = decode_heatmap(packed)
+    assert header['encoding'] == 'packed'
+    assert ('median' in columns) == ('p90' in columns) == quantiles
+
+    decoded = to_output(header, columns)
+    assert decoded['meta'] == output['meta']
+    assert by_center(decoded['hexagons']) == by_center(rounded(output)['hexagons'])
+
+    # Rows come back in H3 order
+    cells = [h3.str_to_int(h3.latlng_to_cell(hexagon['lat'], hexagon['lng'], 8)) for hexagon in decoded['hexagons']]
+    assert cells == sorted(cells)
+
+    # A compact city's center deltas fit int16, so the packed form is smaller than the plain one
+    center = next(column for column in header['columns'] if column['name'] == 'center')
+    assert center['dtype'] == '<i2'
+    plain = encode_heatmap(output)
+    assert len(packed) < len(plain)
+
+
+def test_geometry_only():
+    output = make_output(quantiles=True)
+    header, columns = decode_heatmap(encode_heatmap(output, hours=False))
+    assert set(columns) == {'center', 'count', 'types'}
+    expected = [{key: hexagon[key] for key in ('lat', 'lng', 'n', 't')} for hexagon in output['hexagons']]
+    assert to_output(header, columns)['hexagons'] == expected
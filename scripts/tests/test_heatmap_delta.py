@@ -0,0 +1,67 @@
+"""refresh_city_delta() against a full rebuild of every pyramid level."""
+
+import json
+
+import numpy as np
+import pytest
+
+import generate_all_heatmaps
+import heatmap_delta
+from generate_all_heatmaps import (PYRAMID_ZOOMS, build_pyramid, create_optimized_json, pyramid_file,
+                                   refresh_city_delta)
+
+CITY = 'kyiv'
+TYPES = ['bar', 'cafe', 'gym', 'restaurant']
+
+
+def make_pois(count: int, seed: int, start: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    return [{'osm_id': f'node/{start + k}', 'name': f'POI {start + k}', 'poi_type': TYPES[rng.integers(len(TYPES))],
+             'lat': 50.35 + rng.random() * 0.2, 'lng': 30.4 + rng.random() * 0.25}
+            for k in range(count)]
+
+
+def full_build(pois: list) -> dict:
+    """{resolution: output} of a full rebuild, as read back from JSON."""
+    levels = build_pyramid(pois, CITY)
+    return {resolution: json.loads(json.dumps(create_optimized_json(aggregate, CITY, resolution)))
+            for resolution, aggregate in levels.items()}
+
+
+def by_center(hexagons: list) -> list:
+    return sorted(hexagons, key=lambda hexagon: (hexagon['lat'], hexagon['lng']))
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    """POIs of a previous run, with their snapshot and pyramid level files in tmp_path."""
+    monkeypatch.setattr(generate_all_heatmaps, 'PUBLIC_DIR', tmp_path)
+    monkeypatch.setattr(heatmap_delta, 'SNAPSHOT_DIR', tmp_path / 'snapshots')
+    pois = make_pois(2000, seed=8)
+    for resolution, output in full_build(pois).items():
+        with open(pyramid_file(CITY, resolution), 'w', encoding='utf-8') as f:
+            json.dump(output, f)
+    heatmap_delta.save_snapshot(CITY, pois)
+    return pois
+
+
+def test_delta_matches_full_rebuild(snapshot):
+    pois = [dict(poi) for poi in snapshot[10:]]          # 10 removed
+    for poi in pois[:5]:
+        poi['lat'] += 0.02                               # 5 moved
+    pois[5]['poi_type'] = 'gym' if pois[5]['poi_type'] != 'gym' else 'bar'  # 1 retyped
+    pois += make_pois(10, seed=9, start=100_000)         # 10 added
+
+    patched = refresh_city_delta(CITY, pois)
+    assert patched is not None
+    expected = full_build(pois)
+    assert set(patched) == set(PYRAMID_ZOOMS)
+    for resolution in PYRAMID_ZOOMS:
+        assert patched[resolution]['meta']['hex_count'] == expected[resolution]['meta']['hex_count']
+        assert by_center(patched[resolution]['hexagons']) == by_center(expected[resolution]['hexagons'])
+
+
+def test_too_many_changes_fall_back_to_full_rebuild(snapshot):
+    changed = int(len(snapshot) * heatmap_delta.MAX_CHANGED_FRACTION) + 1
+    pois = snapshot[changed:]
+    assert refresh_city_delta(CITY, pois) is None
@@ -0,0 +1,47 @@
+"""aggregate_dense() on several worker processes against the single-process path."""
+
+import numpy as np
+import pytest
+
+import hex_aggregate
+from aggregate_h3_heatmap import aggregate_dense
+
+TYPES = ['bar', 'cafe', 'gym', 'restaurant', 'unknown_type']
+
+
+@pytest.fixture
+def pois():
+    rng = np.random.default_rng(19)
+    result = []
+    for k in range(6000):
+        poi = {'osm_id': f'node/{k}', 'name': '', 'poi_type': TYPES[rng.integers(len(TYPES))],
+               'lat': 50.35 + rng.random() * 0.2, 'lng': 30.4 + rng.random() * 0.25}
+        if k % 3 == 0:
+            # Scraped values for some POIs, partly with missing days
+            poi['populartimes'] = [{'name': str(day), 'data': rng.integers(0, 101, 24).tolist()}
+                                   for day in range(int(rng.integers(5, 8)))]
+        result.append(poi)
+    return result
+
+
+def test_parallel_matches_serial(pois, monkeypatch):
+    monkeypatch.setattr(hex_aggregate, 'PARALLEL_MIN_POIS', 0)
+    shard_counts = []
+    shard_bounds = hex_aggregate.shard_bounds
+
+    def counting_bounds(*args):
+        cuts = shard_bounds(*args)
+        shard_counts.append(len(cuts) - 1)
+        return cuts
+
+    monkeypatch.setattr(hex_aggregate, 'shard_bounds', counting_bounds)
+
+    serial = aggregate_dense(pois, workers=1, quantiles=True)
+    assert not shard_counts
+    parallel = aggregate_dense(pois, workers=4, quantiles=True)
+    assert shard_counts and shard_counts[0] > 1
+
+    assert parallel.types == serial.types
+    np.testing.assert_array_equal(parallel.cells, serial.cells)
+    for field in ('type_count', 'sums', 'counts', 'hist'):
+        np.testing.assert_array_equal(getattr(parallel, field), getattr(serial, field), err_msg=field)
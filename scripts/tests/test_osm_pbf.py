@@ -0,0 +1,62 @@
+"""extract_pois() on a tiny hand-built extract (see make_pbf_fixture.py)."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from osm_pbf import decode_packed, extract_pois, read_varint, zigzag
+from overpass import compile_tag_index
+
+FIXTURE = Path(__file__).parent / 'data' / 'cities.osm.pbf'
+
+TAG_INDEX = compile_tag_index({
+    'restaurant': ['amenity=restaurant'],
+    'cafe': ['amenity=cafe'],
+})
+
+BBOXES = {
+    'a': (50.0, 30.0, 50.2, 30.2),
+    'b': (50.15, 30.15, 50.4, 30.4),
+}
+
+
+@pytest.fixture(scope='module')
+def pois():
+    result = extract_pois(FIXTURE, TAG_INDEX, BBOXES, workers=1)
+    return {city: {poi['osm_id']: poi for poi in city_pois} for city, city_pois in result.items()}
+
+
+def test_varints():
+    encoded = bytes([0x96, 0x01, 0x00, 0xff, 0xff, 0x03])
+    assert read_varint(encoded, 0) == (150, 2)
+    assert decode_packed(encoded).tolist() == [150, 0, 65535]
+    assert zigzag(np.array([0, 1, 2, 3], dtype=np.uint64)).tolist() == [0, -1, 1, -2]
+
+
+def test_nodes(pois):
+    cafe = pois['a']['node/1']
+    assert cafe['poi_type'] == 'cafe'
+    assert cafe['name'] == 'Cafe One'
+    assert (cafe['lat'], cafe['lng']) == (50.05, 30.05)
+
+    assert pois['b']['node/2']['poi_type'] == 'restaurant'
+    # Plain (non-dense) Node
+    assert pois['b']['node/10']['poi_type'] == 'restaurant'
+    assert (pois['b']['node/10']['lat'], pois['b']['node/10']['lng']) == (50.25, 30.25)
+
+
+def test_way_centers(pois):
+    way = pois['a']['way/100']
+    assert way['poi_type'] == 'restaurant'
+    assert way['lat'] == pytest.approx(50.02)
+    assert way['lng'] == pytest.approx(30.02)
+
+
+def test_city_assignment(pois):
+    assert set(pois['a']) == {'node/1', 'node/3', 'way/100', 'way/101'}
+    assert set(pois['b']) == {'node/2', 'node/3', 'node/10', 'way/101'}
+
+    # A way touching both cities goes to both with the same center
+    assert pois['a']['way/101']['lat'] == pytest.approx(50.2)
+    assert pois['a']['way/101'] == pois['b']['way/101']
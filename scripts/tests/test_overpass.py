@@ -0,0 +1,17 @@
+"""classify_tags() against the rank order of compile_tag_index()."""
+
+from overpass import classify_tags, compile_tag_index
+
+
+def test_lowest_rank_wins():
+    index = compile_tag_index({
+        'shop': ['shop=*'],
+        'cafe': ['amenity=cafe', 'shop=coffee'],
+        'food': ['amenity=*'],
+    })
+    assert classify_tags({'amenity': 'cafe'}, index) == 'cafe'
+    assert classify_tags({'amenity': 'bar'}, index) == 'food'
+    # The wildcard of a key outranks a later exact value of the same key
+    assert classify_tags({'shop': 'coffee'}, index) == 'shop'
+    assert classify_tags({'amenity': 'cafe', 'shop': 'bakery'}, index) == 'shop'
+    assert classify_tags({'name': 'Nothing'}, index) is None
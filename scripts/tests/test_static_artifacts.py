@@ -0,0 +1,28 @@
+"""publish_directory(): content-hashed, precompressed and pruned directories."""
+
+import gzip
+import os
+
+from static_artifacts import KEEP_VERSIONS, publish_directory
+
+
+def test_publish_directory(tmp_path):
+    base = tmp_path / 'heatmap_kyiv_slices'
+    versions = []
+    for version in range(KEEP_VERSIONS + 2):
+        files = {'geometry.bin': b'geometry', 'd0h0.bin': bytes([version]) * 64}
+        hashed = publish_directory(base, files)
+        os.utime(hashed, (version, version))  # distinct mtimes, oldest first
+        versions.append(hashed)
+
+        assert hashed.name.startswith('heatmap_kyiv_slices.')
+        for name, data in files.items():
+            assert (hashed / name).read_bytes() == data
+            assert gzip.decompress((hashed / f'{name}.gz').read_bytes()) == data
+
+    assert len(set(versions)) == len(versions)
+    assert publish_directory(base, {'geometry.bin': b'geometry', 'd0h0.bin': bytes([1]) * 64}) == versions[1]
+
+    # Republishing an old version makes it the newest; no temporary directories are left behind
+    kept = sorted(path.name for path in tmp_path.iterdir())
+    assert kept == sorted(path.name for path in (versions[1], versions[-1]))
@@ -2,6 +2,7 @@ import { useEffect, useState, useMemo } from 'react';
 import { useMap } from 'react-leaflet';
 import L from 'leaflet';
 import 'leaflet.heat';
+import { decodeHeatmap, fetchSlice } from '../utils/heatmapBinary';
 
 /**
  * HeatmapInstructionModal - Modal with heatmap methodology explanation
@@ -165,6 +166,49 @@ export function HeatmapInstructionModal({ isOpen, onClose }) {
 // All available cities for 'all' option
 const ALL_CITIES = ['kyiv', 'odesa', 'lviv', 'vinnytsia', 'ternopil', 'bila_tserkva', 'boryspil'];
 
+// Load the cities index, the only mutable entry point: it names the content-hashed city
+// files and manifests, so it is revalidated on every load; null if it is missing
+const loadCitiesIndex = () =>
+  fetch('/heatmap_cities.json', { cache: 'no-cache' })
+    .then(r => (r.ok ? r.json() : null))
+    .catch(() => null);
+
+// Load a city's pyramid manifest (H3 levels by zoom range); null if the city has none
+const loadManifest = (c, index) =>
+  fetch(`/${index?.cities?.[c]?.pyramid || `heatmap_${c}_pyramid.json`}`)
+    .then(r => (r.ok ? r.json() : null))
+    .catch(() => null);
+
+// File to show a city at `zoom`: the pyramid level covering it (time slices or binary if
+// written, slice directories end in '/'), else the single-resolution file
+const levelFile = (c, manifest, zoom, index) => {
+  const level = manifest?.levels?.find(l => zoom >= l.min_zoom && zoom <= l.max_zoom);
+  if (!level) return index?.cities?.[c]?.file || `heatmap_${c}.json`;
+  return level.slices ? `${level.slices}/` : (level.binary || level.file);
+};
+
+// Fetch a heatmap file; binary (.bin) files decode to the same { meta, hexagons } shape as JSON,
+// slice directories to their geometry (hexagons without `i`) plus `slices`, the directory name
+const fetchHeatmap = (file) => {
+  const dir = file.endsWith('/') ? file.slice(0, -1) : null;
+  return fetch(dir ? `/${dir}/geometry.bin` : `/${file}`).then(r => {
+    if (!r.ok) throw new Error(`HTTP ${r.status}`);
+    if (dir) return r.arrayBuffer().then(buffer => ({ ...decodeHeatmap(buffer), slices: dir }));
+    return file.endsWith('.bin') ? r.arrayBuffer().then(decodeHeatmap) : r.json();
+  });
+};
+
+// Time-sliced parts of the loaded hexagons: slice directory and its row range
+const slicedParts = (heatmaps) => {
+  const parts = [];
+  let start = 0;
+  heatmaps.forEach(heatmap => {
+    if (heatmap.slices) parts.push({ dir: heatmap.slices, start, count: heatmap.hexagons.length });
+    start += heatmap.hexagons.length;
+  });
+  return parts;
+};
+
 export default function HeatmapLayer({
   visible = false,
   city = 'all',
@@ -179,37 +223,69 @@ export default function HeatmapLayer({
   const [heatLayer, setHeatLayer] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [zoom, setZoom] = useState(() => map.getZoom());
+  const [manifests, setManifests] = useState(null);
+  const [citiesIndex, setCitiesIndex] = useState(null);
+  const [slice, setSlice] = useState(null);
+
+  // Track the zoom level to pick the matching H3 resolution
+  useEffect(() => {
+    const onZoom = () => setZoom(map.getZoom());
+    map.on('zoomend', onZoom);
+    return () => map.off('zoomend', onZoom);
+  }, [map]);
+
+  // Load pyramid manifests when city changes
+  useEffect(() => {
+    if (!visible) return;
+
+    let cancelled = false;
+    const cities = city === 'all' ? ALL_CITIES : [city];
+    setManifests(null);
+    loadCitiesIndex().then(index =>
+      Promise.all(cities.map(c => loadManifest(c, index))).then(list => {
+        if (!cancelled) {
+          setCitiesIndex(index);
+          setManifests(Object.fromEntries(cities.map((c, idx) => [c, list[idx]])));
+        }
+      })
+    );
+    return () => { cancelled = true; };
+  }, [city, visible]);
+
+  // Files for the current zoom (only changes when the zoom crosses a level boundary)
+  const files = useMemo(() => {
+    if (!manifests) return null;
+    return Object.entries(manifests).map(([c, manifest]) => levelFile(c, manifest, zoom, citiesIndex)).join(',');
+  }, [manifests, citiesIndex, zoom]);
 
-  // Load data when city changes
+  // Load data when city or pyramid level changes
   useEffect(() => {
     const loadData = async () => {
       setLoading(true);
       setError(null);
 
       try {
+        const fileList = files.split(',');
         if (city === 'all') {
           // Load all cities and merge hexagons
-          const allHexagons = [];
+          const loaded = [];
           const results = await Promise.allSettled(
-            ALL_CITIES.map(c => fetch(`/heatmap_${c}.json`).then(r => r.json()))
+            fileList.map(fetchHeatmap)
           );
 
           results.forEach((result, idx) => {
             if (result.status === 'fulfilled' && result.value?.hexagons) {
-              allHexagons.push(...result.value.hexagons);
+              loaded.push(result.value);
             } else {
               console.warn(`Failed to load ${ALL_CITIES[idx]}`);
             }
           });
 
-          setData({ hexagons: allHexagons });
+          setData({ hexagons: loaded.flatMap(h => h.hexagons), sliced: slicedParts(loaded) });
         } else {
-          const response = await fetch(`/heatmap_${city}.json`);
-          if (!response.ok) {
-            throw new Error(`HTTP ${response.status}`);
-          }
-          const json = await response.json();
-          setData(json);
+          const heatmap = await fetchHeatmap(fileList[0]);
+          setData({ ...heatmap, sliced: slicedParts([heatmap]) });
         }
       } catch (err) {
         console.error(`Failed to load heatmap data for ${city}:`, err);
@@ -219,24 +295,43 @@ export default function HeatmapLayer({
       }
     };
 
-    if (visible) {
+    if (visible && files) {
       loadData();
     }
-  }, [city, visible]);
+  }, [files, visible]);
+
+  // Fetch the current day/hour of time-sliced heatmaps (one small file per city)
+  useEffect(() => {
+    if (!data?.sliced?.length) {
+      setSlice(null);
+      return;
+    }
+
+    let cancelled = false;
+    Promise.all(data.sliced.map(part => fetchSlice(part.dir, day, hour)))
+      .then(parts => {
+        if (cancelled) return;
+        const values = new Uint8Array(data.hexagons.length);
+        parts.forEach((part, idx) => values.set(part.subarray(0, data.sliced[idx].count), data.sliced[idx].start));
+        setSlice(values);
+      })
+      .catch(err => console.error(`Failed to load heatmap slice ${day}/${hour}:`, err));
+    return () => { cancelled = true; };
+  }, [data, day, hour]);
 
   // Compute heatmap points for current day/hour
   const heatPoints = useMemo(() => {
     if (!data || !data.hexagons) return [];
 
-    return data.hexagons.map(hex => {
-      // hex.i is [7 days][24 hours]
-      const intensity = hex.i[day]?.[hour] || 0;
+    return data.hexagons.map((hex, idx) => {
+      // hex.i is [7 days][24 hours]; time-sliced hexagons take the current slice
+      const intensity = (hex.i ? hex.i[day]?.[hour] : slice?.[idx]) || 0;
 
       // Return [lat, lng, intensity]
       // Normalize intensity (0-100) to (0-1) range
       return [hex.lat, hex.lng, intensity / 100];
     });
-  }, [data, day, hour]);
+  }, [data, day, hour, slice]);
 
   // Create/update heat layer
   useEffect(() => {
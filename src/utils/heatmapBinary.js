@@ -0,0 +1,93 @@
+// Decoder for the binary columnar heatmap format (scripts/heatmap_binary.py)
+
+const MAGIC = 'HXMB';
+const VERSION = 1;
+const PREFIX_SIZE = 16;
+
+const TYPED_ARRAYS = {
+  '|u1': Uint8Array,
+  '<u2': Uint16Array,
+  '<u4': Uint32Array,
+  '<u8': BigUint64Array,
+  '<i2': Int16Array,
+  '<i4': Int32Array,
+};
+
+const HOUR_COLUMNS = ['intensity', 'median', 'p90'];
+
+// Undo the packed encoding: prefix sums over the center rows (starting at the header's
+// center_origin) and over each hexagon's 168 hours
+function unpackColumns(columns, origin = [0, 0]) {
+  const { center } = columns;
+  const unpacked = new Int32Array(center.length);
+  for (let k = 0; k < center.length; k++) {
+    unpacked[k] = (k >= 2 ? unpacked[k - 2] : origin[k]) + center[k];
+  }
+  columns.center = unpacked;
+
+  for (const name of HOUR_COLUMNS) {
+    const deltas = columns[name];
+    if (!deltas) continue;
+    const values = new Uint8Array(deltas.length);  // uint8 stores wrap modulo 256
+    for (let k = 0; k < deltas.length; k++) {
+      values[k] = (k % 168 ? values[k - 1] : 0) + deltas[k];
+    }
+    columns[name] = values;
+  }
+}
+
+// Parse the header and wrap every column in a typed array view (no copies, except packed columns)
+export function decodeHeatmapColumns(buffer) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== MAGIC) throw new Error('Not a binary heatmap');
+  if (view.getUint16(4, true) !== VERSION) throw new Error('Unsupported binary heatmap version');
+
+  const headerSize = view.getUint32(12, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, PREFIX_SIZE, headerSize)));
+
+  const columns = {};
+  for (const column of header.columns) {
+    const TypedArray = TYPED_ARRAYS[column.dtype];
+    if (!TypedArray) throw new Error(`Unsupported column dtype ${column.dtype}`);
+    const length = column.shape.reduce((a, b) => a * b, 1);
+    columns[column.name] = new TypedArray(buffer, column.offset, length);
+  }
+  if (header.encoding === 'packed') unpackColumns(columns, header.center_origin);
+  return { header, columns };
+}
+
+// Same shape as the JSON heatmaps ({ meta, hexagons: [{ lat, lng, n, i }] }),
+// with every hex.i[day] a 24-value view into the intensity column
+// (no `i` for the geometry file of a time-sliced heatmap)
+export function decodeHeatmap(buffer) {
+  const { header, columns } = decodeHeatmapColumns(buffer);
+  const { center, count, intensity } = columns;
+  const scale = header.coord_scale;
+
+  const hexagons = new Array(count.length);
+  for (let row = 0; row < count.length; row++) {
+    hexagons[row] = {
+      lat: center[row * 2] / scale,
+      lng: center[row * 2 + 1] / scale,
+      n: count[row],
+    };
+    if (intensity) {
+      const days = new Array(7);
+      for (let day = 0; day < 7; day++) {
+        const start = (row * 7 + day) * 24;
+        days[day] = intensity.subarray(start, start + 24);
+      }
+      hexagons[row].i = days;
+    }
+  }
+  return { meta: header.meta, hexagons };
+}
+
+// Fetch the uint8 intensities of one (day, hour) of a time-sliced heatmap directory
+export function fetchSlice(dir, day, hour) {
+  return fetch(`/${dir}/d${day}h${hour}.bin`).then(r => {
+    if (!r.ok) throw new Error(`HTTP ${r.status}`);
+    return r.arrayBuffer().then(buffer => new Uint8Array(buffer));
+  });
+}